@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 import os
 import openai 
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 
 # 👉 Load from the custom file name
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -23,16 +24,14 @@ DEBUG = True
 # Load environment variables
 load_dotenv(dotenv_path=os.path.join(BASE_DIR, 'apis.env'))
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-# Debug logging for API key
-if DEBUG:
-    if OPENAI_API_KEY:
-        print("✅ OpenAI API Key is loaded successfully")
-        print(f"API Key starts with: {OPENAI_API_KEY[:8]}...")
-    else:
-        print("❌ OpenAI API Key is not loaded!")
-        print(f"Looking for API key in: {os.path.join(BASE_DIR, 'apis.env')}")
-        print("Please check if apis.env file exists and contains OPENAI_API_KEY")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+# Point at `python manage.py openai_stub_server` for local load testing
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 60))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", 5))
+# Pooled keep-alive connections and in-flight async calls per process
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 20))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 20))
 
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = 'hf4g-ko5$c-8b8b^1()yahonjw9j93_4n)_-jw$@qs+h%za)4o'
@@ -57,6 +56,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its latency covers the rest of the stack
+    'quizzes.metrics.MetricsMiddleware',
+    # Removes itself unless QUIZ_PROFILING['ENABLED']
+    'quizzes.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -86,18 +89,115 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'quizz_project.wsgi.application'
+ASGI_APPLICATION = 'quizz_project.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# Connection settings of the opt-in SQLite profile (SQLITE_TUNING=1)
+SQLITE_TUNING_PRAGMAS = [
+    'journal_mode=WAL',
+    'synchronous=NORMAL',
+    f"busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))}",
+    f"mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}",
+    # Negative values are KiB
+    f"cache_size=-{int(os.getenv('SQLITE_CACHE_SIZE_KB', 64 * 1024))}",
+    'temp_store=MEMORY',
+]
+
+# DB_ENGINE=postgres switches to PostgreSQL; SQLite remains the default for
+# development
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'quizz'),
+            'USER': os.getenv('POSTGRES_USER', 'quizz'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.getenv('POSTGRES_POOL', '1') == '1':
+        # psycopg connection pool per worker process; Django requires
+        # CONN_MAX_AGE = 0 with it
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('POSTGRES_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('POSTGRES_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.getenv('POSTGRES_POOL_TIMEOUT', 10)),
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = int(
+            os.getenv('CONN_MAX_AGE', 60)
+        )
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv(
+                'SQLITE_PATH', os.path.join(BASE_DIR, 'db.sqlite3')
+            ),
+        }
     }
+    if os.getenv('SQLITE_TUNING', '0') == '1':
+        # WAL lets readers run alongside a writer; IMMEDIATE takes the write
+        # lock up front so concurrent writers queue on busy_timeout instead of
+        # failing on upgrade. Run `python manage.py sqlite_maintenance`
+        # periodically to checkpoint the WAL.
+        DATABASES['default']['OPTIONS'] = {
+            'init_command': '; '.join(
+                f'PRAGMA {pragma}' for pragma in SQLITE_TUNING_PRAGMAS
+            ),
+            'transaction_mode': 'IMMEDIATE',
+        }
+
+
+# Password hashing cost and the pool the login/registration views hash on
+# (see quizzes/hashers.py and quizzes/hashing_pool.py). HASHER is pbkdf2 or
+# argon2 (requires `pip install argon2-cffi`); stored hashes using the other
+# algorithm or an older cost are upgraded on the next successful login.
+PASSWORD_HASHING = {
+    'HASHER': os.getenv('PASSWORD_HASHER', 'pbkdf2'),
+    'PBKDF2_ITERATIONS': (
+        int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', 0)) or None
+    ),
+    'ARGON2_TIME_COST': int(os.getenv('PASSWORD_ARGON2_TIME_COST', 0)) or None,
+    'ARGON2_MEMORY_COST': (
+        int(os.getenv('PASSWORD_ARGON2_MEMORY_COST', 0)) or None
+    ),
+    'ARGON2_PARALLELISM': (
+        int(os.getenv('PASSWORD_ARGON2_PARALLELISM', 0)) or None
+    ),
+    'WORKERS': int(os.getenv('PASSWORD_HASHING_WORKERS', 0)) or None,
+    'MAX_QUEUE': int(os.getenv('PASSWORD_HASHING_MAX_QUEUE', 32)),
+    'QUEUE_TIMEOUT': float(os.getenv('PASSWORD_HASHING_QUEUE_TIMEOUT', 0.5)),
+    'RETRY_AFTER': 1,
 }
 
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'quizzes.hashers.ConfigurablePBKDF2PasswordHasher',
+    'argon2': 'quizzes.hashers.ConfigurableArgon2PasswordHasher',
+}
+if PASSWORD_HASHING['HASHER'] not in _PASSWORD_HASHERS:
+    raise ImproperlyConfigured(
+        f"PASSWORD_HASHER must be one of {', '.join(_PASSWORD_HASHERS)}, "
+        f"not {PASSWORD_HASHING['HASHER']!r}"
+    )
+PASSWORD_HASHERS = [
+    _PASSWORD_HASHERS[PASSWORD_HASHING['HASHER']],
+    *[
+        path
+        for name, path in _PASSWORD_HASHERS.items()
+        if name != PASSWORD_HASHING['HASHER']
+    ],
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -148,6 +248,170 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'quizzes.authentication.CachedTokenAuthentication',
+    ],
+}
+
+# Generated question sets cache (see quizzes/question_cache.py)
+# BACKEND is one of: memory, django, sqlite, none
+QUIZ_QUESTION_CACHE = {
+    'BACKEND': os.getenv('QUIZ_CACHE_BACKEND', 'memory'),
+    'TIMEOUT': int(os.getenv('QUIZ_CACHE_TIMEOUT', 60 * 60 * 24)),
+    'MAX_ENTRIES': int(os.getenv('QUIZ_CACHE_MAX_ENTRIES', 1000)),
+    'LOCATION': os.getenv(
+        'QUIZ_CACHE_LOCATION', os.path.join(BASE_DIR, 'question_cache.sqlite3')
+    ),
+    'CACHE_ALIAS': 'default',
+}
+
+# Answer keys used to grade submissions (see quizzes/answer_keys.py)
+QUIZ_ANSWER_KEYS = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': int(os.getenv('QUIZ_ANSWER_KEY_TIMEOUT', 60 * 60 * 24)),
+    'LOCAL_TIMEOUT': int(os.getenv('QUIZ_ANSWER_KEY_LOCAL_TIMEOUT', 300)),
+    'MAX_ENTRIES': int(os.getenv('QUIZ_ANSWER_KEY_MAX_ENTRIES', 5000)),
+}
+
+# Token -> user lookups cached by
+# quizzes.authentication.CachedTokenAuthentication
+QUIZ_AUTH_TOKEN_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', 60 * 60)),
+    'LOCAL_TIMEOUT': int(os.getenv('AUTH_TOKEN_CACHE_LOCAL_TIMEOUT', 60)),
+    'MAX_ENTRIES': int(os.getenv('AUTH_TOKEN_CACHE_MAX_ENTRIES', 10000)),
+}
+
+# Rendered certificate files (see quizzes/certificates.py). CACHE_DIR defaults
+# to a directory under the system temp dir. With ACCEL_REDIRECT_PREFIX set,
+# nginx serves cached files from an internal location instead of Django.
+CERTIFICATES = {
+    'CACHE_DIR': os.getenv('CERTIFICATE_CACHE_DIR') or None,
+    'BACKGROUND': os.getenv('CERTIFICATE_BACKGROUND') or None,
+    'FONT': os.getenv('CERTIFICATE_FONT') or None,
+    'ACCEL_REDIRECT_PREFIX': (
+        os.getenv('CERTIFICATE_ACCEL_REDIRECT_PREFIX') or None
+    ),
+    'MAX_FILES': int(os.getenv('CERTIFICATE_CACHE_MAX_FILES', 10000)),
+}
+
+# Lock files used to coalesce identical generations across worker processes
+# (only with a shared cache backend: sqlite or django)
+SINGLE_FLIGHT_LOCK_DIR = os.getenv('SINGLE_FLIGHT_LOCK_DIR') or None
+# Seconds a request waits for an identical one before making its own call
+SINGLE_FLIGHT_TIMEOUT = float(
+    os.getenv('SINGLE_FLIGHT_TIMEOUT', 2 * OPENAI_TIMEOUT)
+)
+
+# Pre-generated question pool (see quizzes/question_pool.py)
+# Refilled in the background by `python manage.py refill_question_pool`
+QUESTION_POOL = {
+    'ENABLED': os.getenv('QUESTION_POOL_ENABLED', '1') == '1',
+    'SUBJECTS': [
+        s.strip()
+        for s in os.getenv('QUESTION_POOL_SUBJECTS', '').split(',')
+        if s.strip()
     ],
+    'TOP_SUBJECTS': int(os.getenv('QUESTION_POOL_TOP_SUBJECTS', 0)),
+    'LOW_WATERMARK': int(os.getenv('QUESTION_POOL_LOW_WATERMARK', 30)),
+    'HIGH_WATERMARK': int(os.getenv('QUESTION_POOL_HIGH_WATERMARK', 100)),
+    'BATCH_SIZE': int(os.getenv('QUESTION_POOL_BATCH_SIZE', 20)),
+    'MAX_SERVES': int(os.getenv('QUESTION_POOL_MAX_SERVES', 50)),
+}
+
+# Queued quiz generation (see quizzes/jobs.py)
+# Processed by `python manage.py run_generation_worker`
+GENERATION_JOBS = {
+    'MAX_ATTEMPTS': int(os.getenv('GENERATION_JOB_MAX_ATTEMPTS', 3)),
+    'RETRY_BACKOFF': float(os.getenv('GENERATION_JOB_RETRY_BACKOFF', 5)),
+    'RETRY_BACKOFF_MAX': float(
+        os.getenv('GENERATION_JOB_RETRY_BACKOFF_MAX', 300)
+    ),
+    'STALE_AFTER': int(os.getenv('GENERATION_JOB_STALE_AFTER', 600)),
+    'MAX_BATCH_ITEMS': int(os.getenv('GENERATION_BATCH_MAX_ITEMS', 500)),
+}
+
+# Answer grading (see quizzes/grading.py)
+QUIZ_GRADING = {
+    'ENGINE': os.getenv(
+        'QUIZ_GRADING_ENGINE', 'quizzes.grading.GradingEngine'
+    ),
+    'SIMILARITY_THRESHOLD': float(
+        os.getenv('QUIZ_GRADING_SIMILARITY_THRESHOLD', 0.9)
+    ),
+    'NUMERIC_REL_TOLERANCE': float(
+        os.getenv('QUIZ_GRADING_NUMERIC_REL_TOLERANCE', 0.01)
+    ),
+    'NUMERIC_ABS_TOLERANCE': float(
+        os.getenv('QUIZ_GRADING_NUMERIC_ABS_TOLERANCE', 1e-9)
+    ),
+}
+
+# Rate limit, retries and circuit breaker for OpenAI calls (see
+# quizzes/openai_guard.py). State is shared by every worker on the host through
+# STATE_FILE.
+OPENAI_RESILIENCE = {
+    'RATE_LIMIT': float(
+        os.getenv('OPENAI_RATE_LIMIT', 0)
+    ),  # calls/second, 0 = unlimited
+    'BURST': int(os.getenv('OPENAI_RATE_BURST', 10)),
+    'RATE_LIMIT_MAX_WAIT': float(os.getenv('OPENAI_RATE_LIMIT_MAX_WAIT', 10)),
+    'MAX_RETRIES': int(os.getenv('OPENAI_MAX_RETRIES', 2)),
+    'RETRY_BASE_DELAY': 0.5,
+    'RETRY_MAX_DELAY': 8,
+    'RETRY_BUDGET_RATIO': float(os.getenv('OPENAI_RETRY_BUDGET_RATIO', 0.1)),
+    'RETRY_BUDGET_MAX': 10,
+    'BREAKER_THRESHOLD': int(os.getenv('OPENAI_BREAKER_THRESHOLD', 5)),
+    'BREAKER_RESET_TIMEOUT': float(
+        os.getenv('OPENAI_BREAKER_RESET_TIMEOUT', 30)
+    ),
+    'STATE_FILE': os.getenv('OPENAI_GUARD_STATE_FILE') or None,
+}
+
+# Timing spans, request histograms and OpenAI usage counters (see
+# quizzes/metrics.py), served at /metrics. With TOKEN set, scrapers must send
+# `Authorization: Bearer <TOKEN>`.
+QUIZ_METRICS = {
+    'ENABLED': os.getenv('METRICS_ENABLED', '1') == '1',
+    'TOKEN': os.getenv('METRICS_TOKEN') or None,
+}
+
+# Per-request profiles (see quizzes/profiling.py), inspected with `python
+# manage.py profiles`. Requests are profiled when sampled or when they carry
+# HEADER with a token from `python manage.py profiles token`.
+QUIZ_PROFILING = {
+    'ENABLED': os.getenv('PROFILING_ENABLED', '0') == '1',
+    'SAMPLE_RATE': float(os.getenv('PROFILING_SAMPLE_RATE', 0)),
+    'HEADER': 'X-Debug-Profile',
+    'MAX_AGE': int(os.getenv('PROFILING_TOKEN_MAX_AGE', 60 * 60)),
+    'ENGINE': os.getenv('PROFILING_ENGINE', 'cprofile'),
+    'DIR': os.getenv('PROFILING_DIR') or None,
+    'MAX_PROFILES': int(os.getenv('PROFILING_MAX_PROFILES', 200)),
+    'STATS_LIMIT': 60,
+}
+
+# Application logs go to stderr; LOG_LEVEL=DEBUG includes raw model responses
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'structured': {
+            'format': (
+                'time=%(asctime)s level=%(levelname)s logger=%(name)s '
+                'pid=%(process)d msg="%(message)s"'
+            ),
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'structured',
+        },
+    },
+    'loggers': {
+        'quizzes': {
+            'handlers': ['console'],
+            'level': os.getenv('LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
 }
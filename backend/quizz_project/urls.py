@@ -17,10 +17,12 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework.authtoken import views as token_views
 from django.contrib.auth import views as auth_views
+from quizzes.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('quizzes.urls')),
     path('api-auth/', include('rest_framework.urls')),
     path('api-token-auth/', token_views.obtain_auth_token, name='api-token-auth'),
+    path('metrics', metrics_view, name='metrics'),
 ]
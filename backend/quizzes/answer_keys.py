@@ -0,0 +1,134 @@
+"""
+Cached answer keys for grading submissions.
+
+A quiz's answer key is the list of its question answers in question id
+order, the order the quiz is served in. Quizzes do not change once they are
+generated, so keys are cached in two tiers keyed by quiz id:
+
+    - an in-process LRU (short TTL, bounds staleness across workers)
+    - the Django cache alias in ``settings.QUIZ_ANSWER_KEYS['CACHE_ALIAS']``,
+      used only when that cache is shared between processes (not LocMem,
+      which is what Django uses without ``CACHES``); ``None`` disables this
+      tier
+
+Saving or deleting a question or quiz drops the key from both tiers (see
+``quizzes/signals.py``). ``bulk_create`` sends no signals, which is fine for
+``Quiz.objects.create_with_questions``: the quiz itself is saved first.
+"""
+import threading
+
+from django.conf import settings
+
+from .models import Question, Quiz
+from .question_cache import MemoryBackend, is_shared_cache
+
+DEFAULT_CONFIG = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 60 * 60 * 24,
+    'LOCAL_TIMEOUT': 300,
+    'MAX_ENTRIES': 5000,
+}
+
+
+def cache_key(quiz_id):
+    return f'quizkey:{quiz_id}'
+
+
+def load_answer_keys(quiz_ids):
+    """
+    Read answer keys from the database in one query.
+
+    Returns:
+        dict: quiz id -> list of answers; quizzes without questions are absent
+    """
+    keys = {}
+    answers = (
+        Question.objects.filter(quiz_id__in=quiz_ids)
+        .order_by('quiz_id', 'id')
+        .values_list('quiz_id', 'answer')
+    )
+    for quiz_id, answer in answers:
+        keys.setdefault(quiz_id, []).append(answer)
+    return keys
+
+
+class AnswerKeyCache:
+    """Two-tier cache of answer keys, falling back to the database."""
+
+    def __init__(self, config):
+        self.timeout = config['TIMEOUT']
+        self.local_timeout = config['LOCAL_TIMEOUT']
+        self.local = MemoryBackend(config['MAX_ENTRIES'])
+        self.shared = None
+        if config['CACHE_ALIAS']:
+            from django.core.cache import caches
+            cache = caches[config['CACHE_ALIAS']]
+            # A per-process "shared" tier would outlive invalidations made by
+            # other workers
+            if is_shared_cache(cache):
+                self.shared = cache
+
+    def get(self, quiz_id):
+        """
+        Return the answer key of a quiz.
+
+        Returns:
+            list or None: The answers in question order, None if the quiz does
+                not exist
+        """
+        key = cache_key(quiz_id)
+        answers = self.local.get(key)
+        if answers is not None:
+            return answers
+        if self.shared is not None:
+            answers = self.shared.get(key)
+        if answers is None:
+            answers = load_answer_keys([quiz_id]).get(quiz_id)
+            if answers is None:
+                # Quizzes being streamed have no questions yet; never cache
+                # those
+                return [] if Quiz.objects.filter(pk=quiz_id).exists() else None
+            if self.shared is not None:
+                self.shared.set(key, answers, self.timeout)
+        self.local.set(key, answers, self.local_timeout)
+        return answers
+
+    def invalidate(self, quiz_id):
+        key = cache_key(quiz_id)
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_key_cache():
+    """Return the process-wide answer key cache, building it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerKeyCache(
+                    dict(
+                        DEFAULT_CONFIG,
+                        **getattr(settings, 'QUIZ_ANSWER_KEYS', {}),
+                    )
+                )
+    return _cache
+
+
+def get_answer_key(quiz_id):
+    return get_answer_key_cache().get(quiz_id)
+
+
+def invalidate_answer_key(quiz_id):
+    get_answer_key_cache().invalidate(quiz_id)
+
+
+def reset_answer_key_cache():
+    """Drop the process-wide cache so the next call re-reads settings."""
+    global _cache
+    with _cache_lock:
+        _cache = None
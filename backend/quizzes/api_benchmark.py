@@ -0,0 +1,393 @@
+"""
+Query-count and latency benchmark for every endpoint in ``quizzes/urls.py``.
+
+``seed`` fills the database with synthetic users, quizzes and history,
+``run_benchmark`` drives each endpoint through the test client with the
+OpenAI clients replaced by in-process stubs, and ``compare`` checks the
+results against a stored baseline. The ``benchmark_api`` command wraps the
+whole run in a transaction that is rolled back, so the database is left
+untouched.
+"""
+import json
+import random
+import statistics
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .management.commands.openai_stub_server import build_completion
+from .metrics import get_metrics_config
+from .models import Quiz, UserQuizHistory
+from .openai_client import reset_clients
+from .question_cache import reset_question_cache
+from .single_flight import reset_single_flight
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+QUESTIONS_PER_QUIZ = 10
+
+
+class _StubCompletions:
+    def create(self, messages, stream=False, **kwargs):
+        completion = ChatCompletion.model_validate(
+            build_completion(QUESTIONS_PER_QUIZ, 'benchmarks')
+        )
+        if not stream:
+            return completion
+        content = completion.choices[0].message.content
+        return [
+            ChatCompletionChunk.model_validate(
+                {
+                    'id': completion.id,
+                    'object': 'chat.completion.chunk',
+                    'created': completion.created,
+                    'model': completion.model,
+                    'choices': [
+                        {
+                            'index': 0,
+                            'delta': {'content': content[i:i + 40]},
+                            'finish_reason': None,
+                        }
+                    ],
+                }
+            )
+            for i in range(0, len(content), 40)
+        ]
+
+
+class _AsyncStubCompletions(_StubCompletions):
+    async def create(self, messages, stream=False, **kwargs):
+        return super().create(messages, stream=stream, **kwargs)
+
+
+class _StubClient:
+    def __init__(self, completions):
+        self.chat = type('Chat', (), {'completions': completions})()
+
+
+def seed(users=100, quizzes=200, history=1000, batch_size=5000):
+    """
+    Create synthetic data and return the objects the endpoints are driven with.
+
+    The first user owns ``history`` attempts, so per-user listings see the
+    full scale, and is staff so the batch endpoint can be measured. The
+    second user's tokens are revoked by the logout endpoint. The remaining
+    users only exist to make tables realistic.
+
+    Returns:
+        dict: The benchmark user, their token and ids used in endpoint URLs
+    """
+    password = make_password(BENCHMARK_PASSWORD)
+    User.objects.bulk_create(
+        [
+            User(
+                username=f'bench{n}',
+                email=f'bench{n}@example.com',
+                password=password,
+            )
+            for n in range(users)
+        ],
+        batch_size=batch_size,
+    )
+    user = User.objects.get(username='bench0')
+    user.is_staff = True
+    user.save(update_fields=['is_staff'])
+    token = Token.objects.create(user=user)
+
+    quiz_objects = [
+        Quiz.objects.create_with_questions(
+            f'Benchmark subject {n}',
+            random.choice(['easy', 'medium', 'hard']),
+            [
+                {'text': f'Question {i}?', 'answer': f'Answer {i}'}
+                for i in range(QUESTIONS_PER_QUIZ)
+            ],
+        )
+        for n in range(quizzes)
+    ]
+
+    batch = []
+    for _ in range(history):
+        attempt = UserQuizHistory(user=user, quiz=random.choice(quiz_objects))
+        attempt.set_score(
+            random.randint(0, QUESTIONS_PER_QUIZ), QUESTIONS_PER_QUIZ
+        )
+        batch.append(attempt)
+        if len(batch) == batch_size:
+            UserQuizHistory.objects.bulk_create(batch)
+            batch = []
+    UserQuizHistory.objects.bulk_create(batch)
+
+    certificate = UserQuizHistory(user=user, quiz=quiz_objects[0])
+    certificate.set_score(QUESTIONS_PER_QUIZ, QUESTIONS_PER_QUIZ)
+    certificate.save()
+
+    return {
+        'user': user,
+        'token': token.key,
+        'logout_user': User.objects.get(username='bench1'),
+        'quiz_id': quiz_objects[0].id,
+        'history_id': certificate.id,
+    }
+
+
+def endpoints(fixtures):
+    """
+    The endpoints to measure as (name, method, path, payload factory,
+    repeat factor).
+
+    Payload factories receive the iteration number so writes never collide.
+    """
+    quiz_id = fixtures['quiz_id']
+    history_id = fixtures['history_id']
+    answers = [f'Answer {i}' for i in range(QUESTIONS_PER_QUIZ)]
+    return [
+        ('api-root', 'get', '/api/', None, 1),
+        ('quizzes-list', 'get', '/api/quizzes/', None, 1),
+        ('quizzes-detail', 'get', f'/api/quizzes/{quiz_id}/', None, 1),
+        ('history-list', 'get', '/api/history/', None, 1),
+        ('history-detail', 'get', f'/api/history/{history_id}/', None, 1),
+        ('certificates-list', 'get', '/api/certificates/', None, 1),
+        (
+            'certificate-download',
+            'get',
+            f'/api/certificates/download/{history_id}/',
+            None,
+            1,
+        ),
+        (
+            'submit',
+            'post',
+            f'/api/submit/{quiz_id}/',
+            lambda n: {'answers': answers},
+            1,
+        ),
+        (
+            'generate',
+            'post',
+            '/api/generate/',
+            lambda n: {
+                'subject': f'Generate benchmark {n}',
+                'difficulty': 'easy',
+            },
+            1,
+        ),
+        (
+            'generate-queued',
+            'post',
+            '/api/generate/?async=1',
+            lambda n: {
+                'subject': f'Queued benchmark {n}',
+                'difficulty': 'easy',
+            },
+            1,
+        ),
+        ('generation-job', 'get', '/api/generate/jobs/{job_id}/', None, 1),
+        (
+            'generate-stream',
+            'post',
+            '/api/generate/stream/',
+            lambda n: {
+                'subject': f'Stream benchmark {n}',
+                'difficulty': 'easy',
+            },
+            1,
+        ),
+        (
+            'generate-async',
+            'post',
+            '/api/generate/async/',
+            lambda n: {
+                'subject': f'Async benchmark {n}',
+                'difficulty': 'easy',
+            },
+            1,
+        ),
+        (
+            'generate-batch',
+            'post',
+            '/api/generate/batch/',
+            lambda n: {
+                'quizzes': [
+                    {
+                        'subject': f'Batch benchmark {n}.{i}',
+                        'difficulty': 'all',
+                    }
+                    for i in range(10)
+                ]
+            },
+            1,
+        ),
+        (
+            'register',
+            'post',
+            '/api/register/',
+            lambda n: {
+                'email': f'register{n}@example.com',
+                'password': BENCHMARK_PASSWORD,
+            },
+            0.25,
+        ),
+        (
+            'token-auth',
+            'post',
+            '/api/token-auth/',
+            lambda n: {
+                'email': 'bench0@example.com',
+                'password': BENCHMARK_PASSWORD,
+            },
+            0.25,
+        ),
+        ('logout', 'post', '/api/logout/', None, 1),
+        ('metrics', 'get', '/metrics', None, 1),
+    ]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def read_body(response):
+    """
+    The full body of a response; streamed bodies may be sync or async
+    iterators.
+    """
+    if not response.streaming:
+        return response.content
+    if not response.is_async:
+        return b''.join(response.streaming_content)
+
+    async def collect():
+        return b''.join([chunk async for chunk in response.streaming_content])
+    return async_to_sync(collect)()
+
+
+def client_for(name, client, fixtures):
+    """
+    The client an endpoint is driven with; set up outside the measured request.
+    """
+    if name == 'logout':
+        # Each request revokes a token of its own, not the one the other
+        # endpoints use
+        client = APIClient()
+        token = Token.objects.create(user=fixtures['logout_user'])
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    elif name == 'metrics':
+        # The test client calls from 127.0.0.1, which needs no token when none
+        # is configured
+        client = APIClient()
+        metrics_token = get_metrics_config()['TOKEN']
+        if metrics_token:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {metrics_token}')
+    return client
+
+
+def run_benchmark(fixtures, iterations=20):
+    """
+    Drive every endpoint and collect per-endpoint measurements.
+
+    Returns:
+        dict: endpoint name -> {queries, p50_ms, p95_ms, p99_ms, bytes, status}
+    """
+    reset_question_cache()
+    reset_single_flight()
+    reset_clients()
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {fixtures['token']}")
+    job_id = client.post(
+        '/api/generate/?async=1',
+        {'subject': 'Job fixture', 'difficulty': 'easy'},
+        format='json',
+    ).data['id']
+
+    results = {}
+    with ExitStack() as stack:
+        stack.enter_context(
+            patch(
+                'quizzes.quiz_service.get_client',
+                return_value=_StubClient(_StubCompletions()),
+            )
+        )
+        stack.enter_context(
+            patch(
+                'quizzes.quiz_service.get_async_client',
+                return_value=_StubClient(_AsyncStubCompletions()),
+            )
+        )
+        for name, method, path, payload, factor in endpoints(fixtures):
+            path = path.format(job_id=job_id)
+            timings, queries, sizes, statuses = [], [], [], set()
+            for n in range(max(1, int(iterations * factor))):
+                kwargs = {'format': 'json'}
+                if payload is not None:
+                    kwargs['data'] = payload(n)
+                if name == 'generate-async':
+                    kwargs = {
+                        'data': json.dumps(payload(n)),
+                        'content_type': 'application/json',
+                    }
+                request_client = client_for(name, client, fixtures)
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = getattr(request_client, method)(path, **kwargs)
+                    body = read_body(response)
+                    timings.append(time.perf_counter() - started)
+                queries.append(len(captured))
+                sizes.append(len(body))
+                statuses.add(response.status_code)
+            results[name] = {
+                'queries': max(queries),
+                'p50_ms': round(percentile(timings, 50) * 1000, 2),
+                'p95_ms': round(percentile(timings, 95) * 1000, 2),
+                'p99_ms': round(percentile(timings, 99) * 1000, 2),
+                'mean_ms': round(statistics.mean(timings) * 1000, 2),
+                'bytes': max(sizes),
+                'status': sorted(statuses),
+            }
+    return results
+
+
+def compare(
+    results,
+    baseline,
+    latency_tolerance=1.5,
+    latency_slack_ms=5.0,
+    check_latency=True,
+):
+    """
+    Compare results with a baseline.
+
+    Any increase in query count is a regression. Latency regresses when p95
+    exceeds ``baseline * latency_tolerance + latency_slack_ms``.
+
+    Returns:
+        list: Human readable regression descriptions, empty when none
+    """
+    regressions = []
+    for name, expected in baseline.items():
+        actual = results.get(name)
+        if actual is None:
+            regressions.append(f'{name}: endpoint missing from results')
+            continue
+        if actual['queries'] > expected['queries']:
+            regressions.append(
+                f"{name}: {actual['queries']} queries (baseline "
+                f"{expected['queries']})"
+            )
+        budget = expected['p95_ms'] * latency_tolerance + latency_slack_ms
+        if check_latency and actual['p95_ms'] > budget:
+            regressions.append(
+                f"{name}: p95 {actual['p95_ms']} ms (budget {budget:.1f} ms)"
+            )
+    return regressions
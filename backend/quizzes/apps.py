@@ -1,6 +1,21 @@
+import logging
+import os
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 
 class QuizzesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'quizzes'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        if not settings.OPENAI_API_KEY:
+            logger.warning(
+                "OPENAI_API_KEY is not set; checked the environment and %s",
+                os.path.join(settings.BASE_DIR, 'apis.env')
+            )
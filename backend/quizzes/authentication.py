@@ -0,0 +1,144 @@
+"""
+Token authentication with the token -> user lookup cached.
+
+DRF's ``TokenAuthentication`` joins ``authtoken_token`` and ``auth_user`` on
+every request. ``CachedTokenAuthentication`` caches the resolved user id in
+two tiers, configured through ``settings.QUIZ_AUTH_TOKEN_CACHE``:
+
+    - an in-process LRU with a short TTL (``LOCAL_TIMEOUT``)
+    - the Django cache alias ``CACHE_ALIAS`` for ``TIMEOUT`` seconds, used
+      only when that cache is shared between processes (not LocMem, which is
+      what Django uses without ``CACHES``); ``None`` disables this tier
+
+Only the user id and active flag are cached, never the password hash. A
+cache hit yields a ``User`` whose other fields are loaded from the database
+on first access, so requests that only need ``request.user.id`` cost no
+query.
+
+Deleting a token (logout) or saving a user (password change, deactivation)
+drops the cached entries of this worker and of the shared tier through the
+signals in ``quizzes/signals.py``. Other workers may keep serving their
+in-process copy for up to ``LOCAL_TIMEOUT`` seconds, which bounds how long a
+revoked token stays usable.
+"""
+import hashlib
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import router
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .question_cache import MemoryBackend, is_shared_cache
+
+DEFAULT_CONFIG = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 60 * 60,
+    'LOCAL_TIMEOUT': 60,
+    'MAX_ENTRIES': 10000,
+}
+
+
+def cache_key(token_key):
+    # Never use the raw token as a cache key: keys can show up in cache tooling
+    return 'authtoken:' + hashlib.sha256(token_key.encode('utf-8')).hexdigest()
+
+
+class TokenUserCache:
+    """Two-tier cache of token key -> (user id, is_active)."""
+
+    def __init__(self, config):
+        self.timeout = config['TIMEOUT']
+        self.local_timeout = config['LOCAL_TIMEOUT']
+        self.local = MemoryBackend(config['MAX_ENTRIES'])
+        self.shared = None
+        if config['CACHE_ALIAS']:
+            from django.core.cache import caches
+            cache = caches[config['CACHE_ALIAS']]
+            # A per-process "shared" tier would outlive invalidations made by
+            # other workers
+            if is_shared_cache(cache):
+                self.shared = cache
+
+    def get(self, token_key):
+        """
+        Return the user of a cached token.
+
+        Returns:
+            User or None: A fresh instance with only ``id`` and ``is_active``
+            loaded, or None on a miss
+        """
+        key = cache_key(token_key)
+        entry = self.local.get(key)
+        if entry is None and self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not None:
+                self.local.set(key, entry, self.local_timeout)
+        if entry is None:
+            return None
+        user_id, is_active = entry
+        if not is_active:
+            return None
+        # Other fields are deferred and loaded on first access
+        return User.from_db(
+            router.db_for_read(User), ['id', 'is_active'], [user_id, is_active]
+        )
+
+    def set(self, token_key, user):
+        key = cache_key(token_key)
+        entry = (user.pk, user.is_active)
+        self.local.set(key, entry, self.local_timeout)
+        if self.shared is not None:
+            self.shared.set(key, entry, self.timeout)
+
+    def invalidate(self, token_keys):
+        for token_key in token_keys:
+            key = cache_key(token_key)
+            self.local.delete(key)
+            if self.shared is not None:
+                self.shared.delete(key)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    """Return the process-wide token cache, building it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TokenUserCache(
+                    dict(
+                        DEFAULT_CONFIG,
+                        **getattr(settings, 'QUIZ_AUTH_TOKEN_CACHE', {})
+                    )
+                )
+    return _cache
+
+
+def invalidate_tokens(token_keys):
+    get_token_cache().invalidate(token_keys)
+
+
+def reset_token_cache():
+    """Drop the process-wide cache so the next call re-reads settings."""
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """``TokenAuthentication`` that skips the database on a warm cache."""
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        user = cache.get(key)
+        if user is not None:
+            return (user, Token(key=key, user=user))
+
+        user, token = super().authenticate_credentials(key)
+        cache.set(key, user)
+        return (user, token)
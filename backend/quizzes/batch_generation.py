@@ -0,0 +1,342 @@
+"""
+Generate many quizzes at once from a manifest, e.g. every subject of a
+course at each difficulty before the course starts.
+
+A manifest is either CSV with a header row
+(``subject,difficulty,num_questions``; only ``subject`` is required) or
+JSON: a list of objects with the same keys, or ``{"quizzes": [...]}``.
+``difficulty`` defaults to ``medium`` and may be ``all`` for one quiz per
+difficulty; ``num_questions`` defaults to 10. Repeated entries are
+generated once.
+
+``POST /api/generate/batch/`` queues one ``GenerationJob`` per entry. The
+``generate_quizzes`` command generates in-process instead: entries sharing a
+difficulty and size are packed several subjects to one OpenAI call
+(``generate_pack``), short or missing sets are completed with the usual
+per-subject calls, and finished quizzes are saved in bulk (``save_quizzes``).
+"""
+
+import csv
+import io
+import json
+import logging
+from collections import namedtuple
+
+from django.db import connection, transaction
+
+from .answer_keys import invalidate_answer_key
+from .metrics import span
+from .models import Question, Quiz
+from .question_cache import get_question_cache
+from .quiz_service import (
+    fetch_quiz_questions,
+    generation_key,
+    request_missing_questions,
+    request_packed_questions,
+)
+
+logger = logging.getLogger(__name__)
+
+DIFFICULTIES = [value for value, _ in Quiz.DIFFICULTY_CHOICES]
+DEFAULT_NUM_QUESTIONS = 10
+MAX_NUM_QUESTIONS = 50
+SUBJECT_MAX_LENGTH = Quiz._meta.get_field('subject').max_length
+
+# Errors listed in a ManifestError before the rest are summarized
+MAX_REPORTED_ERRORS = 20
+
+
+class ManifestError(ValueError):
+    """The manifest could not be read or has invalid entries."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        shown = self.errors[:MAX_REPORTED_ERRORS]
+        if len(self.errors) > len(shown):
+            shown.append(f'... and {len(self.errors) - len(shown)} more')
+        super().__init__('\n'.join(shown))
+
+
+class BatchItem(
+    namedtuple('BatchItem', ['subject', 'difficulty', 'num_questions'])
+):
+    """One quiz to generate."""
+
+    @property
+    def key(self):
+        return generation_key(
+            self.subject, self.difficulty, self.num_questions
+        )
+
+
+def parse_manifest(content, fmt=None, max_items=None):
+    """
+    Read a CSV or JSON manifest.
+
+    Args:
+        content (str or bytes): The manifest
+        fmt (str): ``csv`` or ``json``; guessed from the content when None
+        max_items (int): Reject manifests with more quizzes than this
+
+    Returns:
+        list: ``BatchItem`` per quiz, in manifest order
+
+    Raises:
+        ManifestError: With every problem found, by row
+    """
+    if isinstance(content, bytes):
+        try:
+            content = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ManifestError(['Manifest is not UTF-8 text'])
+    if fmt is None:
+        fmt = 'json' if content.lstrip()[:1] in ('[', '{') else 'csv'
+
+    if fmt == 'json':
+        try:
+            rows = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise ManifestError([f'Invalid JSON: {e}'])
+    elif fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(content))
+        if not reader.fieldnames or 'subject' not in [
+            name.strip().lower() for name in reader.fieldnames
+        ]:
+            raise ManifestError(
+                ['CSV manifest needs a header row with a "subject" column']
+            )
+        rows = [
+            {
+                (name or '').strip().lower(): value
+                for name, value in row.items()
+            }
+            for row in reader
+        ]
+    else:
+        raise ManifestError([f'Unknown manifest format {fmt!r}'])
+    return manifest_items(rows, max_items)
+
+
+def manifest_items(rows, max_items=None):
+    """
+    Validate manifest rows (already decoded, e.g. from a JSON request body).
+
+    Returns:
+        list: ``BatchItem`` per quiz, without repeats
+
+    Raises:
+        ManifestError: With every problem found, by row
+    """
+    if isinstance(rows, dict):
+        rows = rows.get('quizzes')
+    if not isinstance(rows, list):
+        raise ManifestError(
+            ['Manifest must be a list of quizzes or {"quizzes": [...]}']
+        )
+
+    items, keys, errors = [], set(), []
+    for number, row in enumerate(rows, 1):
+        if isinstance(row, str):
+            row = {'subject': row}
+        if not isinstance(row, dict):
+            errors.append(f'Row {number}: expected an object with a subject')
+            continue
+        try:
+            row_items = parse_row(row)
+        except ValueError as e:
+            errors.append(f'Row {number}: {e}')
+            continue
+        for item in row_items:
+            if item.key not in keys:
+                keys.add(item.key)
+                items.append(item)
+
+    if not items and not errors:
+        errors.append('Manifest has no quizzes')
+    if max_items is not None and len(items) > max_items:
+        errors.append(
+            f'Manifest has {len(items)} quizzes; at most {max_items} are '
+            'accepted'
+        )
+    if errors:
+        raise ManifestError(errors)
+    return items
+
+
+def parse_row(row):
+    """Return the ``BatchItem``s of one manifest row."""
+    subject = row.get('subject')
+    subject = subject.strip() if isinstance(subject, str) else ''
+    if not subject:
+        raise ValueError('subject is required')
+    if len(subject) > SUBJECT_MAX_LENGTH:
+        raise ValueError(
+            f'subject is longer than {SUBJECT_MAX_LENGTH} characters'
+        )
+
+    difficulty = str(row.get('difficulty') or 'medium').strip().lower()
+    if difficulty == 'all':
+        difficulties = DIFFICULTIES
+    elif difficulty in DIFFICULTIES:
+        difficulties = [difficulty]
+    else:
+        raise ValueError(
+            f"difficulty must be one of {', '.join(DIFFICULTIES)} or all"
+        )
+
+    num_questions = row.get('num_questions')
+    if num_questions in (None, ''):
+        num_questions = DEFAULT_NUM_QUESTIONS
+    try:
+        num_questions = int(num_questions)
+    except (TypeError, ValueError):
+        raise ValueError('num_questions must be a whole number')
+    if not 1 <= num_questions <= MAX_NUM_QUESTIONS:
+        raise ValueError(
+            f'num_questions must be between 1 and {MAX_NUM_QUESTIONS}'
+        )
+
+    return [
+        BatchItem(subject, difficulty, num_questions)
+        for difficulty in difficulties
+    ]
+
+
+def make_packs(items, pack_size):
+    """
+    Group items that can share one OpenAI call.
+
+    Items are grouped by difficulty and size, keeping manifest order within
+    each group, and split into packs of at most ``pack_size`` subjects.
+
+    Returns:
+        list: Lists of ``BatchItem``
+    """
+    groups = {}
+    for item in items:
+        groups.setdefault((item.difficulty, item.num_questions), []).append(
+            item
+        )
+    return [
+        group[start:start + pack_size]
+        for group in groups.values()
+        for start in range(0, len(group), pack_size)
+    ]
+
+
+def generate_pack(items):
+    """
+    Generate the questions of a pack of quizzes with the same difficulty and
+    size.
+
+    Cached question sets are reused. The remaining subjects are requested in
+    one packed call; subjects it left short are topped up, and subjects it
+    left empty (or all of them, if the call failed) are generated on their
+    own. Complete sets are cached. Unlike ``generate_quiz_questions`` no
+    saved quiz is reused when OpenAI is unavailable: the item fails and can
+    be retried.
+
+    Returns:
+        list: (item, questions or the exception that ended its generation)
+        pairs, in order
+    """
+    cache = get_question_cache()
+    results = {}
+    pending = []
+    for item in items:
+        questions = cache.get(item.key)
+        if questions is not None:
+            results[item] = questions
+        else:
+            pending.append(item)
+
+    packed = [[] for _ in pending]
+    if len(pending) > 1:
+        difficulty, num_questions = (
+            pending[0].difficulty,
+            pending[0].num_questions,
+        )
+        try:
+            packed = request_packed_questions(
+                [item.subject for item in pending], difficulty, num_questions
+            )
+        except Exception as e:
+            logger.warning(
+                "Packed request for %d subjects failed: %s", len(pending), e
+            )
+
+    for item, questions in zip(pending, packed):
+        try:
+            if not questions:
+                results[item] = fetch_quiz_questions(
+                    item.subject, item.difficulty, item.num_questions
+                )
+                continue
+            questions = request_missing_questions(
+                item.subject,
+                item.difficulty,
+                item.num_questions,
+                questions[: item.num_questions],
+            )
+            if len(questions) == item.num_questions:
+                cache.set(item.key, questions)
+            results[item] = questions
+        except Exception as e:
+            logger.warning(
+                "Generating %s quiz on %r failed: %s",
+                item.difficulty,
+                item.subject,
+                e,
+            )
+            results[item] = e
+    return [(item, results[item]) for item in items]
+
+
+def save_quizzes(quiz_sets):
+    """
+    Save quizzes and all of their questions in one transaction.
+
+    Quizzes and questions are each written with multi-row INSERTs, so a
+    batch costs two statements (split only by the database's parameter
+    limit) instead of two per quiz.
+
+    Args:
+        quiz_sets (list): (BatchItem, questions) pairs
+
+    Returns:
+        list: The saved ``Quiz`` objects, in order
+    """
+    if not connection.features.can_return_rows_from_bulk_insert:
+        # Question rows need the quiz ids, which this database does not hand
+        # back
+        return [
+            Quiz.objects.create_with_questions(
+                item.subject, item.difficulty, questions
+            )
+            for item, questions in quiz_sets
+        ]
+
+    with span('db_insert'), transaction.atomic():
+        quizzes = Quiz.objects.bulk_create(
+            [
+                Quiz(
+                    subject=item.subject,
+                    difficulty=item.difficulty,
+                    question_count=len(questions),
+                )
+                for item, questions in quiz_sets
+            ]
+        )
+        Question.objects.bulk_create(
+            [
+                Question(
+                    quiz=quiz, text=question['text'], answer=question['answer']
+                )
+                for quiz, (_, questions) in zip(quizzes, quiz_sets)
+                for question in questions
+            ]
+        )
+    # bulk_create sends no post_save signals; see signals.quiz_changed
+    for quiz in quizzes:
+        invalidate_answer_key(quiz.pk)
+    return quizzes
@@ -0,0 +1,214 @@
+"""
+Certificate rendering with an on-disk render cache.
+
+A certificate is drawn from a fixed layout (optionally over a background
+image) with Pillow and saved as PNG or PDF. Files are cached under
+``settings.CERTIFICATES['CACHE_DIR']`` and named after the certificate id,
+the template version and a digest of the rendered fields. A changed score
+(after a re-grade), user name or template therefore renders a new file,
+while repeat downloads are served straight from disk. Each render removes
+the certificate's earlier files in the same format, which can no longer be
+served, and then the oldest files beyond ``MAX_FILES``.
+
+Rendering only needs the plain ``certificate_context`` dict, so certificates
+can be rendered in worker processes without database access (see the
+``prerender_certificates`` command).
+"""
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+
+# Bump whenever the layout below changes so cached files are re-rendered
+TEMPLATE_VERSION = 1
+
+FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'pdf': ('PDF', 'application/pdf'),
+}
+
+DEFAULT_CONFIG = {
+    'CACHE_DIR': None,
+    'BACKGROUND': None,
+    'FONT': None,
+    'ACCEL_REDIRECT_PREFIX': None,
+    'MAX_FILES': 10000,
+}
+
+SIZE = (1754, 1240)  # A4 landscape at 150 dpi
+INK = (33, 37, 41)
+ACCENT = (13, 110, 253)
+MUTED = (108, 117, 125)
+
+
+def get_certificate_config():
+    config = dict(DEFAULT_CONFIG, **getattr(settings, 'CERTIFICATES', {}))
+    if not config['CACHE_DIR']:
+        config['CACHE_DIR'] = os.path.join(
+            tempfile.gettempdir(), 'quizz-certificates'
+        )
+    return config
+
+
+def certificate_id(history):
+    return f'CERT-{history.id:06d}'
+
+
+def certificate_context(history, user_name, quiz_subject):
+    """
+    Everything printed on a certificate.
+
+    Returns:
+        dict: user_name, quiz_subject, score, date and certificate_id
+    """
+    return {
+        'user_name': user_name,
+        'quiz_subject': quiz_subject,
+        'score': history.score_percentage,
+        'date': history.completed_at.strftime('%Y-%m-%d'),
+        'certificate_id': certificate_id(history),
+    }
+
+
+def template_version(config):
+    """
+    Layout version, plus the background image's identity when one is
+    configured.
+    """
+    version = f'v{TEMPLATE_VERSION}'
+    if config['BACKGROUND']:
+        stat = os.stat(config['BACKGROUND'])
+        version += f'-{int(stat.st_mtime)}-{stat.st_size}'
+    return version
+
+
+def cache_name(context, fmt, version):
+    digest = hashlib.sha256(
+        json.dumps(context, sort_keys=True).encode('utf-8')
+    ).hexdigest()[:12]
+    return f"{context['certificate_id']}-{version}-{digest}.{fmt}"
+
+
+def _font(config, size):
+    from PIL import ImageFont
+    if config['FONT']:
+        return ImageFont.truetype(config['FONT'], size)
+    return ImageFont.load_default(size=size)
+
+
+def render_image(context, config):
+    """Draw a certificate and return it as a Pillow image."""
+    from PIL import Image, ImageDraw
+
+    if config['BACKGROUND']:
+        image = Image.open(config['BACKGROUND']).convert('RGB').resize(SIZE)
+    else:
+        image = Image.new('RGB', SIZE, 'white')
+        frame = ImageDraw.Draw(image)
+        frame.rectangle(
+            [40, 40, SIZE[0] - 40, SIZE[1] - 40], outline=ACCENT, width=12
+        )
+        frame.rectangle(
+            [70, 70, SIZE[0] - 70, SIZE[1] - 70], outline=MUTED, width=2
+        )
+
+    draw = ImageDraw.Draw(image)
+    center = SIZE[0] // 2
+    lines = [
+        (230, 'Certificate of Achievement', 88, ACCENT),
+        (390, 'This certifies that', 40, MUTED),
+        (500, context['user_name'], 96, INK),
+        (640, 'has successfully completed the quiz', 40, MUTED),
+        (740, context['quiz_subject'], 72, INK),
+        (860, f"with a score of {context['score']}%", 48, INK),
+    ]
+    max_width = SIZE[0] - 320
+    for y, text, size, color in lines:
+        font = _font(config, size)
+        # Shrink long names and subjects to fit inside the frame
+        while size > 24 and draw.textlength(text, font=font) > max_width:
+            size -= 4
+            font = _font(config, size)
+        draw.text((center, y), text, font=font, fill=color, anchor='mm')
+
+    small = _font(config, 30)
+    draw.text(
+        (160, SIZE[1] - 160),
+        f"Date: {context['date']}",
+        font=small,
+        fill=MUTED,
+        anchor='lm',
+    )
+    draw.text(
+        (SIZE[0] - 160, SIZE[1] - 160),
+        context['certificate_id'],
+        font=small,
+        fill=MUTED,
+        anchor='rm',
+    )
+    return image
+
+
+def render_to_cache(context, fmt, config):
+    """
+    Return the cached file for a certificate, rendering it first if needed.
+
+    Files are written to a temporary name and renamed into place, so
+    concurrent renders of the same certificate never expose a partial file.
+
+    Returns:
+        tuple: (path, rendered) where ``rendered`` is False on a cache hit
+    """
+    path = os.path.join(
+        config['CACHE_DIR'], cache_name(context, fmt, template_version(config))
+    )
+    if os.path.exists(path):
+        return path, False
+
+    os.makedirs(config['CACHE_DIR'], exist_ok=True)
+    image = render_image(context, config)
+    fd, temporary = tempfile.mkstemp(dir=config['CACHE_DIR'], suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            image.save(handle, FORMATS[fmt][0], resolution=150.0)
+        # mkstemp creates owner-only files; nginx may serve these via
+        # X-Accel-Redirect
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    prune_cache(context, fmt, path, config)
+    return path, True
+
+
+def prune_cache(context, fmt, path, config):
+    """
+    Remove stale renders of the certificate just rendered to ``path``, then
+    the least recently rendered files beyond ``MAX_FILES``.
+
+    One directory scan per render, which is cheap next to the render itself.
+    """
+    stale_prefix = context['certificate_id'] + '-'
+    extensions = tuple('.' + name for name in FORMATS)
+    kept = []
+    with os.scandir(config['CACHE_DIR']) as entries:
+        for entry in entries:
+            if not entry.name.endswith(extensions):
+                continue  # Renders still being written
+            if (entry.path != path and entry.name.startswith(stale_prefix)
+                    and entry.name.endswith('.' + fmt)):
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(entry.path)
+                continue
+            try:
+                kept.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass  # Pruned by another process
+    kept.sort()
+    for _, old in kept[:max(len(kept) - config['MAX_FILES'], 0)]:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(old)
@@ -0,0 +1,370 @@
+"""
+Answer grading engine.
+
+Answers are compared in three stages, cheapest first:
+
+1. exact match after normalization (case, unicode accents, punctuation,
+   articles and whitespace are ignored, so "The Paris." matches "paris")
+2. numeric comparison when both answers are numbers: whole numbers (counts,
+   years) must be equal, decimals may differ by a small relative tolerance
+   (a wrong number is never rescued by fuzzy matching)
+3. character similarity of the token-sorted answers against a threshold,
+   only when both answers contain the same numbers and roman numerals
+   ("World War 1" never matches "World War 2", nor "Henry VII" "Henry VIII")
+
+A token counts as a roman numeral when it is written in capitals or is at
+least two letters long, and is not a common word or unit that happens to be
+spelled like one ("mix", "cm"). "I" is a numeral only as the last word of a
+longer answer ("World War I"), not in "I think Paris".
+
+``grade_batch`` grades any number of (answer, expected) pairs at once:
+normalization is memoized, identical pairs are graded once, and all fuzzy
+comparisons are handed to the similarity backend in a single call. With
+rapidfuzz (and NumPy) installed that is one vectorized ``cpdist`` call;
+otherwise it falls back to ``difflib``.
+
+The engine class is configurable through ``settings.QUIZ_GRADING['ENGINE']``.
+"""
+import re
+import threading
+import unicodedata
+from collections import namedtuple
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+try:
+    from rapidfuzz import fuzz as _fuzz, process as _process
+except ImportError:  # pragma: no cover - optional dependency
+    _fuzz = _process = None
+
+try:
+    # rapidfuzz's cpdist returns a NumPy array and needs it installed
+    import numpy
+except ImportError:  # pragma: no cover - optional dependency
+    numpy = None
+
+DEFAULT_CONFIG = {
+    'ENGINE': 'quizzes.grading.GradingEngine',
+    'SIMILARITY_THRESHOLD': 0.9,
+    'NUMERIC_REL_TOLERANCE': 0.01,
+    'NUMERIC_ABS_TOLERANCE': 1e-9,
+}
+
+ARTICLES = {'a', 'an', 'the'}
+THOUSANDS_SEPARATOR_RE = re.compile(r'(?<=\d),(?=\d{3})')
+NUMBER_RE = re.compile(r'[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?')
+INTEGER_RE = re.compile(r'[-+]?\d+')
+ROMAN_RE = re.compile(
+    r'm{0,3}(cm|cd|d?c{0,3})(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})'
+)
+ROMAN_VALUES = {
+    'm': 1000,
+    'd': 500,
+    'c': 100,
+    'l': 50,
+    'x': 10,
+    'v': 5,
+    'i': 1,
+}
+# Words and abbreviations that are also valid roman numerals
+ROMAN_LOOKALIKES = frozenset({
+    'mi', 'di', 'li', 'xi', 'ci', 'mix', 'dix', 'mmm',
+    'cd', 'dc', 'cv', 'cc', 'mc', 'md', 'dl', 'ml', 'cl', 'mm', 'cm', 'xl',
+})
+
+QuestionResult = namedtuple(
+    'QuestionResult', ['correct', 'similarity', 'method']
+)
+GradeResult = namedtuple('GradeResult', ['score', 'total', 'results'])
+
+_cpdist_available = _process is not None and numpy is not None
+
+
+@lru_cache(maxsize=65536)
+def answer_tokens(text):
+    """
+    The words of an answer, accent-free and without punctuation.
+
+    Returns:
+        tuple: Tokens in their original case
+    """
+    text = THOUSANDS_SEPARATOR_RE.sub(
+        '', unicodedata.normalize('NFKD', str(text))
+    )
+    kept = []
+    for char in text:
+        category = unicodedata.category(char)
+        if category == 'Mn':
+            continue
+        # Keep decimal points and signs inside numbers, drop other punctuation
+        kept.append(
+            ' ' if category[0] in 'PS' and char not in '.-+' else char
+        )
+    tokens = (token.strip('.') for token in ''.join(kept).split())
+    return tuple(token for token in tokens if token)
+
+
+@lru_cache(maxsize=65536)
+def normalize_answer(text):
+    """
+    Canonical form of an answer used for comparison.
+
+    Returns:
+        str: Lower-cased, accent-free text without punctuation or articles
+    """
+    tokens = [token.casefold() for token in answer_tokens(text)]
+    # An answer made only of articles (e.g. choice "A") keeps them
+    kept = [token for token in tokens if token not in ARTICLES]
+    return ' '.join(kept or tokens)
+
+
+@lru_cache(maxsize=65536)
+def roman_numerals(text):
+    """
+    The tokens of an answer written as roman numerals, lower-cased.
+
+    Returns:
+        frozenset: E.g. {"viii"} for "Henry VIII", nothing for "I think"
+    """
+    tokens = answer_tokens(text)
+    found = set()
+    for position, token in enumerate(tokens, 1):
+        lowered = token.casefold()
+        if lowered in ROMAN_LOOKALIKES or not ROMAN_RE.fullmatch(lowered):
+            continue
+        if lowered == 'i':
+            # The pronoun, unless it ends a name such as "Elizabeth I"
+            if token == 'I' and position == len(tokens) > 1:
+                found.add(lowered)
+        elif token.isupper() or len(token) >= 2:
+            found.add(lowered)
+    return frozenset(found)
+
+
+def roman_value(token):
+    """Value of a roman numeral token, or None."""
+    if not token or not ROMAN_RE.fullmatch(token):
+        return None
+    values = [ROMAN_VALUES[char] for char in token]
+    return sum(
+        -value if value < following else value
+        for value, following in zip(values, values[1:] + [0])
+    )
+
+
+@lru_cache(maxsize=65536)
+def number_tokens(normalized, romans=frozenset()):
+    """
+    The numbers an answer mentions, digits and roman numerals alike.
+
+    Args:
+        normalized (str): The answer after ``normalize_answer``
+        romans (frozenset): Tokens to read as roman numerals (see
+            ``roman_numerals``)
+
+    Returns:
+        tuple: Sorted numbers as strings ("henry viii" -> ("8",))
+    """
+    found = []
+    for token in normalized.split():
+        value = roman_value(token) if token in romans else None
+        if value is not None:
+            found.append(str(value))
+        elif any(char.isdigit() for char in token):
+            found.append(token)
+    return tuple(sorted(found))
+
+
+def parse_number(normalized):
+    """Return the answer as a float when it is a single number, else None."""
+    if NUMBER_RE.fullmatch(normalized):
+        return float(normalized)
+    return None
+
+
+def pairwise_similarity(lefts, rights):
+    """
+    Similarity in [0, 1] of each ``lefts[i]`` with ``rights[i]``.
+
+    Uses one vectorized rapidfuzz call when available.
+    """
+    if not lefts:
+        return []
+    if _cpdist_available:
+        scores = _process.cpdist(
+            lefts, rights, scorer=_fuzz.ratio, workers=-1
+        )
+        return [score / 100 for score in scores.tolist()]
+    if _fuzz is not None:
+        return [
+            _fuzz.ratio(left, right) / 100
+            for left, right in zip(lefts, rights)
+        ]
+    return [
+        SequenceMatcher(None, left, right).ratio()
+        for left, right in zip(lefts, rights)
+    ]
+
+
+class GradingEngine:
+    """
+    Exact, numeric and fuzzy answer matching with configurable thresholds.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold=0.9,
+        numeric_rel_tolerance=0.01,
+        numeric_abs_tolerance=1e-9,
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.numeric_rel_tolerance = numeric_rel_tolerance
+        self.numeric_abs_tolerance = numeric_abs_tolerance
+
+    def numbers_match(self, answer, expected, exact=False):
+        if exact:
+            return answer == expected
+        tolerance = max(
+            self.numeric_rel_tolerance * abs(expected),
+            self.numeric_abs_tolerance,
+        )
+        return abs(answer - expected) <= tolerance
+
+    def grade_batch(self, pairs):
+        """
+        Grade (answer, expected) pairs.
+
+        Args:
+            pairs (iterable): Tuples of the submitted and the correct answer
+
+        Returns:
+            list: A ``QuestionResult`` per pair, in order
+        """
+        unique = {}
+        keys = []
+        for answer, expected in pairs:
+            answer = '' if answer is None else answer
+            # A numeral on either side is read as one on both ("C" and "c")
+            romans = roman_numerals(answer) | roman_numerals(expected)
+            key = (
+                normalize_answer(answer),
+                normalize_answer(expected),
+                romans,
+            )
+            keys.append(key)
+            unique.setdefault(key, None)
+
+        fuzzy = []
+        for key in unique:
+            answer, expected, romans = key
+            if not answer:
+                unique[key] = QuestionResult(False, 0.0, 'empty')
+            elif answer == expected:
+                unique[key] = QuestionResult(True, 1.0, 'exact')
+            else:
+                answer_number, expected_number = parse_number(
+                    answer
+                ), parse_number(expected)
+                if answer_number is not None and expected_number is not None:
+                    # Whole numbers are counts or years: 1940 is not 1945
+                    exact = bool(
+                        INTEGER_RE.fullmatch(answer)
+                        and INTEGER_RE.fullmatch(expected)
+                    )
+                    correct = self.numbers_match(
+                        answer_number, expected_number, exact
+                    )
+                    unique[key] = QuestionResult(
+                        correct, 1.0 if correct else 0.0, 'numeric'
+                    )
+                elif (number_tokens(answer, romans)
+                      != number_tokens(expected, romans)):
+                    unique[key] = QuestionResult(False, 0.0, 'numeric')
+                else:
+                    fuzzy.append(key)
+
+        similarities = pairwise_similarity(
+            [' '.join(sorted(answer.split())) for answer, _, _ in fuzzy],
+            [' '.join(sorted(expected.split())) for _, expected, _ in fuzzy],
+        )
+        for key, similarity in zip(fuzzy, similarities):
+            unique[key] = QuestionResult(
+                similarity >= self.similarity_threshold,
+                round(similarity, 3),
+                'fuzzy',
+            )
+
+        return [unique[key] for key in keys]
+
+    def grade(self, user_answers, correct_answers):
+        """
+        Grade one submission.
+
+        Returns:
+            GradeResult: Score, number of questions and per-question results
+        """
+        return self.grade_many([(user_answers, correct_answers)])[0]
+
+    def grade_many(self, submissions):
+        """
+        Grade many submissions with a single ``grade_batch`` call.
+
+        Args:
+            submissions (iterable): (user_answers, correct_answers) tuples
+
+        Returns:
+            list: A ``GradeResult`` per submission, in order
+        """
+        submissions = [
+            (list(answers), list(key)) for answers, key in submissions
+        ]
+        pairs = []
+        for answers, key in submissions:
+            pairs.extend(zip(answers, key))
+        graded = iter(self.grade_batch(pairs))
+
+        missing = QuestionResult(False, 0.0, 'missing')
+        grades = []
+        for answers, key in submissions:
+            answered = min(len(answers), len(key))
+            results = [next(graded) for _ in range(answered)]
+            results.extend([missing] * (len(key) - answered))
+            grades.append(
+                GradeResult(
+                    sum(result.correct for result in results),
+                    len(key),
+                    results,
+                )
+            )
+        return grades
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_grading_engine():
+    """Return the configured grading engine."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                config = dict(
+                    DEFAULT_CONFIG, **getattr(settings, 'QUIZ_GRADING', {})
+                )
+                _engine = import_string(config['ENGINE'])(
+                    similarity_threshold=config['SIMILARITY_THRESHOLD'],
+                    numeric_rel_tolerance=config['NUMERIC_REL_TOLERANCE'],
+                    numeric_abs_tolerance=config['NUMERIC_ABS_TOLERANCE'],
+                )
+    return _engine
+
+
+def reset_grading_engine():
+    """Forget the configured engine so the next call re-reads settings."""
+    global _engine
+    with _engine_lock:
+        _engine = None
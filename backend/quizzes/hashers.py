@@ -0,0 +1,52 @@
+"""
+Password hashers whose cost comes from ``settings.PASSWORD_HASHING``.
+
+They keep Django's algorithm names, so hashes created with the stock hashers
+still verify. When the configured cost changes, ``must_update`` reports the
+stored hash as outdated and the login view rehashes it (see
+``CustomAuthToken``).
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    PBKDF2PasswordHasher,
+)
+
+
+def hashing_config(name, default):
+    return getattr(settings, 'PASSWORD_HASHING', {}).get(name) or default
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with ``PASSWORD_HASHING['PBKDF2_ITERATIONS']`` rounds."""
+
+    @property
+    def iterations(self):
+        return hashing_config(
+            'PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations
+        )
+
+
+class ConfigurableArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2id with cost parameters from ``PASSWORD_HASHING`` (needs
+    argon2-cffi).
+    """
+
+    @property
+    def time_cost(self):
+        return hashing_config(
+            'ARGON2_TIME_COST', Argon2PasswordHasher.time_cost
+        )
+
+    @property
+    def memory_cost(self):
+        return hashing_config(
+            'ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost
+        )
+
+    @property
+    def parallelism(self):
+        return hashing_config(
+            'ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism
+        )
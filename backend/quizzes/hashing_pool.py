@@ -0,0 +1,108 @@
+"""
+Bounded executor for password hashing.
+
+Hashing a password is deliberately slow and CPU bound. Running it on the
+request thread lets a login storm occupy every worker thread, so the login
+and registration views hand the work to a small thread pool instead
+(``hashlib`` and argon2-cffi release the GIL while hashing). At most
+``WORKERS`` hashes run at once and ``MAX_QUEUE`` more may wait; a request
+that finds no slot within ``QUEUE_TIMEOUT`` seconds gets ``HashingBusy``,
+which the views turn into a 503 with ``Retry-After``.
+
+The pool is configured through ``settings.PASSWORD_HASHING``.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+DEFAULT_CONFIG = {
+    'WORKERS': None,
+    'MAX_QUEUE': 32,
+    'QUEUE_TIMEOUT': 0.5,
+    'RETRY_AFTER': 1,
+}
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool and its queue are full."""
+
+    def __init__(self, retry_after):
+        super().__init__('Password hashing is at capacity')
+        self.retry_after = retry_after
+
+
+class HashingPool:
+    def __init__(self, workers, max_queue, queue_timeout, retry_after):
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(
+            workers, thread_name_prefix='password-hashing'
+        )
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.completed = 0
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Run ``fn`` on the pool and wait for its result.
+
+        Raises:
+            HashingBusy: When no slot frees up within ``queue_timeout``
+        """
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise HashingBusy(self.retry_after)
+        try:
+            return self._executor.submit(fn, *args, **kwargs).result()
+        finally:
+            self._slots.release()
+            with self._lock:
+                self.completed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'completed': self.completed,
+                'rejected': self.rejected,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    """Return the process-wide hashing pool, building it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = dict(
+                    DEFAULT_CONFIG, **getattr(settings, 'PASSWORD_HASHING', {})
+                )
+                _pool = HashingPool(
+                    config['WORKERS'] or os.cpu_count() or 1,
+                    config['MAX_QUEUE'],
+                    config['QUEUE_TIMEOUT'],
+                    config['RETRY_AFTER'],
+                )
+    return _pool
+
+
+def run_hashing(fn, *args, **kwargs):
+    return get_hashing_pool().run(fn, *args, **kwargs)
+
+
+def reset_hashing_pool():
+    """Drop the process-wide pool so the next call re-reads settings."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool._executor.shutdown(wait=False)
+        _pool = None
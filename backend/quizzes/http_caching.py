@@ -0,0 +1,80 @@
+"""
+Conditional GET support for quiz and history resources.
+
+Validators are computed from a few stored columns, never from the rendered
+body, so a matching ``If-None-Match`` is answered with 304 before any
+serialization happens:
+
+    - quiz detail: a strong ETag from the quiz id and question count. A quiz
+      does not change once its questions are saved, so complete quizzes are
+      also cacheable by the browser for ``QUIZ_MAX_AGE`` seconds.
+    - history and certificate lists: a weak ETag from one aggregate over the
+      user's attempts (latest ``completed_at``, row count and score sum, so
+      new attempts, deletions and re-grades all change it) plus the request's
+      query string. Clients revalidate every time.
+"""
+import hashlib
+
+from django.db.models import Count, Max, Sum
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+
+# Bump when the serialized shape of a resource changes so stored validators
+# stop matching
+REPRESENTATION_VERSION = 1
+QUIZ_MAX_AGE = 60 * 60 * 24
+
+
+def quiz_etag(quiz):
+    return quote_etag(
+        f'quiz-{quiz.pk}-{quiz.question_count}-v{REPRESENTATION_VERSION}'
+    )
+
+
+def history_etag(request, queryset):
+    """
+    Weak validator for one user's attempt listing, from a single aggregate
+    query.
+    """
+    state = queryset.order_by().aggregate(
+        latest=Max('completed_at'), count=Count('id'), total=Sum('score')
+    )
+    fingerprint = hashlib.sha256(
+        f"{request.user.pk}|{request.get_full_path()}|{state['latest']}"
+        f"|{state['count']}|"
+        f"{state['total']}|v{REPRESENTATION_VERSION}".encode('utf-8')
+    ).hexdigest()[:32]
+    return 'W/' + quote_etag(fingerprint)
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    Return a 304 response when the client's validators still match, else None.
+    """
+    if last_modified is not None:
+        last_modified = int(last_modified.timestamp())
+    return get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+
+
+def set_quiz_cache_headers(response, quiz, etag):
+    response['ETag'] = etag
+    if quiz.question_count:
+        response['Last-Modified'] = http_date(quiz.created_at.timestamp())
+        patch_cache_control(response, private=True, max_age=QUIZ_MAX_AGE)
+    else:
+        # Still being streamed; questions may be added, so always revalidate
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def set_list_cache_headers(response, etag):
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization', 'Cookie'])
+    return response
@@ -0,0 +1,276 @@
+"""
+Database-backed queue for quiz generation.
+
+``GenerateQuizView`` can enqueue a ``GenerationJob`` and answer 202 straight
+away; ``run_generation_worker`` processes the queue. Jobs move through
+pending -> running -> done/failed, failed attempts are retried with
+exponential backoff, and identical requests from the same user share one
+in-flight job (identical OpenAI calls are coalesced further down, in
+``fetch_quiz_questions``).
+No broker is needed: workers claim jobs with a conditional UPDATE, so any
+number of worker processes can poll the same table safely.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import GenerationJob, Quiz
+from .quiz_service import (
+    QuizGenerationError,
+    fetch_quiz_questions,
+    generation_key,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'MAX_ATTEMPTS': 3,
+    'RETRY_BACKOFF': 5,
+    'RETRY_BACKOFF_MAX': 300,
+    'STALE_AFTER': 600,
+    'MAX_BATCH_ITEMS': 500,
+}
+
+IN_FLIGHT = [GenerationJob.STATUS_PENDING, GenerationJob.STATUS_RUNNING]
+
+# What a job's owner is told; the exception itself only goes to the log
+JOB_FAILED = 'Quiz generation failed'
+JOB_UNAVAILABLE = 'Quiz generation is temporarily unavailable'
+JOB_TIMED_OUT = 'Quiz generation did not finish in time'
+
+
+def get_job_config():
+    """Return ``settings.GENERATION_JOBS`` merged over the defaults."""
+    return dict(DEFAULT_CONFIG, **getattr(settings, 'GENERATION_JOBS', {}))
+
+
+def job_key(subject, difficulty, num_questions, user=None):
+    """
+    The ``dedupe_key`` of a job: the generation's content address, per owner.
+
+    Jobs are only visible to their owner, so requests are never merged into
+    another user's job.
+    """
+    key = generation_key(subject, difficulty, num_questions)
+    return f'{key}:{user.pk}' if user is not None else key
+
+
+def public_error(exc):
+    """The message stored on a job for ``exc``."""
+    if isinstance(exc, QuizGenerationError) and exc.retry_after is not None:
+        return JOB_UNAVAILABLE
+    return JOB_FAILED
+
+
+def enqueue_generation(subject, difficulty, user=None, num_questions=10):
+    """
+    Queue a quiz generation unless the user has an identical one in flight.
+
+    Returns:
+        tuple: (GenerationJob, bool) - the job and whether it was newly created
+    """
+    key = job_key(subject, difficulty, num_questions, user)
+    existing = GenerationJob.objects.filter(
+        dedupe_key=key, status__in=IN_FLIGHT
+    ).first()
+    if existing is not None:
+        return existing, False
+    try:
+        with transaction.atomic():
+            job = GenerationJob.objects.create(
+                user=user,
+                subject=subject,
+                difficulty=difficulty,
+                num_questions=num_questions,
+                dedupe_key=key,
+                max_attempts=get_job_config()['MAX_ATTEMPTS'],
+            )
+        return job, True
+    except IntegrityError:
+        # Another request enqueued the same generation in the meantime
+        return (
+            GenerationJob.objects.get(dedupe_key=key, status__in=IN_FLIGHT),
+            False,
+        )
+
+
+def enqueue_generations(items, user=None):
+    """
+    Queue many generations at once, e.g. from a batch manifest.
+
+    As with ``enqueue_generation``, jobs already in flight are reused. The
+    new jobs are inserted with one multi-row INSERT.
+
+    Args:
+        items (iterable): Objects with ``subject``, ``difficulty`` and
+            ``num_questions`` (see ``batch_generation.BatchItem``)
+
+    Returns:
+        list: (GenerationJob, bool) pairs in the order of ``items``
+    """
+    items = list(items)
+    keys = [
+        job_key(item.subject, item.difficulty, item.num_questions, user)
+        for item in items
+    ]
+    existing = {
+        job.dedupe_key: job
+        for job in GenerationJob.objects.filter(
+            dedupe_key__in=set(keys), status__in=IN_FLIGHT
+        )
+    }
+    max_attempts = get_job_config()['MAX_ATTEMPTS']
+    new_jobs, new_keys = [], set()
+    for item, key in zip(items, keys):
+        if key in existing or key in new_keys:
+            continue
+        new_keys.add(key)
+        new_jobs.append(GenerationJob(
+            user=user,
+            subject=item.subject,
+            difficulty=item.difficulty,
+            num_questions=item.num_questions,
+            dedupe_key=key,
+            max_attempts=max_attempts,
+        ))
+
+    if not connection.features.can_return_rows_from_bulk_insert:
+        # The response needs the job ids, which this database does not hand
+        # back
+        return [
+            enqueue_generation(
+                item.subject, item.difficulty, user, item.num_questions
+            )
+            for item in items
+        ]
+    try:
+        with transaction.atomic():
+            created = {
+                job.dedupe_key: job
+                for job in GenerationJob.objects.bulk_create(new_jobs)
+            }
+    except IntegrityError:
+        # Another request enqueued some of them in the meantime; go one by one
+        return [
+            enqueue_generation(
+                item.subject, item.difficulty, user, item.num_questions
+            )
+            for item in items
+        ]
+
+    results = []
+    for key in keys:
+        if key in existing:
+            results.append((existing[key], False))
+        else:
+            results.append((created[key], key in new_keys))
+            new_keys.discard(key)
+    return results
+
+
+def claim_next_job():
+    """
+    Atomically move the oldest runnable job to ``running``.
+
+    Returns:
+        GenerationJob: The claimed job, or None if the queue is empty
+    """
+    while True:
+        candidate = (
+            GenerationJob.objects.filter(
+                status=GenerationJob.STATUS_PENDING,
+                run_after__lte=timezone.now(),
+            )
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if candidate is None:
+            return None
+        claimed = GenerationJob.objects.filter(
+            id=candidate, status=GenerationJob.STATUS_PENDING
+        ).update(
+            status=GenerationJob.STATUS_RUNNING,
+            started_at=timezone.now(),
+            attempts=F('attempts') + 1,
+            updated_at=timezone.now(),
+        )
+        if claimed:
+            return GenerationJob.objects.get(id=candidate)
+        # Lost the race to another worker; try the next job
+
+
+def retry_delay(attempts, config=None):
+    """Exponential backoff with full jitter, in seconds."""
+    config = config or get_job_config()
+    ceiling = min(
+        config['RETRY_BACKOFF_MAX'],
+        config['RETRY_BACKOFF'] * 2 ** max(attempts - 1, 0),
+    )
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def run_job(job):
+    """
+    Generate and save the quiz for a claimed job, recording the outcome.
+
+    Returns:
+        GenerationJob: The job in its new state
+    """
+    try:
+        questions_data = fetch_quiz_questions(
+            job.subject, job.difficulty, job.num_questions
+        )
+        with transaction.atomic():
+            quiz = Quiz.objects.create_with_questions(
+                job.subject, job.difficulty, questions_data
+            )
+            job.quiz = quiz
+            job.status = GenerationJob.STATUS_DONE
+            job.error = ''
+            job.save(update_fields=['quiz', 'status', 'error', 'updated_at'])
+    except Exception as e:
+        logger.warning(
+            "Generation job %s attempt %s failed: %s", job.id, job.attempts, e
+        )
+        job.error = public_error(e)
+        if job.attempts < job.max_attempts:
+            job.status = GenerationJob.STATUS_PENDING
+            job.run_after = timezone.now() + timedelta(
+                seconds=retry_delay(job.attempts)
+            )
+        else:
+            job.status = GenerationJob.STATUS_FAILED
+        job.save(update_fields=['status', 'run_after', 'error', 'updated_at'])
+    return job
+
+
+def requeue_stale_jobs(stale_after=None):
+    """
+    Recover jobs stuck in ``running`` (e.g. their worker died).
+
+    A stuck attempt counts as a failed one: jobs with attempts left go back
+    to the queue, the others are marked failed. Workers call this on every
+    poll, so a job that keeps killing its worker cannot loop forever.
+
+    Returns:
+        tuple: (requeued, failed) job counts
+    """
+    stale_after = stale_after or get_job_config()['STALE_AFTER']
+    now = timezone.now()
+    stale = GenerationJob.objects.filter(
+        status=GenerationJob.STATUS_RUNNING,
+        started_at__lt=now - timedelta(seconds=stale_after),
+    )
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=GenerationJob.STATUS_FAILED, error=JOB_TIMED_OUT, updated_at=now
+    )
+    requeued = stale.update(
+        status=GenerationJob.STATUS_PENDING, run_after=now, updated_at=now
+    )
+    return requeued, failed
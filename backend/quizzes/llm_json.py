@@ -0,0 +1,279 @@
+"""
+Tolerant parsing of the JSON produced by the model.
+
+The streaming API hands us the response a few characters at a time. Rather
+than waiting for the whole document, ``QuestionStreamParser`` tracks string
+and nesting state as text arrives and hands back every question object as
+soon as its closing brace is seen.
+
+``extract_questions`` parses a complete response. Models sometimes wrap the
+JSON in Markdown code fences, leave trailing commas, or stop mid-document
+when they hit the token limit; fences and commas are repaired, and a
+document that still does not parse is scanned with ``QuestionStreamParser``
+so every complete question object before the damage is kept. Every item is
+then checked by ``clean_question``.
+
+``extract_question_sets`` does the same for a response covering several
+subjects at once (``{"quizzes": [{"subject", "questions"}, ...]}``). A
+damaged multi-subject document is not salvaged; its subjects come back
+empty and are generated on their own.
+"""
+import json
+import re
+
+# Generous limits; anything longer is almost certainly not a quiz question
+MAX_TEXT_LENGTH = 1000
+MAX_ANSWER_LENGTH = 500
+
+_FENCE = re.compile(r'^\s*```[\w-]*\s*\n?(.*?)\n?\s*```\s*$', re.DOTALL)
+
+
+def strip_code_fences(text):
+    """Remove a Markdown code fence wrapped around the whole document."""
+    match = _FENCE.match(text)
+    return match.group(1) if match else text
+
+
+def remove_trailing_commas(text):
+    """
+    Drop commas directly before a closing ``}`` or ``]``, leaving strings
+    untouched.
+    """
+    out = []
+    in_string = escape = False
+    pending_comma = None
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if pending_comma is not None:
+            if char.isspace():
+                pending_comma.append(char)
+                continue
+            if char not in '}]':
+                out.append(',')
+            out.extend(pending_comma[1:])
+            pending_comma = None
+        if char == ',':
+            pending_comma = [',']
+            continue
+        if char == '"':
+            in_string = True
+        out.append(char)
+    if pending_comma is not None:
+        out.extend(pending_comma)
+    return ''.join(out)
+
+
+class QuestionStreamParser:
+    """
+    Extract complete objects from arrays in a JSON document fed in chunks.
+
+    Works for both ``{"questions": [{...}, ...]}`` and a bare ``[{...}, ...]``.
+    Each character is examined exactly once, so feeding a response in many
+    small chunks costs the same as parsing it in one go.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._capturing = False
+        self._capture_depth = 0
+
+    def feed(self, chunk):
+        """
+        Consume the next piece of text.
+
+        Returns:
+            list: Objects completed by this chunk, in document order
+        """
+        completed = []
+        for char in chunk or '':
+            if self._capturing:
+                self._buffer.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if (
+                    char == '{'
+                    and not self._capturing
+                    and self._stack
+                    and self._stack[-1] == '['
+                ):
+                    self._capturing = True
+                    self._capture_depth = len(self._stack)
+                    self._buffer = ['{']
+                self._stack.append(char)
+            elif char in '}]':
+                if self._stack:
+                    self._stack.pop()
+                if (
+                    self._capturing
+                    and char == '}'
+                    and len(self._stack) == self._capture_depth
+                ):
+                    self._capturing = False
+                    item = self._decode(''.join(self._buffer))
+                    if item is not None:
+                        completed.append(item)
+        return completed
+
+    @staticmethod
+    def _decode(text):
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            try:
+                item = json.loads(remove_trailing_commas(text))
+            except json.JSONDecodeError:
+                return None
+        return item if isinstance(item, dict) else None
+
+
+def clean_question(item):
+    """
+    Validate one question object against the expected schema.
+
+    Returns:
+        dict: ``{"text", "answer"}`` with surrounding whitespace removed, or
+        None when a field is missing, not a string, empty or implausibly long
+    """
+    if not isinstance(item, dict):
+        return None
+    text, answer = item.get('text'), item.get('answer')
+    if not isinstance(text, str) or not isinstance(answer, str):
+        return None
+    text, answer = text.strip(), answer.strip()
+    if (
+        not text
+        or not answer
+        or len(text) > MAX_TEXT_LENGTH
+        or len(answer) > MAX_ANSWER_LENGTH
+    ):
+        return None
+    return {"text": text, "answer": answer}
+
+
+def _decode_document(text):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(remove_trailing_commas(text))
+    except json.JSONDecodeError:
+        return None
+
+
+def extract_questions(content):
+    """
+    Extract every valid question from a model response.
+
+    Accepts ``{"questions": [...]}`` or a bare list, tolerating code fences,
+    trailing commas and truncation. Invalid items and repeated question
+    texts are dropped.
+
+    Returns:
+        tuple: (questions, salvaged) where ``salvaged`` is True when the
+        document did not parse and questions were recovered from a prefix
+    """
+    text = strip_code_fences(content or '')
+    document = _decode_document(text)
+    salvaged = document is None
+    if salvaged:
+        items = QuestionStreamParser().feed(text)
+    elif isinstance(document, dict):
+        items = document.get('questions')
+        items = items if isinstance(items, list) else []
+    elif isinstance(document, list):
+        items = document
+    else:
+        items = []
+    return merge_questions([], items), salvaged
+
+
+def merge_questions(questions, items, limit=None):
+    """
+    Append the valid items whose text is not already present.
+
+    Returns:
+        list: A new list of at most ``limit`` questions
+    """
+    merged = list(questions)
+    seen = {question['text'].casefold() for question in merged}
+    for item in items:
+        if limit is not None and len(merged) >= limit:
+            break
+        question = clean_question(item)
+        if question is None or question['text'].casefold() in seen:
+            continue
+        seen.add(question['text'].casefold())
+        merged.append(question)
+    return merged
+
+
+def extract_question_sets(content, subjects):
+    """
+    Extract the questions of each subject from a multi-subject response.
+
+    Entries are matched to ``subjects`` by name (ignoring case), and an entry
+    whose name does not match takes the first unclaimed subject at its
+    position, since models sometimes rephrase subjects.
+
+    Returns:
+        list: One question list per subject, in order; empty for subjects
+        missing from the response or when the document does not parse
+    """
+    sets = [[] for _ in subjects]
+    document = _decode_document(strip_code_fences(content or ''))
+    entries = (
+        document.get('quizzes') if isinstance(document, dict) else document
+    )
+    if not isinstance(entries, list):
+        return sets
+
+    positions = {
+        subject.strip().casefold(): index
+        for index, subject in reversed(list(enumerate(subjects)))
+    }
+    claimed = set()
+    unmatched = []
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not isinstance(
+            entry.get('questions'), list
+        ):
+            continue
+        name = entry.get('subject')
+        index = (
+            positions.get(name.strip().casefold())
+            if isinstance(name, str)
+            else None
+        )
+        if index is None or index in claimed:
+            unmatched.append((position, entry))
+            continue
+        claimed.add(index)
+        sets[index] = merge_questions([], entry['questions'])
+    for position, entry in unmatched:
+        if position < len(subjects) and position not in claimed:
+            claimed.add(position)
+            sets[position] = merge_questions([], entry['questions'])
+    return sets
@@ -0,0 +1,120 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from quizzes.api_benchmark import compare, run_benchmark, seed
+
+DEFAULT_BASELINE = os.path.join(
+    settings.BASE_DIR, 'benchmarks', 'api_baseline.json'
+)
+
+SCALES = {
+    '1k': {'users': 100, 'quizzes': 100, 'history': 1000},
+    '10k': {'users': 1000, 'quizzes': 1000, 'history': 10000},
+    '100k': {'users': 10000, 'quizzes': 5000, 'history': 100000},
+    '1m': {'users': 50000, 'quizzes': 20000, 'history': 1000000},
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed synthetic data, drive every API endpoint with OpenAI stubbed, '
+        'and fail when query counts or latency regress past the stored '
+        'baseline. All writes are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='1k')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument(
+            '--update-baseline',
+            action='store_true',
+            help='Write the results as the new baseline instead of comparing',
+        )
+        parser.add_argument('--latency-tolerance', type=float, default=1.5,
+                            help='Allowed p95 growth factor over the baseline')
+        parser.add_argument(
+            '--queries-only',
+            action='store_true',
+            help='Only compare query counts (latency is machine dependent)',
+        )
+        parser.add_argument(
+            '--output', help='Also write the results to this JSON file'
+        )
+
+    def handle(self, *args, **options):
+        scale = SCALES[options['scale']]
+        try:
+            with transaction.atomic():
+                started = time.perf_counter()
+                fixtures = seed(**scale)
+                self.stdout.write(
+                    f"Seeded {scale['users']} users, {scale['quizzes']} "
+                    f"quizzes, {scale['history']} history rows in "
+                    f"{time.perf_counter() - started:.1f}s"
+                )
+                results = run_benchmark(fixtures, options['iterations'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.report(results)
+        if options['output']:
+            self.write_json(options['output'], results)
+
+        if options['update_baseline']:
+            self.write_json(options['baseline'], results)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Baseline written to {options['baseline']}"
+                )
+            )
+            return
+
+        if not os.path.exists(options['baseline']):
+            raise CommandError(
+                f"No baseline at {options['baseline']}; run with "
+                "--update-baseline first"
+            )
+        with open(options['baseline']) as handle:
+            baseline = json.load(handle)
+        regressions = compare(
+            results, baseline,
+            latency_tolerance=options['latency_tolerance'],
+            check_latency=not options['queries_only'],
+        )
+        if regressions:
+            raise CommandError(
+                'Performance regressions:\n  ' + '\n  '.join(regressions)
+            )
+        self.stdout.write(
+            self.style.SUCCESS('No regressions against baseline')
+        )
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'endpoint':<22}{'queries':>8}{'p50 ms':>10}{'p95 ms':>10}"
+            f"{'p99 ms':>10}{'bytes':>10}  status"
+        )
+        for name, row in results.items():
+            self.stdout.write(
+                f"{name:<22}{row['queries']:>8}{row['p50_ms']:>10.1f}"
+                f"{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}"
+                f"{row['bytes']:>10}  {','.join(map(str, row['status']))}"
+            )
+
+    @staticmethod
+    def write_json(path, results):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+            handle.write('\n')
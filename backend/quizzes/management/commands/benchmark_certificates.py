@@ -0,0 +1,130 @@
+import random
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from quizzes.models import Quiz, UserQuizHistory
+
+BENCHMARK_USERNAME = '__benchmark_certificates__'
+
+
+def python_side(user):
+    """
+    The previous implementation: score every history row in Python, then filter
+    by id.
+    """
+    queryset = UserQuizHistory.objects.filter(user=user).order_by(
+        '-completed_at'
+    )
+    certificate_ids = []
+    for history in queryset.select_related('quiz').prefetch_related(
+        'quiz__questions'
+    ):
+        total_questions = history.quiz.questions.count()
+        if (
+            total_questions > 0
+            and (history.score / total_questions) * 100 >= 80
+        ):
+            certificate_ids.append(history.id)
+    return list(
+        queryset.filter(id__in=certificate_ids).values_list('id', flat=True)
+    )
+
+
+def sql_side(user):
+    """
+    The current implementation: filter on the stored flag in the database.
+    """
+    return list(
+        UserQuizHistory.objects.filter(user=user, has_certificate=True)
+        .order_by('-completed_at')
+        .values_list('id', flat=True)
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the certificates filter against one user with many '
+        'history rows. Seeds the configured database and removes the rows '
+        'afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--quizzes', type=int, default=50)
+        parser.add_argument(
+            '--skip-python',
+            action='store_true',
+            help=(
+                'Only time the SQL filter (the Python filter is slow at large '
+                'sizes)'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        User.objects.filter(username=BENCHMARK_USERNAME).delete()
+        user = User.objects.create(username=BENCHMARK_USERNAME)
+        try:
+            self.seed(user, options['rows'], options['quizzes'])
+            runs = [('sql', sql_side)]
+            if not options['skip_python']:
+                runs.insert(0, ('python', python_side))
+
+            results = {}
+            for name, implementation in runs:
+                results[name] = self.measure(name, implementation, user)
+            if len(results) == 2 and sorted(results['python']) != sorted(
+                results['sql']
+            ):
+                self.stdout.write(
+                    self.style.ERROR('Implementations returned different rows')
+                )
+        finally:
+            Quiz.objects.filter(
+                subject__startswith='__benchmark_certificates__'
+            ).delete()
+            user.delete()
+
+    def seed(self, user, rows, quizzes):
+        started = time.perf_counter()
+        with transaction.atomic():
+            quiz_objects = [
+                Quiz.objects.create_with_questions(
+                    f'__benchmark_certificates__ {n}', 'medium',
+                    [{'text': f'Q{i}', 'answer': f'A{i}'} for i in range(10)]
+                )
+                for n in range(quizzes)
+            ]
+            batch = []
+            for _ in range(rows):
+                history = UserQuizHistory(
+                    user=user, quiz=random.choice(quiz_objects)
+                )
+                history.set_score(random.randint(0, 10), 10)
+                batch.append(history)
+                if len(batch) == 5000:
+                    UserQuizHistory.objects.bulk_create(batch)
+                    batch = []
+            UserQuizHistory.objects.bulk_create(batch)
+        self.stdout.write(
+            f'Seeded {rows} history rows in '
+            f'{time.perf_counter() - started:.1f}s'
+        )
+
+    def measure(self, name, implementation, user):
+        tracemalloc.start()
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            ids = implementation(user)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f'{name:>6}: {elapsed * 1000:9.1f} ms  {len(queries):3d} queries  '
+            f'peak {peak / 1024 / 1024:7.1f} MiB  {len(ids)} certificates'
+        )
+        return ids
@@ -0,0 +1,124 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from quizzes.grading import (
+    GradingEngine,
+    normalize_answer,
+    pairwise_similarity,
+)
+
+
+def synthetic_submissions(submissions, questions, distinct_keys):
+    """
+    Answer keys shared across submissions, answered with a mix of hits, typos
+    and misses.
+    """
+    rng = random.Random(42)
+    words = [
+        ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+        for _ in range(500)
+    ]
+    keys = [
+        [
+            ' '.join(rng.choices(words, k=rng.randint(1, 3)))
+            for _ in range(questions)
+        ]
+        for _ in range(distinct_keys)
+    ]
+    data = []
+    for _ in range(submissions):
+        key = rng.choice(keys)
+        answers = []
+        for expected in key:
+            roll = rng.random()
+            if roll < 0.5:
+                answers.append(expected.upper())
+            elif roll < 0.75:
+                position = rng.randrange(len(expected))
+                answers.append(
+                    expected[:position]
+                    + rng.choice(string.ascii_lowercase)
+                    + expected[position + 1:]
+                )
+            else:
+                answers.append(rng.choice(words))
+        data.append((answers, key))
+    return data
+
+
+class Command(BaseCommand):
+    help = 'Measure grading throughput for bulk re-grades'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=20000)
+        parser.add_argument('--questions', type=int, default=10)
+        parser.add_argument(
+            '--distinct-keys',
+            type=int,
+            default=200,
+            help='Number of different answer keys (quizzes) in the data set',
+        )
+
+    def handle(self, *args, **options):
+        data = synthetic_submissions(
+            options['submissions'],
+            options['questions'],
+            options['distinct_keys'],
+        )
+        pairs = [pair for answers, key in data for pair in zip(answers, key)]
+        engine = GradingEngine()
+        self.stdout.write(f'{len(data)} submissions, {len(pairs)} answers')
+
+        def legacy():
+            return [
+                sum(a.lower() == b.lower() for a, b in zip(answers, key))
+                for answers, key in data
+            ]
+
+        def unbatched():
+            scores = []
+            for answers, key in data:
+                normalized = [
+                    (
+                        normalize_answer.__wrapped__(a),
+                        normalize_answer.__wrapped__(b),
+                    )
+                    for a, b in zip(answers, key)
+                ]
+                scores.append(
+                    sum(
+                        a == b or similarity >= engine.similarity_threshold
+                        for (a, b), similarity in zip(
+                            normalized,
+                            pairwise_similarity(
+                                [a for a, _ in normalized],
+                                [b for _, b in normalized],
+                            ),
+                        )
+                    )
+                )
+            return scores
+
+        def per_submission():
+            return [engine.grade(answers, key).score for answers, key in data]
+
+        def batched():
+            return engine.grade_batch(pairs)
+
+        for name, run in [
+            ('exact only (legacy)', legacy),
+            ('fuzzy, no memo/batch', unbatched),
+            ('engine per submission', per_submission),
+            ('engine single batch', batched),
+        ]:
+            normalize_answer.cache_clear()
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{name:<24} {elapsed:8.3f}s  {len(pairs) / elapsed:12,.0f} '
+                'answers/s'
+            )
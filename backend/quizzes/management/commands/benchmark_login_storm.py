@@ -0,0 +1,155 @@
+import asyncio
+import time
+
+import httpx
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+EMAIL_TEMPLATE = 'loginstorm{}@example.com'
+PASSWORD = 'login-storm-password'
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire a burst of concurrent logins at a running server while timing '
+        'an ordinary authenticated read, to show how password hashing '
+        'affects other endpoints. Creates throwaway users in the configured '
+        'database and deletes them afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/api/')
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--logins', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument(
+            '--readers',
+            type=int,
+            default=4,
+            help='Concurrent clients reading /quizzes/ during the storm',
+        )
+        parser.add_argument('--keep-users', action='store_true')
+
+    def handle(self, *args, **options):
+        token = self.seed(options['users'])
+        try:
+            logins, rejected, failures, reads, elapsed = asyncio.run(
+                self.run(options, token)
+            )
+        finally:
+            if not options['keep_users']:
+                User.objects.filter(
+                    email__startswith='loginstorm',
+                    email__endswith='@example.com',
+                ).delete()
+        if not logins:
+            raise CommandError(
+                f'No login succeeded ({rejected} rejected, {failures} failed)'
+            )
+
+        logins.sort()
+        reads.sort()
+        self.stdout.write(
+            f"Logins:      {options['logins']} (concurrency "
+            f"{options['concurrency']})"
+        )
+        self.stdout.write(
+            f'Succeeded:   {len(logins)}  rejected (503): {rejected}  failed: '
+            f'{failures}'
+        )
+        self.stdout.write(f'Throughput:  {len(logins) / elapsed:.1f} logins/s')
+        for pct in (50, 95, 99):
+            self.stdout.write(
+                f'p{pct}:         login {percentile(logins, pct) * 1000:7.0f} '
+                f'ms   read {percentile(reads, pct) * 1000:7.0f} ms'
+            )
+        self.stdout.write(f'Reads:       {len(reads)} during the storm')
+
+    def seed(self, users):
+        # Hash once and share the hash; seeding is not what is being measured
+        password = make_password(PASSWORD)
+        existing = set(
+            User.objects.filter(email__startswith='loginstorm').values_list(
+                'email', flat=True
+            )
+        )
+        User.objects.bulk_create(
+            [
+                User(
+                    username=f'loginstorm{n}',
+                    email=EMAIL_TEMPLATE.format(n),
+                    password=password,
+                )
+                for n in range(users)
+                if EMAIL_TEMPLATE.format(n) not in existing
+            ]
+        )
+        token, _ = Token.objects.get_or_create(
+            user=User.objects.get(email=EMAIL_TEMPLATE.format(0))
+        )
+        return token.key
+
+    async def run(self, options, token):
+        base = options['url'].rstrip('/') + '/'
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        logins, reads = [], []
+        rejected = failures = 0
+        done = asyncio.Event()
+        limits = httpx.Limits(
+            max_connections=options['concurrency'] + options['readers']
+        )
+
+        async with httpx.AsyncClient(limits=limits, timeout=None) as client:
+            async def login(number):
+                nonlocal rejected, failures
+                payload = {
+                    'email': EMAIL_TEMPLATE.format(number % options['users']),
+                    'password': PASSWORD,
+                }
+                async with semaphore:
+                    started = time.perf_counter()
+                    try:
+                        response = await client.post(
+                            base + 'token-auth/', json=payload
+                        )
+                    except httpx.HTTPError:
+                        failures += 1
+                        return
+                    if response.status_code == 200:
+                        logins.append(time.perf_counter() - started)
+                    elif response.status_code == 503:
+                        rejected += 1
+                    else:
+                        failures += 1
+
+            async def reader():
+                headers = {'Authorization': f'Token {token}'}
+                while not done.is_set():
+                    started = time.perf_counter()
+                    try:
+                        await client.get(base + 'quizzes/', headers=headers)
+                    except httpx.HTTPError:
+                        continue
+                    reads.append(time.perf_counter() - started)
+
+            readers = [
+                asyncio.create_task(reader())
+                for _ in range(options['readers'])
+            ]
+            started = time.perf_counter()
+            await asyncio.gather(*(login(n) for n in range(options['logins'])))
+            elapsed = time.perf_counter() - started
+            done.set()
+            await asyncio.gather(*readers)
+
+        return logins, rejected, failures, reads, elapsed
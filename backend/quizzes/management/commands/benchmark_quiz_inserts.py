@@ -0,0 +1,79 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from quizzes.models import Question, Quiz
+
+
+def insert_per_row(subject, questions_data):
+    """The previous write path: one autocommitted INSERT per question."""
+    quiz = Quiz.objects.create(subject=subject, difficulty='medium')
+    for question_data in questions_data:
+        Question.objects.create(
+            quiz=quiz,
+            text=question_data['text'],
+            answer=question_data['answer'],
+        )
+    return quiz
+
+
+def insert_bulk(subject, questions_data):
+    return Quiz.objects.create_with_questions(
+        subject, 'medium', questions_data
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare per-row and bulk quiz insertion on the configured database. '
+        'Benchmark quizzes are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[10, 50, 500]
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        subject = '__benchmark_quiz_inserts__'
+        self.stdout.write(
+            f'Database: {connection.vendor} '
+            f'({connection.settings_dict["NAME"]})'
+        )
+        self.stdout.write(
+            f'{"questions":>10} {"per-row ms":>12} {"bulk ms":>10} '
+            f'{"speedup":>9}'
+        )
+        try:
+            for size in options['sizes']:
+                questions_data = [
+                    {
+                        'text': f'Benchmark question {i}?',
+                        'answer': f'Answer {i}',
+                    }
+                    for i in range(size)
+                ]
+                per_row = self.measure(
+                    insert_per_row, subject, questions_data, options['repeat']
+                )
+                bulk = self.measure(
+                    insert_bulk, subject, questions_data, options['repeat']
+                )
+                self.stdout.write(
+                    f'{size:>10} {per_row * 1000:>12.1f} {bulk * 1000:>10.1f} '
+                    f'{per_row / bulk:>8.1f}x'
+                )
+        finally:
+            Quiz.objects.filter(subject=subject).delete()
+
+    @staticmethod
+    def measure(insert, subject, questions_data, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            insert(subject, questions_data)
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
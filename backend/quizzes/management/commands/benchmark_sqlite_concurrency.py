@@ -0,0 +1,219 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SCHEMA = '''
+CREATE TABLE history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    quiz_id INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    answers TEXT NOT NULL,
+    completed_at REAL NOT NULL
+);
+CREATE INDEX history_user_recent
+    ON history (user_id, completed_at DESC, id DESC);
+'''
+ANSWERS = json.dumps([
+    'Paris', 'Rome', 'Madrid', 'Berlin', 'Lisbon',
+    'Vienna', 'Prague', 'Warsaw', 'Oslo', 'Bern',
+])
+
+
+def profiles():
+    """Connection setup per profile: (pragmas, BEGIN statement)."""
+    return {
+        # Django's SQLite defaults: rollback journal, deferred transactions, 5s
+        # timeout
+        'default': (['busy_timeout=5000'], 'BEGIN'),
+        'tuned': (settings.SQLITE_TUNING_PRAGMAS, 'BEGIN IMMEDIATE'),
+    }
+
+
+def connect(path, pragmas):
+    conn = sqlite3.connect(path, isolation_level=None, timeout=5)
+    for pragma in pragmas:
+        conn.execute(f'PRAGMA {pragma}')
+    return conn
+
+
+def prepare(path, pragmas, users, rows):
+    conn = connect(path, pragmas)
+    conn.executescript(SCHEMA)
+    now = time.time()
+    conn.execute('BEGIN')
+    conn.executemany(
+        'INSERT INTO history (user_id, quiz_id, score, answers, '
+        'completed_at) VALUES (?, ?, ?, ?, ?)',
+        [
+            (
+                random.randrange(users),
+                random.randrange(1000),
+                random.randint(0, 10),
+                ANSWERS,
+                now - n,
+            )
+            for n in range(rows)
+        ],
+    )
+    conn.execute('COMMIT')
+    conn.close()
+
+
+def worker(path, pragmas, begin, role, users, duration, seed):
+    """
+    Run one reader or writer until ``duration`` elapses.
+
+    Readers page through one user's history (the history listing); writers
+    insert an attempt per transaction (a quiz submission).
+
+    Returns:
+        tuple: (role, latencies in seconds, number of "database is locked"
+            errors)
+    """
+    rng = random.Random(seed)
+    conn = connect(path, pragmas)
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if role == 'reader':
+                conn.execute(
+                    'SELECT id, quiz_id, score, completed_at FROM history '
+                    'WHERE user_id = ? ORDER BY completed_at DESC, id DESC '
+                    'LIMIT 20',
+                    (rng.randrange(users),),
+                ).fetchall()
+            else:
+                conn.execute(begin)
+                conn.execute(
+                    'INSERT INTO history (user_id, quiz_id, score, answers, '
+                    'completed_at) VALUES (?, ?, ?, ?, ?)',
+                    (
+                        rng.randrange(users),
+                        rng.randrange(1000),
+                        rng.randint(0, 10),
+                        ANSWERS,
+                        time.time(),
+                    ),
+                )
+                conn.execute('COMMIT')
+        except sqlite3.OperationalError:
+            errors += 1
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    return role, latencies, errors
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[
+        max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare SQLite throughput under concurrent readers and writers with '
+        'the default settings and the SQLITE_TUNING profile. Uses throwaway '
+        'database files.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument(
+            '--duration', type=float, default=10, help='Seconds per profile'
+        )
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=100000,
+            help='History rows seeded first',
+        )
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument(
+            '--profile',
+            choices=['default', 'tuned'],
+            action='append',
+            help='Profile to run (repeatable, default both)',
+        )
+
+    def handle(self, *args, **options):
+        selected = options['profile'] or ['default', 'tuned']
+        self.stdout.write(
+            f"{options['readers']} readers, {options['writers']} writers, "
+            f"{options['duration']:.0f}s per profile, {options['rows']} "
+            "seeded rows"
+        )
+        self.stdout.write(
+            f"{'profile':<9}{'role':<8}{'ops/s':>10}{'p50 ms':>10}"
+            f"{'p95 ms':>10}{'p99 ms':>10}{'locked':>8}"
+        )
+        for name in selected:
+            pragmas, begin = profiles()[name]
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                prepare(path, pragmas, options['users'], options['rows'])
+                self.report(
+                    name,
+                    self.run(path, pragmas, begin, options),
+                    options['duration'],
+                )
+
+    def run(self, path, pragmas, begin, options):
+        roles = ['reader'] * options['readers'] + ['writer'] * options[
+            'writers'
+        ]
+        with ProcessPoolExecutor(len(roles)) as executor:
+            futures = [
+                executor.submit(
+                    worker,
+                    path,
+                    pragmas,
+                    begin,
+                    role,
+                    options['users'],
+                    options['duration'],
+                    seed,
+                )
+                for seed, role in enumerate(roles)
+            ]
+            return [future.result() for future in futures]
+
+    def report(self, name, results, duration):
+        for role in ('reader', 'writer'):
+            latencies = [
+                value
+                for result_role, values, _ in results
+                if result_role == role
+                for value in values
+            ]
+            errors = sum(
+                count
+                for result_role, _, count in results
+                if result_role == role
+            )
+            if not latencies and not errors:
+                continue
+            self.stdout.write(
+                f'{name:<9}{role:<8}{len(latencies) / duration:>10,.0f}'
+                f'{percentile(latencies, 50) * 1000:>10.2f}'
+                f'{percentile(latencies, 95) * 1000:>10.2f}'
+                f'{percentile(latencies, 99) * 1000:>10.2f}{errors:>8}'
+            )
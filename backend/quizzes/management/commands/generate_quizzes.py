@@ -0,0 +1,218 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from quizzes.batch_generation import (
+    ManifestError,
+    generate_pack,
+    make_packs,
+    parse_manifest,
+    save_quizzes,
+)
+
+
+def run_pack(items):
+    """
+    Generate a pack in a worker thread, closing the thread's connection
+    afterwards.
+    """
+    try:
+        return generate_pack(items)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate and save the quizzes listed in a CSV or JSON manifest (see '
+        'quizzes/batch_generation.py). Several subjects are packed into each '
+        'OpenAI request and calls run concurrently. Progress is recorded in '
+        'a state file, so an interrupted run resumes where it stopped and a '
+        'rerun retries only the quizzes that failed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'manifest', help='Manifest file, or - to read it from stdin'
+        )
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'json'],
+            help='Manifest format (default: guessed from the content)',
+        )
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='OpenAI requests in flight at once')
+        parser.add_argument(
+            '--pack-size',
+            type=int,
+            default=5,
+            help=(
+                'Subjects asked for in one OpenAI request (1 disables packing)'
+            ),
+        )
+        parser.add_argument(
+            '--state',
+            help=(
+                'Progress file (default: <manifest>.state.json); resumed from '
+                'when it exists'
+            ),
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore an existing state file and generate everything again',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help=(
+                'Validate the manifest and show the plan without generating '
+                'anything'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['pack_size'] < 1:
+            raise CommandError(
+                '--concurrency and --pack-size must be positive'
+            )
+
+        if options['manifest'] == '-':
+            content = sys.stdin.read()
+            self.state_path = options['state']
+        else:
+            try:
+                with open(options['manifest'], 'rb') as handle:
+                    content = handle.read()
+            except OSError as e:
+                raise CommandError(f'Cannot read manifest: {e}')
+            self.state_path = (
+                options['state'] or f"{options['manifest']}.state.json"
+            )
+        try:
+            items = parse_manifest(content, options['format'])
+        except ManifestError as e:
+            raise CommandError(f'Invalid manifest:\n{e}')
+
+        self.state = (
+            {'done': {}, 'failed': {}}
+            if options['restart']
+            else self.read_state()
+        )
+        todo = [item for item in items if item.key not in self.state['done']]
+        # Earlier failures matter only while the quiz is still to be generated
+        todo_keys = {item.key for item in todo}
+        self.state['failed'] = {
+            key: error
+            for key, error in self.state['failed'].items()
+            if key in todo_keys
+        }
+        packs = make_packs(todo, options['pack_size'])
+        self.stdout.write(
+            f'{len(items)} quizzes in manifest, {len(items) - len(todo)} '
+            f'already generated; generating {len(todo)} in {len(packs)} '
+            f'requests with {options["concurrency"]} threads'
+        )
+        if options['dry_run']:
+            for pack in packs:
+                subjects = ', '.join(item.subject for item in pack)
+                self.stdout.write(
+                    f'  {pack[0].difficulty} x{pack[0].num_questions}: '
+                    f'{subjects}'
+                )
+            return
+        if not packs:
+            self.finish(len(items))
+            return
+
+        self.total = len(todo)
+        self.generated = self.failed = 0
+        self.started = time.perf_counter()
+        executor = ThreadPoolExecutor(options['concurrency'])
+        pending = {executor.submit(run_pack, pack) for pack in packs}
+        try:
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    self.record(future.result())
+        except KeyboardInterrupt:
+            for future in pending:
+                future.cancel()
+            self.stderr.write('Interrupted; saving the requests in flight')
+            for future in pending:
+                if not future.cancelled():
+                    self.record(future.result())
+            raise CommandError(
+                'Interrupted; run the same command again to resume from '
+                f'{self.state_path}'
+            )
+        finally:
+            executor.shutdown(cancel_futures=True)
+        self.finish(len(items))
+
+    def record(self, results):
+        """
+        Save a finished pack's quizzes and note its outcome in the state file.
+        """
+        generated = [
+            (item, questions)
+            for item, questions in results
+            if not isinstance(questions, Exception)
+        ]
+        quizzes = save_quizzes(generated) if generated else []
+        for (item, _), quiz in zip(generated, quizzes):
+            self.state['done'][item.key] = quiz.id
+            self.state['failed'].pop(item.key, None)
+        for item, error in results:
+            if isinstance(error, Exception):
+                self.state['failed'][
+                    item.key
+                ] = f'{item.subject} ({item.difficulty}): {error}'
+                self.stderr.write(
+                    f'Failed: {item.subject} ({item.difficulty}): {error}'
+                )
+        self.write_state()
+
+        self.generated += len(generated)
+        self.failed += len(results) - len(generated)
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(
+            f'{self.generated + self.failed}/{self.total} quizzes  '
+            f'{self.failed} failed  '
+            f'{self.generated / elapsed if elapsed else 0:,.1f}/s'
+        )
+
+    def finish(self, total):
+        failed = len(self.state['failed'])
+        if failed:
+            raise CommandError(
+                f'{failed} of {total} quizzes failed; run the same command '
+                f'again to retry them (progress is in {self.state_path})'
+            )
+        if self.state_path and os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        self.stdout.write(self.style.SUCCESS(f'All {total} quizzes generated'))
+
+    def read_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {'done': {}, 'failed': {}}
+        with open(self.state_path) as handle:
+            state = json.load(handle)
+        return {
+            'done': state.get('done', {}),
+            'failed': state.get('failed', {}),
+        }
+
+    def write_state(self):
+        if not self.state_path:
+            return
+        # Write then rename so an interrupted run never leaves a truncated file
+        temporary = f'{self.state_path}.tmp'
+        with open(temporary, 'w') as handle:
+            json.dump(self.state, handle)
+        os.replace(temporary, self.state_path)
@@ -0,0 +1,95 @@
+import asyncio
+import statistics
+import time
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire concurrent quiz generation requests at a running server and '
+        'report latency'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8000/api/generate/async/'
+        )
+        parser.add_argument(
+            '--token', required=True, help='API token of an existing user'
+        )
+        parser.add_argument('--requests', type=int, default=100)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--subject', default='Load testing')
+        parser.add_argument('--difficulty', default='easy')
+        parser.add_argument(
+            '--unique-subjects',
+            action='store_true',
+            help='Append the request number to the subject to defeat caching',
+        )
+
+    def handle(self, *args, **options):
+        latencies, failures, elapsed = asyncio.run(self.run(options))
+        if not latencies and failures:
+            raise CommandError(f'All {failures} requests failed')
+
+        latencies.sort()
+        self.stdout.write(
+            f"Requests:    {options['requests']} (concurrency "
+            f"{options['concurrency']})"
+        )
+        self.stdout.write(f'Failures:    {failures}')
+        self.stdout.write(f'Throughput:  {len(latencies) / elapsed:.2f} req/s')
+        self.stdout.write(
+            f'Mean:        {statistics.mean(latencies) * 1000:.0f} ms'
+        )
+        for pct in (50, 95, 99):
+            self.stdout.write(
+                f'p{pct}:         {percentile(latencies, pct) * 1000:.0f} ms'
+            )
+
+    async def run(self, options):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        latencies = []
+        failures = 0
+        headers = {'Authorization': f"Token {options['token']}"}
+        limits = httpx.Limits(max_connections=options['concurrency'])
+
+        async with httpx.AsyncClient(
+            headers=headers, limits=limits, timeout=None
+        ) as client:
+            async def one(number):
+                nonlocal failures
+                subject = options['subject']
+                if options['unique_subjects']:
+                    subject = f'{subject} {number}'
+                async with semaphore:
+                    started = time.perf_counter()
+                    try:
+                        response = await client.post(
+                            options['url'],
+                            json={
+                                'subject': subject,
+                                'difficulty': options['difficulty'],
+                            },
+                        )
+                        response.raise_for_status()
+                    except httpx.HTTPError as e:
+                        failures += 1
+                        self.stderr.write(f'Request {number} failed: {e}')
+                        return
+                    latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one(n) for n in range(options['requests'])))
+            elapsed = time.perf_counter() - started
+        return latencies, failures, elapsed
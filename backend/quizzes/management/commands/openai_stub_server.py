@@ -0,0 +1,260 @@
+import json
+import random
+import re
+import sys
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+def stub_questions(num_questions, subject):
+    return [
+        {
+            'text': f'Stub question {i + 1} about {subject}?',
+            'answer': f'Stub answer {i + 1}',
+        }
+        for i in range(num_questions)
+    ]
+
+
+def build_completion(num_questions, subject, subjects=None):
+    """
+    Return a chat completion payload in the OpenAI response format.
+
+    With ``subjects`` the content answers a packed multi-subject prompt.
+    """
+    if subjects:
+        content = json.dumps(
+            {
+                'quizzes': [
+                    {
+                        'subject': name,
+                        'questions': stub_questions(num_questions, name),
+                    }
+                    for name in subjects
+                ]
+            }
+        )
+        num_questions *= len(subjects)
+    else:
+        content = json.dumps(
+            {'questions': stub_questions(num_questions, subject)}
+        )
+    return {
+        'id': f'chatcmpl-{uuid.uuid4().hex}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': 'stub',
+        'choices': [
+            {
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }
+        ],
+        'usage': {
+            'prompt_tokens': 100,
+            'completion_tokens': 20 * num_questions,
+            'total_tokens': 100 + 20 * num_questions,
+        },
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers chat completions with generated questions.
+
+    Fault injection: each request is independently turned into a 500
+    (``error_rate``), a 429 with Retry-After (``rate_limit_rate``), a reply
+    delayed by ``hang`` seconds to trip client timeouts (``hang_rate``), or a
+    completion whose JSON is cut off halfway (``truncate_rate``).
+    """
+    protocol_version = 'HTTP/1.1'
+    delay = 0.0
+    error_rate = 0.0
+    rate_limit_rate = 0.0
+    hang_rate = 0.0
+    hang = 30.0
+    truncate_rate = 0.0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)) or 0)
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_json(404, {'error': {'message': 'Not found'}})
+            return
+        try:
+            messages = json.loads(body).get('messages', [])
+        except json.JSONDecodeError:
+            self.send_json(400, {'error': {'message': 'Invalid JSON'}})
+            return
+
+        prompt = messages[-1]['content'] if messages else ''
+        match = re.match(r'Generate (\d+) \w+ questions about (.*)', prompt)
+        num_questions, subject = (
+            (int(match.group(1)), match.group(2))
+            if match
+            else (10, 'anything')
+        )
+        subjects = None
+        if subject == 'each of these subjects:':
+            subjects = [
+                line[2:]
+                for line in prompt.splitlines()[1:]
+                if line.startswith('- ')
+            ]
+
+        fault = self.pick_fault()
+        if fault == 'error':
+            self.send_json(
+                500,
+                {
+                    'error': {
+                        'message': 'Injected server error',
+                        'type': 'server_error',
+                    }
+                },
+            )
+            return
+        if fault == 'rate_limit':
+            self.send_json(
+                429,
+                {
+                    'error': {
+                        'message': 'Injected rate limit',
+                        'type': 'rate_limit_exceeded',
+                    }
+                },
+                headers={'Retry-After': '1'},
+            )
+            return
+
+        time.sleep(self.hang if fault == 'hang' else self.delay)
+        completion = build_completion(num_questions, subject, subjects)
+        if fault == 'truncate':
+            message = completion['choices'][0]['message']
+            message['content'] = message['content'][
+                : len(message['content']) // 2
+            ]
+            completion['choices'][0]['finish_reason'] = 'length'
+        self.send_json(200, completion)
+
+    def pick_fault(self):
+        roll = random.random()
+        for fault, rate in (
+            ('error', self.error_rate),
+            ('rate_limit', self.rate_limit_rate),
+            ('hang', self.hang_rate),
+            ('truncate', self.truncate_rate),
+        ):
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    def send_json(self, status_code, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Clients that time out on an injected hang disconnect before the reply
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a local stand-in for the OpenAI chat completions API. '
+        'Point OPENAI_BASE_URL at http://<host>:<port>/v1 to use it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument(
+            '--delay',
+            type=float,
+            default=2.0,
+            help='Seconds to wait before answering, simulating LLM latency',
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.0,
+            help='Fraction of requests answered with 500',
+        )
+        parser.add_argument(
+            '--rate-limit-rate',
+            type=float,
+            default=0.0,
+            help='Fraction of requests answered with 429 and Retry-After',
+        )
+        parser.add_argument(
+            '--hang-rate',
+            type=float,
+            default=0.0,
+            help='Fraction of requests answered only after --hang seconds',
+        )
+        parser.add_argument('--hang', type=float, default=30.0)
+        parser.add_argument(
+            '--truncate-rate',
+            type=float,
+            default=0.0,
+            help='Fraction of completions whose JSON is cut off halfway',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Seed the fault sequence for repeatable runs',
+        )
+
+    def handle(self, *args, **options):
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+        faults = {
+            name: options[name]
+            for name in (
+                'error_rate',
+                'rate_limit_rate',
+                'hang_rate',
+                'hang',
+                'truncate_rate',
+            )
+        }
+        handler = type(
+            'Handler', (StubHandler,), {'delay': options['delay'], **faults}
+        )
+        server = StubServer((options['host'], options['port']), handler)
+        injected = ', '.join(
+            f'{name} {value}'
+            for name, value in faults.items()
+            if value and name != 'hang'
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"OpenAI stub listening on http://{options['host']}"
+                f":{options['port']}/v1 (delay {options['delay']}"
+                f"s{'; ' + injected if injected else ''})"
+            )
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,138 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time as day_start, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quizzes.certificates import (
+    FORMATS,
+    certificate_context,
+    get_certificate_config,
+    render_to_cache,
+)
+from quizzes.models import UserQuizHistory
+
+
+def render_batch(contexts, formats, config):
+    """
+    Render a batch in a worker process; returns how many files were rendered.
+    """
+    rendered = 0
+    for context in contexts:
+        for fmt in formats:
+            rendered += render_to_cache(context, fmt, config)[1]
+    return rendered
+
+
+class Command(BaseCommand):
+    help = (
+        'Render certificate files for a cohort ahead of time so downloads '
+        'are served from the render cache. Already cached certificates are '
+        'skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', default=[], help='Username (repeatable)'
+        )
+        parser.add_argument(
+            '--quiz',
+            type=int,
+            action='append',
+            default=[],
+            help='Quiz id (repeatable)',
+        )
+        parser.add_argument(
+            '--since',
+            help='Only attempts completed on or after this date (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            action='append',
+            help='File format to render (repeatable, default pdf)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=0,
+            help='Render in this many processes (default: one per CPU)',
+        )
+        parser.add_argument('--batch-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        formats = options['format'] or ['pdf']
+        queryset = UserQuizHistory.objects.filter(has_certificate=True)
+        if options['user']:
+            queryset = queryset.filter(user__username__in=options['user'])
+        if options['quiz']:
+            queryset = queryset.filter(quiz_id__in=options['quiz'])
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--since must be a date like 2024-09-01')
+            queryset = queryset.filter(
+                completed_at__gte=datetime.combine(
+                    since, day_start(), tzinfo=timezone.utc
+                )
+            )
+
+        config = get_certificate_config()
+        rows = queryset.order_by('id').values_list(
+            'id',
+            'score_percentage',
+            'completed_at',
+            'user__username',
+            'quiz__subject',
+        )
+        batches, batch, total = [], [], 0
+        for (
+            history_id,
+            score_percentage,
+            completed_at,
+            username,
+            subject,
+        ) in rows.iterator():
+            history = UserQuizHistory(
+                id=history_id,
+                score_percentage=score_percentage,
+                completed_at=completed_at,
+            )
+            batch.append(certificate_context(history, username, subject))
+            total += 1
+            if len(batch) == options['batch_size']:
+                batches.append(batch)
+                batch = []
+        if batch:
+            batches.append(batch)
+        if not total:
+            self.stdout.write('No certificates match')
+            return
+
+        self.stdout.write(
+            f"Rendering {total} certificates as {', '.join(formats)} into "
+            f"{config['CACHE_DIR']}"
+        )
+        started = time.perf_counter()
+        rendered = done = 0
+        with ProcessPoolExecutor(options['workers'] or None) as executor:
+            futures = [
+                executor.submit(render_batch, batch, formats, config)
+                for batch in batches
+            ]
+            for batch, future in zip(batches, futures):
+                rendered += future.result()
+                done += len(batch)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{done}/{total} certificates  {rendered} files rendered  '
+                    f'{done / elapsed:,.1f}/s'
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{rendered} files rendered, {total * len(formats) - rendered}'
+                f' already cached, in {time.perf_counter() - started:.1f}s'
+            )
+        )
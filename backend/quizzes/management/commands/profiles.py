@@ -0,0 +1,144 @@
+import json
+import os
+import shutil
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quizzes.profiling import (
+    delete_profile,
+    get_profiling_config,
+    list_profiles,
+    load_profile,
+    make_token,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Inspect request profiles captured by ProfilingMiddleware: list '
+        'them, show one (call stacks and SQL), dump one to a file, print a '
+        'header token that forces profiling, or clear the buffer.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action',
+            choices=['list', 'show', 'dump', 'token', 'clear'],
+            nargs='?',
+            default='list',
+        )
+        parser.add_argument(
+            'profile_id',
+            nargs='?',
+            help='Profile id (show/dump); "latest" for the newest',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Profiles to list, newest first',
+        )
+        parser.add_argument(
+            '--path', help='Only list profiles whose path starts with this'
+        )
+        parser.add_argument(
+            '--output',
+            help='dump: file to write (.prof for cProfile stats, else JSON)',
+        )
+
+    def handle(self, *args, **options):
+        self.directory = get_profiling_config()['DIR']
+        getattr(self, f"handle_{options['action']}")(options)
+
+    def resolve(self, options):
+        ids = list_profiles(self.directory)
+        profile_id = options['profile_id']
+        if not profile_id:
+            raise CommandError(
+                f"{options['action']} needs a profile id (or 'latest')"
+            )
+        if profile_id == 'latest':
+            if not ids:
+                raise CommandError(f'No profiles in {self.directory}')
+            return ids[-1]
+        if profile_id not in ids:
+            raise CommandError(f'Unknown profile {profile_id}')
+        return profile_id
+
+    def handle_list(self, options):
+        shown = 0
+        for profile_id in reversed(list_profiles(self.directory)):
+            try:
+                record = load_profile(self.directory, profile_id)
+            except FileNotFoundError:
+                continue  # Rotated out while listing
+            if options['path'] and not record['path'].startswith(
+                options['path']
+            ):
+                continue
+            started = datetime.fromtimestamp(record['started_at']).strftime(
+                '%Y-%m-%d %H:%M:%S'
+            )
+            self.stdout.write(
+                f"{profile_id}  {started}  {record['method']:6} "
+                f"{record['path']}  {record['status']}  "
+                f"{record['duration_ms']:8.1f} ms  {record['query_count']:3} "
+                f"queries ({record['query_time_ms']:.1f} ms)  "
+                f"[{record['trigger']}]"
+            )
+            shown += 1
+            if shown == options['limit']:
+                break
+        if not shown:
+            self.stdout.write(f'No profiles in {self.directory}')
+
+    def handle_show(self, options):
+        record = load_profile(self.directory, self.resolve(options))
+        self.stdout.write(
+            f"{record['method']} {record['path']} -> {record['status']} in "
+            f"{record['duration_ms']:.1f} ms, {record['query_count']} queries "
+            f"({record['query_time_ms']:.1f} ms)\n"
+        )
+        for number, query in enumerate(record['queries'], 1):
+            many = ' (executemany)' if query['many'] else ''
+            self.stdout.write(
+                f"{number:3}. {query['duration_ms']:8.3f} ms{many}  "
+                f"{query['sql']}"
+            )
+        self.stdout.write('')
+        self.stdout.write(record['report'])
+
+    def handle_dump(self, options):
+        profile_id = self.resolve(options)
+        output = options['output'] or f'{profile_id}.json'
+        if output.endswith('.prof'):
+            record = load_profile(self.directory, profile_id)
+            if not record.get('raw'):
+                raise CommandError(
+                    f"Profile {profile_id} was taken with {record['engine']} "
+                    "and has no .prof stats"
+                )
+            shutil.copyfile(
+                os.path.join(self.directory, profile_id + '.prof'), output
+            )
+        else:
+            with open(output, 'w', encoding='utf-8') as handle:
+                json.dump(
+                    load_profile(self.directory, profile_id), handle, indent=2
+                )
+        self.stdout.write(f'Wrote {output}')
+
+    def handle_token(self, options):
+        config = get_profiling_config()
+        self.stdout.write(make_token())
+        self.stderr.write(
+            f"Send as `{config['HEADER']}: <token>`; valid for "
+            f"{config['MAX_AGE']} seconds"
+        )
+
+    def handle_clear(self, options):
+        ids = list_profiles(self.directory)
+        for profile_id in ids:
+            delete_profile(self.directory, profile_id)
+        self.stdout.write(f'Deleted {len(ids)} profiles')
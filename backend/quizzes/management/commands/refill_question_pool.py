@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from quizzes.question_pool import (
+    get_pool_config,
+    refill_bucket,
+    retire_exhausted,
+    watched_buckets,
+)
+
+
+class Command(BaseCommand):
+    help = 'Keep the pre-generated question pool between its watermarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run a single refill pass and exit',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=60,
+            help='Seconds between refill passes',
+        )
+        parser.add_argument(
+            '--subject',
+            action='append',
+            default=[],
+            help='Subject to watch (repeatable)',
+        )
+        parser.add_argument(
+            '--top', type=int, help='Also watch the N most requested subjects'
+        )
+
+    def handle(self, *args, **options):
+        config = get_pool_config()
+        if options['subject']:
+            config['SUBJECTS'] = list(config['SUBJECTS']) + options['subject']
+        if options['top'] is not None:
+            config['TOP_SUBJECTS'] = options['top']
+
+        while True:
+            self.refill(config)
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+    def refill(self, config):
+        retired = retire_exhausted(config['MAX_SERVES'])
+        if retired:
+            self.stdout.write(f'Retired {retired} exhausted questions')
+
+        for subject, difficulty in watched_buckets(config):
+            try:
+                added = refill_bucket(subject, difficulty, config)
+            except Exception as e:
+                self.stdout.write(
+                    self.style.ERROR(
+                        f'{subject} / {difficulty}: refill failed: {e}'
+                    )
+                )
+                continue
+            if added:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f'{subject} / {difficulty}: added {added} questions'
+                    )
+                )
@@ -0,0 +1,199 @@
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from quizzes.answer_keys import load_answer_keys
+from quizzes.grading import get_grading_engine
+from quizzes.models import UserQuizHistory
+from quizzes.quiz_service import grade_quizzes
+
+# Answer keys of this many quizzes are kept between chunks before starting over
+MAX_CACHED_KEYS = 20000
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-grade stored quiz attempts with the current grading engine. '
+        'History is streamed in id order and only rows whose score changes '
+        'are written back. Attempts submitted before answers were stored are '
+        'skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=0,
+            help='Grade chunks in this many processes (0 grades in-process)',
+        )
+        parser.add_argument('--start-after', type=int, default=0,
+                            help='Only re-grade attempts with a larger id')
+        parser.add_argument(
+            '--checkpoint',
+            help=(
+                'File recording the last written id; resumed from when it '
+                'exists'
+            ),
+        )
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Grade and report without writing anything')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        self.checkpoint = None if options['dry_run'] else options['checkpoint']
+        start_after = max(options['start_after'], self.read_checkpoint())
+        if start_after:
+            self.stdout.write(f'Resuming after history id {start_after}')
+
+        queryset = (
+            UserQuizHistory.objects.filter(id__gt=start_after)
+            .exclude(answers=[])
+            .order_by('id')
+            .only(
+                'id',
+                'quiz_id',
+                'answers',
+                'score',
+                'score_percentage',
+                'has_certificate',
+            )
+        )
+        self.total = queryset.count()
+        self.dry_run = options['dry_run']
+        self.processed = self.changed = self.skipped = 0
+        self.started = time.perf_counter()
+        self.keys = {}
+
+        executor = (
+            ProcessPoolExecutor(options['workers'])
+            if options['workers'] > 0
+            else None
+        )
+        engine = get_grading_engine()
+        pending = deque()
+        try:
+            for rows in self.chunks(
+                queryset.iterator(chunk_size=chunk_size), chunk_size
+            ):
+                last_id = rows[-1].id
+                rows, submissions = self.prepare(rows)
+                if executor is None:
+                    self.write(rows, grade_quizzes(submissions), last_id)
+                    continue
+                pending.append(
+                    (
+                        rows,
+                        executor.submit(engine.grade_many, submissions),
+                        last_id,
+                    )
+                )
+                # Keep every worker busy without reading the whole table ahead
+                while len(pending) > options['workers'] * 2:
+                    rows, future, last_id = pending.popleft()
+                    self.write(rows, future.result(), last_id)
+            while pending:
+                rows, future, last_id = pending.popleft()
+                self.write(rows, future.result(), last_id)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f'Re-graded {self.processed} attempts, {self.changed} changed, '
+            f'{self.skipped} skipped{" (dry run)" if self.dry_run else ""}'
+        ))
+
+    @staticmethod
+    def chunks(iterable, size):
+        chunk = []
+        for item in iterable:
+            chunk.append(item)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def answer_keys(self, quiz_ids):
+        """Load the answer keys of quizzes not seen yet, in question order."""
+        missing = quiz_ids - self.keys.keys()
+        if not missing:
+            return self.keys
+        if len(self.keys) + len(missing) > MAX_CACHED_KEYS:
+            self.keys = {}
+            missing = quiz_ids
+        loaded = load_answer_keys(missing)
+        for quiz_id in missing:
+            self.keys[quiz_id] = loaded.get(quiz_id, [])
+        return self.keys
+
+    def prepare(self, rows):
+        """
+        Pair each attempt with its answer key, dropping quizzes without
+        questions.
+        """
+        keys = self.answer_keys({row.quiz_id for row in rows})
+        gradable = []
+        for row in rows:
+            if keys[row.quiz_id]:
+                gradable.append(row)
+            else:
+                self.skipped += 1
+        return gradable, [(row.answers, keys[row.quiz_id]) for row in gradable]
+
+    def write(self, rows, grades, last_id):
+        changed = []
+        for row, grade in zip(rows, grades):
+            before = (row.score, row.score_percentage, row.has_certificate)
+            row.set_score(grade.score, grade.total)
+            if (
+                row.score,
+                row.score_percentage,
+                row.has_certificate,
+            ) != before:
+                changed.append(row)
+
+        if changed and not self.dry_run:
+            with transaction.atomic():
+                UserQuizHistory.objects.bulk_update(
+                    changed, ['score', 'score_percentage', 'has_certificate']
+                )
+        # Chunks are written in id order, so the last id of a chunk is a safe
+        # resume point
+        self.write_checkpoint(last_id)
+
+        self.processed += len(rows)
+        self.changed += len(changed)
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(
+            f'{self.processed + self.skipped}/{self.total} attempts  '
+            f'{self.changed} changed  '
+            f'{self.processed / elapsed if elapsed else 0:,.0f}/s  last id '
+            f'{last_id}'
+        )
+
+    def read_checkpoint(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint) as handle:
+            return json.load(handle)['last_id']
+
+    def write_checkpoint(self, last_id):
+        if not self.checkpoint:
+            return
+        # Write then rename so an interrupted run never leaves a truncated file
+        temporary = f'{self.checkpoint}.tmp'
+        with open(temporary, 'w') as handle:
+            json.dump({'last_id': last_id}, handle)
+        os.replace(temporary, self.checkpoint)
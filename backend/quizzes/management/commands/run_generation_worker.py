@@ -0,0 +1,95 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from quizzes.jobs import (
+    claim_next_job, get_job_config, requeue_stale_jobs, run_job,
+)
+
+
+class Command(BaseCommand):
+    help = 'Process queued quiz generation jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Jobs processed concurrently by this worker')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit once the queue is empty instead of polling',
+        )
+
+    def handle(self, *args, **options):
+        self.prepare_recovery()
+        stop = threading.Event()
+        threads = [
+            threading.Thread(
+                target=self.work, args=(stop, options), daemon=True
+            )
+            for _ in range(options['threads'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generation worker started with {options['threads']} threads"
+            )
+        )
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def work(self, stop, options):
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                self.recover_stale_jobs()
+                job = claim_next_job()
+                if job is None:
+                    if options['burst']:
+                        return
+                    stop.wait(options['poll_interval'])
+                    continue
+                started = time.perf_counter()
+                run_job(job)
+                self.stdout.write(
+                    f'Job {job.id} ({job.subject} / {job.difficulty}) '
+                    f'{job.status} in {time.perf_counter() - started:.1f}s'
+                )
+        finally:
+            connection.close()
+
+    def prepare_recovery(self):
+        self.recovery_lock = threading.Lock()
+        # A job counts as stale after STALE_AFTER; checking twice as often is
+        # enough, and keeps idle workers from writing to the table every poll
+        self.recovery_interval = get_job_config()['STALE_AFTER'] / 2
+        self.next_recovery = 0.0
+
+    def recover_stale_jobs(self):
+        """
+        Requeue stale jobs, at most once per recovery interval per process.
+        """
+        with self.recovery_lock:
+            now = time.monotonic()
+            if now < self.next_recovery:
+                return
+            self.next_recovery = now + self.recovery_interval
+        requeued, failed = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale jobs')
+        if failed:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'Failed {failed} stale jobs out of attempts'
+                )
+            )
@@ -0,0 +1,88 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+CHECKPOINT_MODES = ['PASSIVE', 'FULL', 'RESTART', 'TRUNCATE']
+
+
+class Command(BaseCommand):
+    help = (
+        'Checkpoint the SQLite write-ahead log and refresh planner '
+        'statistics. Optionally VACUUM, which rewrites the whole file and '
+        'blocks writers while it runs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true', help='Run a single pass and exit'
+        )
+        parser.add_argument(
+            '--interval', type=int, default=3600, help='Seconds between passes'
+        )
+        parser.add_argument(
+            '--checkpoint-mode', choices=CHECKPOINT_MODES, default='TRUNCATE'
+        )
+        parser.add_argument(
+            '--vacuum', action='store_true', help='Also VACUUM the database'
+        )
+        parser.add_argument(
+            '--skip-analyze',
+            action='store_true',
+            help='Do not refresh statistics',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError(
+                'sqlite_maintenance only applies to SQLite, not '
+                f'{connection.vendor}'
+            )
+
+        while True:
+            self.maintain(options)
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+    def maintain(self, options):
+        path = connection.settings_dict['NAME']
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+            if journal_mode == 'wal':
+                started = time.perf_counter()
+                cursor.execute(
+                    f"PRAGMA wal_checkpoint({options['checkpoint_mode']})"
+                )
+                busy, log_frames, checkpointed = cursor.fetchone()
+                self.stdout.write(
+                    f'Checkpointed {checkpointed}/{log_frames} WAL '
+                    f'frames{" (busy, retry later)" if busy else ""} in '
+                    f'{time.perf_counter() - started:.2f}s'
+                )
+            else:
+                self.stdout.write(
+                    f'Journal mode is {journal_mode}, no WAL to checkpoint'
+                )
+
+            if not options['skip_analyze']:
+                started = time.perf_counter()
+                cursor.execute('ANALYZE')
+                cursor.execute('PRAGMA optimize')
+                self.stdout.write(
+                    f'Analyzed in {time.perf_counter() - started:.2f}s'
+                )
+
+            if options['vacuum']:
+                size = os.path.getsize(path) if os.path.exists(path) else 0
+                started = time.perf_counter()
+                cursor.execute('VACUUM')
+                after = os.path.getsize(path) if os.path.exists(path) else 0
+                self.stdout.write(
+                    f'Vacuumed {size / 1024 / 1024:.1f} MiB -> '
+                    f'{after / 1024 / 1024:.1f} MiB in '
+                    f'{time.perf_counter() - started:.2f}s'
+                )
+        self.stdout.write(self.style.SUCCESS('SQLite maintenance done'))
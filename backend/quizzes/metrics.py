@@ -0,0 +1,387 @@
+"""
+In-process metrics: counters, latency histograms and timing spans.
+
+Values are kept per process and exposed in the Prometheus text format at
+``/metrics`` (see ``metrics_view``). With several gunicorn workers each
+worker reports its own values; scrape them individually or aggregate by
+instance.
+
+``/metrics`` requires ``Authorization: Bearer <TOKEN>``; without a
+configured ``TOKEN`` only loopback callers (e.g. a scraper or ``curl`` on
+the same host or container) may read it.
+
+Instrumentation is switched by ``settings.QUIZ_METRICS['ENABLED']``. When it
+is off, ``span`` returns a shared no-op context manager and the recording
+functions return after a single flag check, so call sites can stay in hot
+paths.
+
+    with span('openai_request'):
+        ...
+    inc('openai_tokens_total', usage.prompt_tokens, model=model, kind='prompt')
+"""
+import bisect
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+DEFAULT_CONFIG = {
+    'ENABLED': True,
+    'TOKEN': None,
+}
+
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+
+# Seconds; spans the range from a cached read to a slow LLM call
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+
+HELP = {
+    'quiz_stage_duration_seconds': 'Time spent in an instrumented stage',
+    'http_request_duration_seconds': 'Request latency by route',
+    'http_requests_total': 'Requests by route, method and status',
+    'http_request_db_queries_total': (
+        'Database queries executed while handling requests, by route'
+    ),
+    'openai_requests_total': 'OpenAI chat completion calls by outcome',
+    'openai_tokens_total': (
+        'OpenAI tokens used, by model and kind (prompt or completion)'
+    ),
+    'openai_retries_total': 'OpenAI calls retried, by error',
+    'openai_guard_rejections_total': (
+        'OpenAI calls refused or not retried, by reason'
+    ),
+    'openai_circuit_opened_total': 'Times the OpenAI circuit breaker opened',
+}
+
+_NOOP = nullcontext()
+
+
+class Registry:
+    """
+    Thread-safe store of counters and histograms keyed by name and labels.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, amount, labels):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Per-bucket counts, then sum and count
+                histogram = self._histograms[key] = [
+                    [0] * len(self.buckets),
+                    0.0,
+                    0,
+                ]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def counter_value(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def histogram_count(self, name, **labels):
+        with self._lock:
+            histogram = self._histograms.get(
+                (name, tuple(sorted(labels.items())))
+            )
+            return histogram[2] if histogram else 0
+
+    def render(self):
+        """Serialize every metric in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: (list(value[0]), value[1], value[2])
+                for key, value in self._histograms.items()
+            }
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f'# HELP {name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {name} counter')
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f'# HELP {name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {name} histogram')
+            for (metric, labels), (counts, total, count) in sorted(
+                histograms.items()
+            ):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    bucket = labels + (('le', repr(float(bound))),)
+                    lines.append(
+                        f'{name}_bucket{format_labels(bucket)} {cumulative}'
+                    )
+                bucket = labels + (('le', '+Inf'),)
+                lines.append(
+                    f'{name}_bucket{format_labels(bucket)} {count}'
+                )
+                lines.append(f'{name}_sum{format_labels(labels)} {total}')
+                lines.append(f'{name}_count{format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (
+            key,
+            str(value)
+            .replace('\\', '\\\\')
+            .replace('"', '\\"')
+            .replace('\n', '\\n'),
+        )
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+registry = Registry()
+_config = None
+
+
+def get_metrics_config():
+    global _config
+    if _config is None:
+        _config = dict(DEFAULT_CONFIG, **getattr(settings, 'QUIZ_METRICS', {}))
+    return _config
+
+
+def is_enabled():
+    return get_metrics_config()['ENABLED']
+
+
+def reset_metrics():
+    """Clear recorded values and re-read settings."""
+    global _config
+    _config = None
+    registry.clear()
+
+
+def inc(name, amount=1, **labels):
+    if is_enabled():
+        registry.inc(name, amount, tuple(sorted(labels.items())))
+
+
+def observe(name, value, **labels):
+    if is_enabled():
+        registry.observe(name, value, tuple(sorted(labels.items())))
+
+
+class _Span:
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        registry.observe(
+            'quiz_stage_duration_seconds',
+            time.perf_counter() - self.started,
+            (('stage', self.stage),),
+        )
+        return False
+
+
+def span(stage):
+    """Time a block into ``quiz_stage_duration_seconds{stage=...}``."""
+    if not is_enabled():
+        return _NOOP
+    return _Span(stage)
+
+
+def record_token_usage(usage, model):
+    """
+    Count the tokens reported in an OpenAI ``usage`` object (may be None).
+    """
+    if usage is None or not is_enabled():
+        return
+    inc(
+        'openai_tokens_total',
+        int(usage.prompt_tokens or 0),
+        model=model,
+        kind='prompt',
+    )
+    inc(
+        'openai_tokens_total',
+        int(usage.completion_tokens or 0),
+        model=model,
+        kind='completion',
+    )
+
+
+class _QueryCounter:
+    __slots__ = ('count',)
+
+    def __init__(self):
+        self.count = 0
+
+
+# The counter of the request being handled. sync_to_async copies the context
+# into the thread that runs the ORM call, so queries made there are counted
+# too.
+_request_queries = ContextVar('metrics_request_queries', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _request_queries.get()
+    if counter is not None:
+        counter.count += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(connection, **kwargs):
+    """Add the query counter to a connection's execute wrappers (once)."""
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+# Every thread has its own connection; count on each as it is opened
+connection_created.connect(install_query_counter)
+
+
+class MetricsMiddleware:
+    """
+    Per-route latency histogram, request counter and query counter.
+
+    Sync and async capable, so async views are not pushed onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not is_enabled():
+            return self.get_response(request)
+
+        # This thread's connection may have been opened before the signal was
+        # connected
+        install_query_counter(connection)
+        queries = _QueryCounter()
+        token = _request_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self.record(
+            request, response, time.perf_counter() - started, queries.count
+        )
+        return response
+
+    async def __acall__(self, request):
+        if not is_enabled():
+            return await self.get_response(request)
+
+        # Queries run on sync_to_async threads, each counted by its own
+        # connection's wrapper
+        queries = _QueryCounter()
+        token = _request_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self.record(
+            request, response, time.perf_counter() - started, queries.count
+        )
+        return response
+
+    @staticmethod
+    def record(request, response, elapsed, query_count):
+        match = getattr(request, 'resolver_match', None)
+        # The URL pattern, not the path, keeps label cardinality bounded
+        route = match.route if match else 'unmatched'
+        observe(
+            'http_request_duration_seconds',
+            elapsed,
+            route=route,
+            method=request.method,
+        )
+        inc(
+            'http_requests_total',
+            route=route,
+            method=request.method,
+            status=response.status_code,
+        )
+        inc('http_request_db_queries_total', query_count, route=route)
+
+
+def metrics_view(request):
+    """
+    Expose the registry.
+
+    Requires ``Authorization: Bearer <TOKEN>``, or a loopback caller when no
+    token is configured: routes, volumes and token usage are not public.
+    """
+    token = get_metrics_config()['TOKEN']
+    if token:
+        allowed = constant_time_compare(
+            request.headers.get('Authorization', ''), f'Bearer {token}'
+        )
+    else:
+        allowed = request.META.get('REMOTE_ADDR') in LOOPBACK_ADDRESSES
+    if not allowed:
+        return HttpResponseForbidden('Forbidden\n')
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
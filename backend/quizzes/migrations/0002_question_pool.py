@@ -0,0 +1,61 @@
+# Generated by Django 5.2 on 2026-10-18 17:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PoolQuestion',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('subject', models.CharField(max_length=255)),
+                (
+                    'difficulty',
+                    models.CharField(
+                        choices=[
+                            ('easy', 'Easy'),
+                            ('medium', 'Medium'),
+                            ('hard', 'Hard'),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ('text', models.TextField()),
+                ('answer', models.TextField()),
+                ('served_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                (
+                    'served_to',
+                    models.ManyToManyField(
+                        blank=True,
+                        related_name='served_pool_questions',
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                'indexes': [
+                    models.Index(
+                        fields=['subject', 'difficulty'],
+                        name='quizzes_poo_subject_a3ad9b_idx',
+                    )
+                ],
+            },
+        ),
+    ]
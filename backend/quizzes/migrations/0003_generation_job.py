@@ -0,0 +1,104 @@
+# Generated by Django 5.2 on 2026-10-18 18:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0002_question_pool'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationJob',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('subject', models.CharField(max_length=255)),
+                (
+                    'difficulty',
+                    models.CharField(
+                        choices=[
+                            ('easy', 'Easy'),
+                            ('medium', 'Medium'),
+                            ('hard', 'Hard'),
+                        ],
+                        default='medium',
+                        max_length=10,
+                    ),
+                ),
+                ('num_questions', models.PositiveIntegerField(default=10)),
+                ('dedupe_key', models.CharField(max_length=80)),
+                (
+                    'status',
+                    models.CharField(
+                        choices=[
+                            ('pending', 'Pending'),
+                            ('running', 'Running'),
+                            ('done', 'Done'),
+                            ('failed', 'Failed'),
+                        ],
+                        default='pending',
+                        max_length=10,
+                    ),
+                ),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=3)),
+                (
+                    'run_after',
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                (
+                    'quiz',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to='quizzes.quiz',
+                    ),
+                ),
+                (
+                    'user',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                'indexes': [
+                    models.Index(
+                        fields=['status', 'run_after'],
+                        name='quizzes_gen_status_b2d467_idx',
+                    )
+                ],
+                'constraints': [
+                    models.UniqueConstraint(
+                        condition=models.Q(
+                            ('status__in', ['pending', 'running'])
+                        ),
+                        fields=('dedupe_key',),
+                        name='unique_in_flight_generation_job',
+                    )
+                ],
+            },
+        ),
+    ]
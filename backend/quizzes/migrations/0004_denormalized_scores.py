@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 18:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0003_generation_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userquizhistory',
+            name='has_certificate',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userquizhistory',
+            name='score_percentage',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
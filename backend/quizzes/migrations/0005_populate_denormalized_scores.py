@@ -0,0 +1,60 @@
+from django.db import migrations
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+CERTIFICATE_THRESHOLD = 80
+BATCH_SIZE = 2000
+
+
+def populate(apps, schema_editor):
+    Quiz = apps.get_model('quizzes', 'Quiz')
+    Question = apps.get_model('quizzes', 'Question')
+    UserQuizHistory = apps.get_model('quizzes', 'UserQuizHistory')
+
+    counts = (
+        Question.objects.filter(quiz=OuterRef('pk'))
+        .order_by()
+        .values('quiz')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    Quiz.objects.update(
+        question_count=Coalesce(
+            Subquery(counts, output_field=IntegerField()), Value(0)
+        )
+    )
+
+    batch = []
+    histories = UserQuizHistory.objects.select_related('quiz').only(
+        'score', 'quiz__question_count'
+    )
+    for history in histories.iterator(chunk_size=BATCH_SIZE):
+        total = history.quiz.question_count
+        history.score_percentage = (
+            round((history.score / total) * 100) if total > 0 else 0
+        )
+        # Exact, as in UserQuizHistory.set_score: 79.5% does not pass
+        history.has_certificate = (
+            total > 0 and history.score * 100 >= CERTIFICATE_THRESHOLD * total
+        )
+        batch.append(history)
+        if len(batch) >= BATCH_SIZE:
+            UserQuizHistory.objects.bulk_update(
+                batch, ['score_percentage', 'has_certificate']
+            )
+            batch = []
+    if batch:
+        UserQuizHistory.objects.bulk_update(
+            batch, ['score_percentage', 'has_certificate']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0004_denormalized_scores'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 18:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0005_populate_denormalized_scores'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userquizhistory',
+            index=models.Index(
+                condition=models.Q(('has_certificate', True)),
+                fields=['user', '-completed_at'],
+                name='history_certificates_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 18:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0006_certificate_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userquizhistory',
+            name='answers',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
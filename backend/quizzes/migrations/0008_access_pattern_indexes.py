@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 18:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0007_history_answers'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(
+                fields=['quiz', 'id'], name='question_quiz_order_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(
+                fields=['-created_at', '-id'], name='quiz_recent_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='userquizhistory',
+            index=models.Index(
+                fields=['user', '-completed_at', '-id'],
+                name='history_user_recent_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index LOWER(email) on auth_user so logins and registration match emails
+    case-insensitively without a table scan. auth.User belongs to Django, so
+    the expression index is created with SQL rather than Meta.indexes.
+    """
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('quizzes', '0008_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                'CREATE INDEX IF NOT EXISTS auth_user_email_lower_idx '
+                'ON auth_user (LOWER(email));'
+            ),
+            reverse_sql='DROP INDEX IF EXISTS auth_user_email_lower_idx;',
+        ),
+    ]
@@ -1,5 +1,43 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .metrics import span
+
+class QuizManager(models.Manager):
+    def create_with_questions(self, subject, difficulty, questions_data):
+        """
+        Create a quiz and all of its questions in one transaction.
+        
+        Questions are written with a single multi-row INSERT, so a quiz costs
+        two statements and one commit regardless of its size, and a failure
+        never leaves a partially written quiz behind.
+        
+        Args:
+            subject (str): The subject of the quiz
+            difficulty (str): The difficulty level (easy, medium, hard)
+            questions_data (list): Dictionaries with question text and answer
+            
+        Returns:
+            Quiz: The saved quiz
+        """
+        with span('db_insert'), transaction.atomic(using=self.db):
+            quiz = self.create(
+                subject=subject,
+                difficulty=difficulty,
+                question_count=len(questions_data),
+            )
+            Question.objects.using(self.db).bulk_create(
+                [
+                    Question(
+                        quiz=quiz,
+                        text=question_data['text'],
+                        answer=question_data['answer'],
+                    )
+                    for question_data in questions_data
+                ]
+            )
+        return quiz
 
 class Quiz(models.Model):
     DIFFICULTY_CHOICES = [
@@ -10,8 +48,20 @@ class Quiz(models.Model):
     
     subject = models.CharField(max_length=255)
     difficulty = models.CharField(max_length=10, choices=DIFFICULTY_CHOICES, default='medium')
+    # Denormalized number of questions so listings need no COUNT per row
+    question_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = QuizManager()
+    
+    class Meta:
+        indexes = [
+            # Serves the quiz listing in cursor pagination order
+            models.Index(
+                fields=['-created_at', '-id'], name='quiz_recent_idx'
+            ),
+        ]
+    
     def __str__(self):
         return f"{self.subject} - {self.difficulty} - {self.created_at.strftime('%Y-%m-%d')}"
 
@@ -21,14 +71,147 @@ class Question(models.Model):
     answer = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Serves answer keys and quiz detail: a quiz's questions in id
+            # order
+            models.Index(
+                fields=['quiz', 'id'], name='question_quiz_order_idx'
+            ),
+        ]
+    
     def __str__(self):
         return self.text[:50]
 
 class UserQuizHistory(models.Model):
+    # Minimum score percentage that earns a certificate
+    CERTIFICATE_THRESHOLD = 80
+    
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
     score = models.IntegerField()
+    # Stored at submit time so listings never have to count questions
+    score_percentage = models.PositiveSmallIntegerField(default=0)
+    has_certificate = models.BooleanField(default=False)
+    # Submitted answers, in question order, so attempts can be re-graded
+    answers = models.JSONField(default=list, blank=True)
     completed_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Serves the history listing: one user's attempts, newest first
+            # (cursor order)
+            models.Index(
+                fields=['user', '-completed_at', '-id'],
+                name='history_user_recent_idx',
+            ),
+            # Serves the certificates listing: one user's passing attempts,
+            # newest first
+            models.Index(
+                fields=['user', '-completed_at'],
+                condition=models.Q(has_certificate=True),
+                name='history_certificates_idx',
+            ),
+        ]
+    
+    @classmethod
+    def percentage(cls, score, total_questions):
+        """Rounded score percentage, 0 for a quiz without questions."""
+        if total_questions > 0:
+            return round((score / total_questions) * 100)
+        return 0
+    
+    def set_score(self, score, total_questions):
+        """
+        Set the score along with the derived percentage and certificate flag.
+        """
+        self.score = score
+        self.score_percentage = self.percentage(score, total_questions)
+        # Compared exactly, not on the rounded percentage: 79.5% does not earn
+        # one
+        self.has_certificate = (
+            total_questions > 0
+            and score * 100 >= self.CERTIFICATE_THRESHOLD * total_questions
+        )
+    
     def __str__(self):
         return f"{self.user.username} - {self.quiz.subject} - {self.score}/10"
+
+class PoolQuestion(models.Model):
+    """
+    A pre-generated question waiting to be served from the question pool.
+    
+    ``subject`` is stored normalized (see ``question_cache.normalize_subject``)
+    so every spelling of a subject shares one bucket.
+    """
+    subject = models.CharField(max_length=255)
+    difficulty = models.CharField(
+        max_length=10, choices=Quiz.DIFFICULTY_CHOICES
+    )
+    text = models.TextField()
+    answer = models.TextField()
+    served_count = models.PositiveIntegerField(default=0)
+    served_to = models.ManyToManyField(
+        User, related_name='served_pool_questions', blank=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [models.Index(fields=['subject', 'difficulty'])]
+    
+    def __str__(self):
+        return f"{self.subject} - {self.difficulty} - {self.text[:50]}"
+
+class GenerationJob(models.Model):
+    """
+    A queued quiz generation, processed by ``run_generation_worker``.
+    
+    ``dedupe_key`` is the content address of the request and its owner; at
+    most one job per key can be pending or running at a time.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    user = models.ForeignKey(
+        User, null=True, blank=True, on_delete=models.SET_NULL
+    )
+    subject = models.CharField(max_length=255)
+    difficulty = models.CharField(
+        max_length=10, choices=Quiz.DIFFICULTY_CHOICES, default='medium'
+    )
+    num_questions = models.PositiveIntegerField(default=10)
+    dedupe_key = models.CharField(max_length=80)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    quiz = models.ForeignKey(
+        Quiz, null=True, blank=True, on_delete=models.SET_NULL
+    )
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='unique_in_flight_generation_job',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject} - {self.difficulty} - {self.status}"
@@ -0,0 +1,96 @@
+"""
+Process-wide OpenAI clients.
+
+Building a client per call throws away the underlying HTTP connection pool,
+so every generation paid for a fresh TCP/TLS handshake. The clients here are
+created once per process (and, for the async client, once per event loop,
+since httpx connection pools cannot be shared between loops) and keep their
+connections alive between requests.
+"""
+import asyncio
+import threading
+import weakref
+
+import httpx
+import openai
+from django.conf import settings
+
+_lock = threading.Lock()
+_client = None
+_async_clients = weakref.WeakKeyDictionary()
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def _client_options():
+    return {
+        'api_key': settings.OPENAI_API_KEY,
+        'base_url': getattr(settings, 'OPENAI_BASE_URL', None),
+        'timeout': httpx.Timeout(
+            getattr(settings, 'OPENAI_TIMEOUT', 60),
+            connect=getattr(settings, 'OPENAI_CONNECT_TIMEOUT', 5),
+        ),
+        # Retries are made by quizzes.openai_guard, which budgets them across
+        # workers
+        'max_retries': 0,
+    }
+
+
+def _limits():
+    max_connections = getattr(settings, 'OPENAI_MAX_CONNECTIONS', 20)
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=30,
+    )
+
+
+def get_client():
+    """Return the shared synchronous OpenAI client."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = openai.OpenAI(
+                    http_client=openai.DefaultHttpxClient(limits=_limits()),
+                    **_client_options()
+                )
+    return _client
+
+
+def get_async_client():
+    """Return the shared AsyncOpenAI client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = openai.AsyncOpenAI(
+            http_client=openai.DefaultAsyncHttpxClient(limits=_limits()),
+            **_client_options()
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def get_concurrency_limit():
+    """
+    Return the semaphore bounding in-flight async OpenAI calls on this loop.
+
+    The limit is ``settings.OPENAI_MAX_CONCURRENCY``; callers beyond it wait
+    for a slot instead of opening more upstream requests.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(
+            getattr(settings, 'OPENAI_MAX_CONCURRENCY', 20)
+        )
+        _semaphores[loop] = semaphore
+    return semaphore
+
+
+def reset_clients():
+    """Forget the shared clients so the next call re-reads settings."""
+    global _client
+    with _lock:
+        _client = None
+        _async_clients.clear()
+        _semaphores.clear()
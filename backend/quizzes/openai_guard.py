@@ -0,0 +1,392 @@
+"""
+Rate limiting, retries and a circuit breaker around OpenAI calls.
+
+``UpstreamGuard.call`` (and ``acall`` for coroutines) wraps a single client
+call with, in order:
+
+    - a circuit breaker: after ``BREAKER_THRESHOLD`` consecutive upstream
+      failures, calls fail fast with ``CircuitOpen`` for
+      ``BREAKER_RESET_TIMEOUT`` seconds. After that one probe call is let
+      through, and its outcome closes or re-opens the circuit.
+    - a token bucket of ``RATE_LIMIT`` calls per second (``BURST`` deep).
+      A caller that would wait longer than ``RATE_LIMIT_MAX_WAIT`` gets
+      ``RateLimited`` instead.
+    - up to ``MAX_RETRIES`` retries of timeouts, connection errors, 429s and
+      5xx responses, with exponential backoff and full jitter (longer when
+      the upstream sends ``Retry-After``). Retries draw from a retry budget
+      that each first attempt refills by ``RETRY_BUDGET_RATIO``, so a failing
+      upstream sees at most that fraction of extra traffic.
+
+Breaker, bucket and budget live in one small JSON file (``STATE_FILE``)
+updated under ``flock``, so every worker process on the host shares them.
+On platforms without ``fcntl`` the state is per process. ``acall`` makes
+these updates in a worker thread, never on the event loop.
+
+``UpstreamGuard.stream`` does the same for a call that returns a stream,
+and only settles the call's outcome once the stream has been read: an error
+while reading it counts as a failure (it is not retried, as part of the
+response has already been used).
+
+Other errors (bad requests, authentication) are raised straight away and do
+not count against the upstream's health; a half-open probe that ends that way
+only releases the probe slot, so the next call probes again.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+import openai
+from django.conf import settings
+
+from .metrics import inc
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock
+    fcntl = None
+
+DEFAULT_CONFIG = {
+    'RATE_LIMIT': 0,
+    'BURST': 10,
+    'RATE_LIMIT_MAX_WAIT': 10,
+    'MAX_RETRIES': 2,
+    'RETRY_BASE_DELAY': 0.5,
+    'RETRY_MAX_DELAY': 8,
+    'RETRY_BUDGET_RATIO': 0.1,
+    'RETRY_BUDGET_MAX': 10,
+    'BREAKER_THRESHOLD': 5,
+    'BREAKER_RESET_TIMEOUT': 30,
+    'STATE_FILE': None,
+}
+
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # Includes APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class UpstreamUnavailable(Exception):
+    """
+    The call was not attempted because the upstream is unhealthy or saturated.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+class RateLimited(UpstreamUnavailable):
+    pass
+
+
+class SharedState:
+    """
+    A JSON document read and written atomically by every process on the host.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._local = {}
+
+    @contextlib.contextmanager
+    def update(self):
+        """
+        Yield the state dict; changes are saved when the block exits.
+
+        The file is only rewritten when the state changed, so the common case
+        (closed circuit, full retry budget, no rate limit) is a locked read.
+        """
+        with self._lock:
+            if fcntl is None:
+                yield self._local
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a+') as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    handle.seek(0)
+                    saved = handle.read()
+                    try:
+                        state = json.loads(saved or '{}')
+                    except json.JSONDecodeError:
+                        state = {}
+                    yield state
+                    updated = json.dumps(state)
+                    if updated != saved:
+                        handle.seek(0)
+                        handle.truncate()
+                        handle.write(updated)
+                        handle.flush()
+                finally:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+class UpstreamGuard:
+    """Apply the breaker, rate limit and retry policy to upstream calls."""
+
+    def __init__(self, config, state):
+        self.config = config
+        self.state = state
+
+    def admit(self, first_attempt, now=None):
+        """
+        Check the breaker and take a rate-limit token in one state update.
+
+        Returns:
+            float: 0 when the call may proceed, else seconds to wait for a
+                token
+
+        Raises:
+            CircuitOpen: While the circuit is open or a probe is in flight
+        """
+        config = self.config
+        now = time.time() if now is None else now
+        with self.state.update() as state:
+            open_until = state.get('open_until', 0)
+            if open_until:
+                if now < open_until:
+                    raise CircuitOpen(
+                        'OpenAI circuit is open', open_until - now
+                    )
+                if state.get('probe_until', 0) > now:
+                    raise CircuitOpen(
+                        'OpenAI circuit is half-open and probing',
+                        state['probe_until'] - now,
+                    )
+
+            if config['RATE_LIMIT']:
+                tokens = min(
+                    config['BURST'],
+                    state.get('tokens', config['BURST'])
+                    + (now - state.get('refilled_at', now))
+                    * config['RATE_LIMIT'],
+                )
+                state['refilled_at'] = now
+                if tokens < 1:
+                    state['tokens'] = tokens
+                    return (1 - tokens) / config['RATE_LIMIT']
+                state['tokens'] = tokens - 1
+
+            if open_until:
+                # Half-open: this call is the probe; hold others off while it
+                # runs
+                state['probe_until'] = now + getattr(
+                    settings, 'OPENAI_TIMEOUT', 60
+                )
+            if first_attempt:
+                state['retry_budget'] = min(
+                    config['RETRY_BUDGET_MAX'],
+                    state.get('retry_budget', config['RETRY_BUDGET_MAX'])
+                    + config['RETRY_BUDGET_RATIO'],
+                )
+        return 0
+
+    def withdraw_retry(self):
+        with self.state.update() as state:
+            budget = state.get('retry_budget', self.config['RETRY_BUDGET_MAX'])
+            if budget < 1:
+                return False
+            state['retry_budget'] = budget - 1
+        return True
+
+    def record_success(self):
+        with self.state.update() as state:
+            if state.get('failures') or state.get('open_until'):
+                state.update(failures=0, open_until=0, probe_until=0)
+
+    def release_probe(self):
+        """
+        Let the next call probe again after a call that proved nothing about
+        the upstream.
+        """
+        with self.state.update() as state:
+            if state.get('probe_until'):
+                state['probe_until'] = 0
+
+    def record_failure(self, now=None):
+        now = time.time() if now is None else now
+        with self.state.update() as state:
+            failures = state.get('failures', 0) + 1
+            state['failures'] = failures
+            if (
+                state.get('open_until')
+                or failures >= self.config['BREAKER_THRESHOLD']
+            ):
+                if not state.get('open_until') or state.get('probe_until'):
+                    inc('openai_circuit_opened_total')
+                state.update(
+                    open_until=now + self.config['BREAKER_RESET_TIMEOUT'],
+                    probe_until=0,
+                )
+
+    def retry_delay(self, attempt, error):
+        ceiling = min(
+            self.config['RETRY_MAX_DELAY'],
+            self.config['RETRY_BASE_DELAY'] * 2**attempt,
+        )
+        delay = random.uniform(0, ceiling)
+        response = getattr(error, 'response', None)
+        if response is not None:
+            try:
+                delay = max(
+                    delay, float(response.headers.get('retry-after', 0))
+                )
+            except ValueError:
+                pass
+        return min(delay, self.config['RETRY_MAX_DELAY'])
+
+    def _try_admit(self, first_attempt, waited):
+        """
+        ``admit`` for a caller that has already waited ``waited`` seconds.
+
+        Returns:
+            float: 0 when admitted, else seconds to sleep before trying again
+        """
+        try:
+            wait = self.admit(first_attempt)
+        except CircuitOpen:
+            inc('openai_guard_rejections_total', reason='circuit_open')
+            raise
+        if wait and waited + wait > self.config['RATE_LIMIT_MAX_WAIT']:
+            inc('openai_guard_rejections_total', reason='rate_limited')
+            raise RateLimited('OpenAI rate limit reached', wait)
+        return wait
+
+    def _should_retry(self, attempt, error):
+        if attempt >= self.config['MAX_RETRIES']:
+            return False
+        if not self.withdraw_retry():
+            inc('openai_guard_rejections_total', reason='retry_budget')
+            return False
+        inc('openai_retries_total', error=type(error).__name__)
+        return True
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Call ``fn(*args, **kwargs)`` under the guard's policy.
+
+        Raises:
+            UpstreamUnavailable: If the call was refused without reaching
+                OpenAI
+            Exception: The last upstream error once retries are exhausted
+        """
+        result = self._attempt(fn, *args, **kwargs)
+        self.record_success()
+        return result
+
+    def stream(self, fn, *args, **kwargs):
+        """
+        Call ``fn(*args, **kwargs)`` like ``call`` and yield from the iterable
+        it returns, recording the outcome once the iterable is exhausted.
+        """
+        chunks = self._attempt(fn, *args, **kwargs)
+        try:
+            yield from chunks
+        except RETRYABLE_ERRORS:
+            self.record_failure()
+            raise
+        except BaseException:
+            # Also when the caller stops reading early
+            self.release_probe()
+            raise
+        self.record_success()
+
+    def _attempt(self, fn, *args, **kwargs):
+        """
+        ``call`` without recording a success, which is left to the caller.
+        """
+        attempt = 0
+        while True:
+            waited = 0.0
+            while wait := self._try_admit(attempt == 0, waited):
+                time.sleep(wait)
+                waited += wait
+            try:
+                result = fn(*args, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                self.record_failure()
+                if not self._should_retry(attempt, e):
+                    raise
+                time.sleep(self.retry_delay(attempt, e))
+                attempt += 1
+                continue
+            except BaseException:
+                self.release_probe()
+                raise
+            return result
+
+    async def acall(self, fn, *args, **kwargs):
+        """
+        Async variant of ``call`` for coroutine functions.
+
+        State updates block on a file lock and do file I/O, so they run in a
+        worker thread rather than on the event loop.
+        """
+        attempt = 0
+        while True:
+            waited = 0.0
+            while wait := await asyncio.to_thread(
+                self._try_admit, attempt == 0, waited
+            ):
+                await asyncio.sleep(wait)
+                waited += wait
+            try:
+                result = await fn(*args, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                await asyncio.to_thread(self.record_failure)
+                if not await asyncio.to_thread(self._should_retry, attempt, e):
+                    raise
+                await asyncio.sleep(self.retry_delay(attempt, e))
+                attempt += 1
+                continue
+            except BaseException:
+                # Also on cancellation; the release itself must not be
+                # cancelled
+                await asyncio.shield(asyncio.to_thread(self.release_probe))
+                raise
+            await asyncio.to_thread(self.record_success)
+            return result
+
+
+_guard = None
+_guard_lock = threading.Lock()
+
+
+def get_guard_config():
+    config = dict(DEFAULT_CONFIG, **getattr(settings, 'OPENAI_RESILIENCE', {}))
+    if not config['STATE_FILE']:
+        config['STATE_FILE'] = os.path.join(
+            tempfile.gettempdir(), 'quizz-openai-guard.json'
+        )
+    return config
+
+
+def get_guard():
+    """Return the process-wide guard, building it on first use."""
+    global _guard
+    if _guard is None:
+        with _guard_lock:
+            if _guard is None:
+                config = get_guard_config()
+                _guard = UpstreamGuard(
+                    config, SharedState(config['STATE_FILE'])
+                )
+    return _guard
+
+
+def reset_guard():
+    """Drop the process-wide guard so the next call re-reads settings."""
+    global _guard
+    with _guard_lock:
+        _guard = None
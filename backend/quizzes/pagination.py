@@ -0,0 +1,19 @@
+from rest_framework.pagination import CursorPagination
+
+
+class QuizCursorPagination(CursorPagination):
+    """
+    Keyset pagination over quizzes, newest first.
+
+    Cursor pages cost the same however deep the client scrolls, unlike
+    OFFSET-based pages, and stay stable while new quizzes are created.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class HistoryCursorPagination(QuizCursorPagination):
+    """Keyset pagination over quiz attempts, most recent first."""
+    ordering = ('-completed_at', '-id')
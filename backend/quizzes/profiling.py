@@ -0,0 +1,356 @@
+"""
+Opt-in per-request profiling.
+
+With ``settings.QUIZ_PROFILING['ENABLED']`` set, ``ProfilingMiddleware``
+profiles a request when either:
+
+    - it carries the ``HEADER`` header with a value from
+      ``python manage.py profiles token`` (signed with SECRET_KEY and valid
+      for ``MAX_AGE`` seconds), or
+    - it is picked by the ``SAMPLE_RATE`` random sample.
+
+Each profile records the call stacks (cProfile, or pyinstrument with
+``ENGINE = 'pyinstrument'``) and every SQL statement with its duration.
+Query parameters are never stored. Profiles are written to ``DIR`` as JSON,
+plus a ``.prof`` stats file for cProfile, and only the newest
+``MAX_PROFILES`` are kept. Use the ``profiles`` command to list and dump them.
+
+Only one request per process is profiled at a time; others run normally.
+Streaming bodies are produced after the middleware returns and are not
+covered. When profiling is disabled the middleware removes itself from the
+stack at startup.
+
+The middleware is sync and async capable, so under ASGI requests are
+profiled in the same execution model as in production. Queries are recorded
+in whichever thread runs them; cProfile only sees the event loop's thread
+(where other requests' coroutines also run), so ORM calls made through
+``sync_to_async`` appear as awaits. pyinstrument attributes awaited time to
+the awaiting coroutine.
+"""
+import asyncio
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import secrets
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'ENABLED': False,
+    'SAMPLE_RATE': 0.0,
+    'HEADER': 'X-Debug-Profile',
+    'MAX_AGE': 60 * 60,
+    'ENGINE': 'cprofile',
+    'DIR': None,
+    'MAX_PROFILES': 200,
+    'STATS_LIMIT': 60,
+}
+
+ENGINES = ('cprofile', 'pyinstrument')
+TOKEN_SALT = 'quizzes.profiling'
+TOKEN_VALUE = 'profile'
+
+
+def get_profiling_config():
+    config = dict(DEFAULT_CONFIG, **getattr(settings, 'QUIZ_PROFILING', {}))
+    if not config['DIR']:
+        config['DIR'] = os.path.join(tempfile.gettempdir(), 'quizz-profiles')
+    return config
+
+
+def make_token():
+    """Header value that forces profiling until it expires."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(TOKEN_VALUE)
+
+
+def valid_token(value, max_age):
+    try:
+        return (
+            signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+                value, max_age=max_age
+            )
+            == TOKEN_VALUE
+        )
+    except signing.BadSignature:
+        return False
+
+
+class QueryRecorder:
+    """``execute_wrapper`` that records each statement and how long it took."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                {
+                    'sql': sql,
+                    'many': many,
+                    'duration_ms': round(
+                        (time.perf_counter() - started) * 1000, 3
+                    ),
+                }
+            )
+
+
+# The recorder of the request being profiled. sync_to_async copies the context
+# into the threads that run ORM calls, so their queries are recorded too.
+_request_recorder = ContextVar('profiling_query_recorder', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    recorder = _request_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection, **kwargs):
+    """Add the query recorder to a connection's execute wrappers (once)."""
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+class CProfiler:
+    name = 'cprofile'
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def report(self):
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats(
+            'cumulative'
+        ).print_stats(self.limit)
+        return out.getvalue()
+
+    def save_raw(self, path):
+        self.profile.dump_stats(path)
+        return True
+
+
+class PyInstrumentProfiler:
+    name = 'pyinstrument'
+
+    def __init__(self, limit):
+        from pyinstrument import Profiler
+        self.profile = Profiler()
+
+    def start(self):
+        self.profile.start()
+
+    def stop(self):
+        self.profile.stop()
+
+    def report(self):
+        return self.profile.output_text(unicode=False, color=False)
+
+    def save_raw(self, path):
+        return False
+
+
+PROFILERS = {'cprofile': CProfiler, 'pyinstrument': PyInstrumentProfiler}
+
+
+def list_profiles(directory):
+    """Profile ids in ``directory``, oldest first."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(
+        name[: -len('.json')] for name in names if name.endswith('.json')
+    )
+
+
+def load_profile(directory, profile_id):
+    with open(
+        os.path.join(directory, profile_id + '.json'), encoding='utf-8'
+    ) as handle:
+        return json.load(handle)
+
+
+def delete_profile(directory, profile_id):
+    for suffix in ('.json', '.prof'):
+        try:
+            os.unlink(os.path.join(directory, profile_id + suffix))
+        except FileNotFoundError:
+            pass
+
+
+def write_profile(directory, record, profiler, max_profiles):
+    """Store a profile and drop the oldest ones beyond ``max_profiles``."""
+    os.makedirs(directory, exist_ok=True)
+    profile_id = record['id']
+    record['raw'] = profiler.save_raw(
+        os.path.join(directory, profile_id + '.prof')
+    )
+
+    # Write then rename, so `profiles list` never reads a partial file
+    fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as handle:
+        json.dump(record, handle)
+    os.replace(temporary, os.path.join(directory, profile_id + '.json'))
+
+    for stale in list_profiles(directory)[:-max_profiles]:
+        delete_profile(directory, stale)
+    return profile_id
+
+
+class ProfilingMiddleware:
+    """
+    Profile sampled or explicitly requested requests (see module docstring).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.config = get_profiling_config()
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+        if self.config['ENGINE'] not in ENGINES:
+            raise ImproperlyConfigured(
+                f"QUIZ_PROFILING['ENGINE'] must be one of {', '.join(ENGINES)}"
+            )
+        if self.config['ENGINE'] == 'pyinstrument':
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError:
+                raise ImproperlyConfigured(
+                    "QUIZ_PROFILING['ENGINE'] = 'pyinstrument' requires `pip "
+                    "install pyinstrument`"
+                )
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.profiler_class = PROFILERS[self.config['ENGINE']]
+        self.lock = threading.Lock()
+
+    def trigger(self, request):
+        value = request.headers.get(self.config['HEADER'])
+        if value and valid_token(value, self.config['MAX_AGE']):
+            return 'header'
+        if (
+            self.config['SAMPLE_RATE']
+            and random.random() < self.config['SAMPLE_RATE']
+        ):
+            return 'sample'
+        return None
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        trigger = self.trigger(request)
+        if trigger is None or not self.lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request, trigger)
+        finally:
+            self.lock.release()
+
+    async def __acall__(self, request):
+        trigger = self.trigger(request)
+        if trigger is None or not self.lock.acquire(blocking=False):
+            return await self.get_response(request)
+        try:
+            return await self.aprofile(request, trigger)
+        finally:
+            self.lock.release()
+
+    def profile(self, request, trigger):
+        # This thread's connection may predate the connection_created receiver
+        install_query_recorder(connection)
+        profiler = self.profiler_class(self.config['STATS_LIMIT'])
+        queries = QueryRecorder()
+        token = _request_recorder.set(queries)
+        started_at = time.time()
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+            _request_recorder.reset(token)
+        duration = time.perf_counter() - started
+        self.save(request, response, trigger, profiler, queries.queries,
+                  started_at, duration)
+        return response
+
+    async def aprofile(self, request, trigger):
+        profiler = self.profiler_class(self.config['STATS_LIMIT'])
+        queries = QueryRecorder()
+        token = _request_recorder.set(queries)
+        started_at = time.time()
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.stop()
+            _request_recorder.reset(token)
+        duration = time.perf_counter() - started
+        # Reports and files are written off the event loop
+        await asyncio.to_thread(
+            self.save, request, response, trigger, profiler, queries.queries,
+            started_at, duration,
+        )
+        return response
+
+    def save(self, request, response, trigger, profiler, queries, started_at,
+             duration):
+        """Store the profile and point the response at it."""
+        record = {
+            'id': f'{int(started_at * 1000):013d}-{secrets.token_hex(3)}',
+            'started_at': started_at,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'trigger': trigger,
+            'engine': profiler.name,
+            'duration_ms': round(duration * 1000, 3),
+            'query_count': len(queries),
+            'query_time_ms': round(
+                sum(query['duration_ms'] for query in queries), 3
+            ),
+            'queries': queries,
+            'report': profiler.report(),
+        }
+        try:
+            response['X-Profile-Id'] = write_profile(
+                self.config['DIR'], record, profiler,
+                self.config['MAX_PROFILES'],
+            )
+        except OSError as e:
+            # A full or unwritable profile directory must not fail the request
+            logger.warning("Could not store profile of %s %s: %s",
+                           request.method, request.path, e)
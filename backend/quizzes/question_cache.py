@@ -0,0 +1,323 @@
+"""
+Content-addressed cache for generated question sets.
+
+Generated quizzes are keyed on everything that influences the LLM output:
+the normalized subject, difficulty, number of questions, model name and
+prompt version. Values are the parsed question lists returned by
+``quiz_service.generate_quiz_questions``.
+
+The backend is selected through ``settings.QUIZ_QUESTION_CACHE``:
+
+    'memory' - in-process LRU dictionary with TTL (default)
+    'django' - any cache configured in ``settings.CACHES``
+    'sqlite' - on-disk SQLite file shared by every worker on the host
+    'none'   - caching disabled
+
+Identical generations are only coalesced across worker processes when the
+cache is visible to all of them (``QuestionCache.shared``): 'sqlite', or
+'django' with a cross-process cache such as Redis, Memcached, the database
+or files. With 'memory', or 'django' on the default ``LocMemCache``, each
+worker still makes its own OpenAI call.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+DEFAULT_CONFIG = {
+    'BACKEND': 'memory',
+    'TIMEOUT': 60 * 60 * 24,
+    'MAX_ENTRIES': 1000,
+    'LOCATION': None,
+    'CACHE_ALIAS': 'default',
+}
+
+
+def normalize_subject(subject):
+    """Collapse whitespace and case so "  Python " and "python" share a key."""
+    return ' '.join(str(subject).split()).casefold()
+
+
+def make_cache_key(subject, difficulty, num_questions, model, prompt_version):
+    """
+    Build the content address for a question set.
+
+    Returns:
+        str: A hex digest that is stable across processes and hosts
+    """
+    payload = json.dumps([
+        normalize_subject(subject),
+        str(difficulty).strip().lower(),
+        int(num_questions),
+        model,
+        prompt_version,
+    ])
+    return 'quizq:' + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class MemoryBackend:
+    """Thread-safe in-process LRU with per-entry expiry."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        """Store a value and return the number of entries evicted."""
+        with self._lock:
+            self._data[key] = (time.time() + timeout, value)
+            self._data.move_to_end(key)
+            evicted = 0
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def is_shared_cache(cache):
+    """
+    True when entries stored in a Django cache are visible to other worker
+    processes.
+
+    ``LocMemCache`` (what Django uses when ``CACHES`` is not set) and
+    ``DummyCache`` live inside one process.
+    """
+    from django.core.cache.backends.dummy import DummyCache
+    from django.core.cache.backends.locmem import LocMemCache
+    return not isinstance(cache, (DummyCache, LocMemCache))
+
+
+class DjangoCacheBackend:
+    """Delegates storage, expiry and culling to a Django cache alias."""
+
+    def __init__(self, alias):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, timeout):
+        self.cache.set(key, value, timeout)
+        return 0
+
+    def clear(self):
+        self.cache.clear()
+
+
+class SQLiteBackend:
+    """
+    On-disk cache shared by all worker processes on a host.
+
+    Each thread keeps its own connection. Entries are evicted by expiry first
+    and then by least-recent access once ``max_entries`` is exceeded. Access
+    times are only refreshed once they are ``ACCESS_GRANULARITY`` seconds
+    old, so a hot key is read without a write on every hit.
+    """
+
+    ACCESS_GRANULARITY = 60
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS question_cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'expires_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS question_cache_accessed '
+                'ON question_cache (accessed_at)'
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute(
+                'SELECT value, expires_at, accessed_at FROM question_cache '
+                'WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                conn.execute(
+                    'DELETE FROM question_cache WHERE key = ?', (key,)
+                )
+                return None
+            if now - row[2] >= self.ACCESS_GRANULARITY:
+                conn.execute(
+                    'UPDATE question_cache SET accessed_at = ? WHERE key = ?',
+                    (now, key),
+                )
+        return json.loads(row[0])
+
+    def set(self, key, value, timeout):
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO question_cache (key, value, '
+                'expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), now + timeout, now),
+            )
+            expired = conn.execute(
+                'DELETE FROM question_cache WHERE expires_at < ?', (now,)
+            ).rowcount
+            overflow = conn.execute(
+                'DELETE FROM question_cache WHERE key IN (SELECT key FROM '
+                'question_cache ORDER BY accessed_at DESC, rowid DESC LIMIT '
+                '-1 OFFSET ?)',
+                (self.max_entries,),
+            ).rowcount
+        return expired + overflow
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM question_cache')
+
+    def __len__(self):
+        return (
+            self._connection()
+            .execute('SELECT COUNT(*) FROM question_cache')
+            .fetchone()[0]
+        )
+
+
+class QuestionCache:
+    """
+    Front for a storage backend that keeps hit/miss counters.
+
+    Values are stored as JSON-compatible lists, so callers always receive a
+    fresh copy they are free to mutate.
+    """
+
+    def __init__(self, backend, timeout):
+        self.backend = backend
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0}
+
+    def _incr(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    @property
+    def shared(self):
+        """True when other worker processes can see entries stored here."""
+        if isinstance(self.backend, DjangoCacheBackend):
+            return is_shared_cache(self.backend.cache)
+        return isinstance(self.backend, SQLiteBackend)
+
+    def get(self, key):
+        if self.backend is None:
+            return None
+        value = self.backend.get(key)
+        if value is None:
+            self._incr('misses')
+            return None
+        self._incr('hits')
+        return json.loads(value) if isinstance(value, str) else value
+
+    def set(self, key, questions):
+        if self.backend is None:
+            return
+        value = (
+            json.dumps(questions)
+            if isinstance(self.backend, MemoryBackend)
+            else questions
+        )
+        evicted = self.backend.set(key, value, self.timeout)
+        self._incr('sets')
+        if evicted:
+            self._incr('evictions', evicted)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+def _build_backend(config):
+    name = config['BACKEND']
+    if name == 'memory':
+        return MemoryBackend(config['MAX_ENTRIES'])
+    if name == 'django':
+        return DjangoCacheBackend(config['CACHE_ALIAS'])
+    if name == 'sqlite':
+        location = config['LOCATION'] or os.path.join(
+            settings.BASE_DIR, 'question_cache.sqlite3'
+        )
+        return SQLiteBackend(location, config['MAX_ENTRIES'])
+    if name == 'none':
+        return None
+    raise ValueError(f"Unknown question cache backend: {name}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_question_cache():
+    """Return the process-wide question cache, building it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = dict(
+                    DEFAULT_CONFIG,
+                    **getattr(settings, 'QUIZ_QUESTION_CACHE', {}),
+                )
+                _cache = QuestionCache(
+                    _build_backend(config), config['TIMEOUT']
+                )
+    return _cache
+
+
+def reset_question_cache():
+    """Drop the process-wide cache so the next call re-reads settings."""
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,175 @@
+"""
+Pool of pre-generated questions per (subject, difficulty) bucket.
+
+``GenerateQuizView`` draws a random subset of pooled questions the user has
+not seen before, so popular subjects are served without an OpenAI round
+trip. The ``refill_question_pool`` management command keeps each bucket
+between the configured watermarks and retires questions once they have been
+served ``MAX_SERVES`` times so the content keeps rotating.
+"""
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import PoolQuestion, Quiz
+from .question_cache import normalize_subject
+from .quiz_service import request_quiz_questions
+
+DEFAULT_CONFIG = {
+    'ENABLED': True,
+    'SUBJECTS': [],
+    'DIFFICULTIES': [choice[0] for choice in Quiz.DIFFICULTY_CHOICES],
+    'TOP_SUBJECTS': 0,
+    'LOW_WATERMARK': 30,
+    'HIGH_WATERMARK': 100,
+    'BATCH_SIZE': 20,
+    'MAX_SERVES': 50,
+}
+
+
+def get_pool_config():
+    """Return ``settings.QUESTION_POOL`` merged over the defaults."""
+    return dict(DEFAULT_CONFIG, **getattr(settings, 'QUESTION_POOL', {}))
+
+
+def take_questions(subject, difficulty, user, num_questions=10):
+    """
+    Draw a random set of pooled questions the user has not been served yet.
+
+    Args:
+        subject (str): The subject of the quiz
+        difficulty (str): The difficulty level (easy, medium, hard)
+        user (User): The user the questions are served to
+        num_questions (int): Number of questions wanted
+
+    Returns:
+        list: Question dictionaries, or None if the bucket cannot cover the
+            request
+    """
+    config = get_pool_config()
+    if not config['ENABLED']:
+        return None
+    subject = normalize_subject(subject)
+    if not config['TOP_SUBJECTS'] and subject not in map(
+        normalize_subject, config['SUBJECTS']
+    ):
+        return None  # Never refilled, so skip the query
+    candidates = list(
+        PoolQuestion.objects
+        .filter(subject=subject, difficulty=difficulty)
+        .exclude(served_to=user)
+        .values_list('id', flat=True)
+    )
+    if len(candidates) < num_questions:
+        return None
+
+    chosen_ids = random.sample(candidates, num_questions)
+    with transaction.atomic():
+        questions = PoolQuestion.objects.in_bulk(chosen_ids)
+        PoolQuestion.objects.filter(id__in=chosen_ids).update(
+            served_count=F('served_count') + 1
+        )
+        PoolQuestion.served_to.through.objects.bulk_create(
+            [
+                PoolQuestion.served_to.through(
+                    poolquestion_id=pk, user_id=user.pk
+                )
+                for pk in chosen_ids
+            ],
+            ignore_conflicts=True,
+        )
+    return [
+        {'text': questions[pk].text, 'answer': questions[pk].answer}
+        for pk in chosen_ids
+    ]
+
+
+def bucket_level(subject, difficulty):
+    """Number of questions currently pooled for a bucket."""
+    return PoolQuestion.objects.filter(
+        subject=normalize_subject(subject), difficulty=difficulty
+    ).count()
+
+
+def retire_exhausted(max_serves):
+    """Delete questions that have been served ``max_serves`` times or more."""
+    _, deleted = PoolQuestion.objects.filter(
+        served_count__gte=max_serves
+    ).delete()
+    return deleted.get(PoolQuestion._meta.label, 0)
+
+
+def watched_buckets(config=None):
+    """
+    Buckets the refill worker should keep topped up.
+
+    Configured subjects are combined with the ``TOP_SUBJECTS`` most requested
+    subjects found in the quiz table.
+
+    Returns:
+        list: (subject, difficulty) tuples with normalized subjects
+    """
+    config = config or get_pool_config()
+    buckets = []
+    for subject in config['SUBJECTS']:
+        for difficulty in config['DIFFICULTIES']:
+            buckets.append((normalize_subject(subject), difficulty))
+    if config['TOP_SUBJECTS']:
+        popular = (
+            Quiz.objects.values('subject', 'difficulty')
+            .annotate(total=Count('id'))
+            .order_by('-total')[:config['TOP_SUBJECTS']]
+        )
+        for row in popular:
+            buckets.append(
+                (normalize_subject(row['subject']), row['difficulty'])
+            )
+    return list(dict.fromkeys(buckets))
+
+
+def refill_bucket(subject, difficulty, config=None):
+    """
+    Top a bucket back up to the high watermark once it drops below the low one.
+
+    Questions already in the bucket are skipped so refills do not introduce
+    duplicates.
+
+    Returns:
+        int: Number of questions added
+    """
+    config = config or get_pool_config()
+    subject = normalize_subject(subject)
+    level = bucket_level(subject, difficulty)
+    if level >= config['LOW_WATERMARK']:
+        return 0
+
+    existing = {
+        text.casefold()
+        for text in PoolQuestion.objects.filter(
+            subject=subject, difficulty=difficulty
+        ).values_list('text', flat=True)
+    }
+    added = 0
+    while level + added < config['HIGH_WATERMARK']:
+        batch = request_quiz_questions(
+            subject, difficulty, config['BATCH_SIZE']
+        )
+        new_questions = []
+        for question in batch:
+            key = question['text'].casefold()
+            if key in existing:
+                continue
+            existing.add(key)
+            new_questions.append(PoolQuestion(
+                subject=subject,
+                difficulty=difficulty,
+                text=question['text'],
+                answer=question['answer'],
+            ))
+        if not new_questions:
+            break
+        PoolQuestion.objects.bulk_create(new_questions)
+        added += len(new_questions)
+    return added
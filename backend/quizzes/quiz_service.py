@@ -1,7 +1,23 @@
 import openai
-import json
+import logging
+from asgiref.sync import sync_to_async
 from django.conf import settings
 
+from .grading import get_grading_engine
+from .llm_json import (
+    QuestionStreamParser,
+    extract_question_sets,
+    extract_questions,
+    merge_questions,
+)
+from .metrics import inc, record_token_usage, span
+from .openai_client import get_async_client, get_client, get_concurrency_limit
+from .openai_guard import UpstreamUnavailable, get_guard
+from .question_cache import get_question_cache, make_cache_key
+from .single_flight import get_single_flight
+
+logger = logging.getLogger(__name__)
+
 # Ensure we're using a compatible version of the OpenAI SDK
 if not hasattr(openai, 'OpenAI'):
     raise ImportError("This code requires OpenAI Python SDK v1.0.0 or higher. Please upgrade using: pip install --upgrade openai")
@@ -13,9 +29,9 @@ def test_openai_connection():
         tuple: (bool, str) - (success status, message)
     """
     try:
-        client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+        client = get_client()
         response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+            model=get_model(),
             messages=[{"role": "user", "content": "Say 'test successful' if you can read this."}],
             max_tokens=5
         )
@@ -23,32 +39,52 @@ def test_openai_connection():
     except Exception as e:
         return False, f"OpenAI API connection failed: {str(e)}"
 
-def generate_quiz_questions(subject, difficulty, num_questions=10):
+DIFFICULTY_DESCRIPTIONS = {
+    'easy': 'basic knowledge questions that most beginners would know',
+    'medium': (
+        'intermediate level questions requiring good understanding of the '
+        'subject'
+    ),
+    'hard': 'advanced questions that only experts would likely know',
+}
+
+# Bump whenever the prompt changes so cached question sets are not reused
+PROMPT_VERSION = 1
+
+# Follow-up requests made for the questions missing from a short or damaged
+# response
+MAX_FOLLOW_UPS = 2
+
+
+class QuizGenerationError(Exception):
+    """No usable questions could be generated."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        # Set when OpenAI was not called at all (circuit open or rate limited)
+        self.retry_after = retry_after
+
+
+def get_model():
+    """Return the chat model used for quiz generation."""
+    return getattr(settings, 'OPENAI_MODEL', 'gpt-3.5-turbo')
+
+
+def build_messages(subject, difficulty, num_questions, exclude=()):
     """
-    Generate quiz questions using OpenAI API based on the subject and difficulty.
-    
+    Build the chat messages sent to OpenAI for a quiz.
+
     Args:
-        subject (str): The subject of the quiz
-        difficulty (str): The difficulty level (easy, medium, hard)
-        num_questions (int): Number of questions to generate (default: 10)
-        
+        exclude (iterable): Question texts the model must not repeat, used
+            when only the questions missing from an earlier response are
+            requested
+
     Returns:
-        list: A list of dictionaries with question text and answer
+        list: Messages in the chat completions format
     """
-    try:
-        print(f"Generating quiz for subject: {subject}, difficulty: {difficulty}")
-        client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-        
-        # Create a system prompt based on difficulty
-        difficulty_descriptions = {
-            'easy': 'basic knowledge questions that most beginners would know',
-            'medium': 'intermediate level questions requiring good understanding of the subject',
-            'hard': 'advanced questions that only experts would likely know'
-        }
-        
-        system_prompt = f"""
+    system_prompt = f"""
         You are an expert quiz creator. Create {num_questions} quiz questions about {subject}.
-        The questions should be {difficulty_descriptions.get(difficulty, 'moderate difficulty')}.
+        The questions should be {DIFFICULTY_DESCRIPTIONS.get(difficulty, 'moderate difficulty')}.
         
         Return the response in this exact JSON format:
         {{
@@ -63,66 +99,620 @@ def generate_quiz_questions(subject, difficulty, num_questions=10):
         
         Be concise and clear in both questions and answers.
         """
+    user_prompt = (
+        f"Generate {num_questions} {difficulty} questions about {subject}"
+    )
+    exclude = list(exclude)
+    if exclude:
+        user_prompt += "\nDo not repeat any of these questions:\n" + "\n".join(
+            f"- {text}" for text in exclude
+        )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def parse_questions(content):
+    """
+    Extract the valid questions from the model's JSON response.
+
+    Code fences, trailing commas and truncated output are tolerated (see
+    ``llm_json.extract_questions``), so the result may hold fewer questions
+    than were requested, or none.
+
+    Returns:
+        list: Question dictionaries with text and answer
+    """
+    with span('parse'):
+        questions, salvaged = extract_questions(content)
+    if salvaged:
+        logger.warning(
+            "Salvaged %d questions from a malformed response; raw content: %r",
+            len(questions),
+            content,
+        )
+    else:
+        logger.debug("Extracted %d questions from response", len(questions))
+    return questions
+
+
+def request_question_batch(subject, difficulty, num_questions, exclude=()):
+    """
+    Make one chat completion call, through the upstream guard, and parse its
+    questions.
+
+    Raises:
+        UpstreamUnavailable: If the guard refused the call (see
+            openai_guard.py)
+        Exception: Any API error left after retries is propagated to the caller
+    """
+    client = get_client()
+    model = get_model()
+
+    logger.debug(
+        "Requesting %d %s questions on %r from %s",
+        num_questions,
+        difficulty,
+        subject,
+        model,
+    )
+    try:
+        with span('openai_request'):
+            response = get_guard().call(
+                client.chat.completions.create,
+                model=model,
+                messages=build_messages(
+                    subject, difficulty, num_questions, exclude
+                ),
+                response_format={"type": "json_object"},
+            )
+    except UpstreamUnavailable:
+        inc('openai_requests_total', model=model, outcome='rejected')
+        raise
+    except Exception:
+        inc('openai_requests_total', model=model, outcome='error')
+        raise
+    inc('openai_requests_total', model=model, outcome='ok')
+    record_token_usage(getattr(response, 'usage', None), model)
+
+    content = response.choices[0].message.content
+    logger.debug("Raw response: %.200s", content)
+    return parse_questions(content)
+
+
+async def arequest_question_batch(
+    subject, difficulty, num_questions, exclude=()
+):
+    """
+    Async variant of ``request_question_batch`` using the pooled AsyncOpenAI
+    client.
+    """
+    client = get_async_client()
+    model = get_model()
+    async with get_concurrency_limit():
+        logger.debug(
+            "Requesting %d %s questions on %r from %s",
+            num_questions,
+            difficulty,
+            subject,
+            model,
+        )
+        try:
+            with span('openai_request'):
+                response = await get_guard().acall(
+                    client.chat.completions.create,
+                    model=model,
+                    messages=build_messages(
+                        subject, difficulty, num_questions, exclude
+                    ),
+                    response_format={"type": "json_object"},
+                )
+        except UpstreamUnavailable:
+            inc('openai_requests_total', model=model, outcome='rejected')
+            raise
+        except Exception:
+            inc('openai_requests_total', model=model, outcome='error')
+            raise
+    inc('openai_requests_total', model=model, outcome='ok')
+    record_token_usage(getattr(response, 'usage', None), model)
+    return parse_questions(response.choices[0].message.content)
+
+
+def request_missing_questions(subject, difficulty, num_questions, questions):
+    """
+    Top up a short question set by asking only for the missing questions.
+
+    At most ``MAX_FOLLOW_UPS`` calls are made. A failing follow-up ends the
+    top-up but keeps the questions already obtained.
+
+    Returns:
+        list: ``questions`` plus the new, non-repeated questions
+    """
+    for _ in range(MAX_FOLLOW_UPS):
+        missing = num_questions - len(questions)
+        if missing <= 0:
+            break
+        logger.info(
+            "Got %d of %d questions; requesting the missing %d",
+            len(questions),
+            num_questions,
+            missing,
+        )
+        try:
+            batch = request_question_batch(
+                subject, difficulty, missing, [q['text'] for q in questions]
+            )
+        except Exception as e:
+            logger.warning("Follow-up request failed: %s", e)
+            break
+        questions = merge_questions(questions, batch, num_questions)
+    return questions
+
+
+async def arequest_missing_questions(
+    subject, difficulty, num_questions, questions
+):
+    """Async variant of ``request_missing_questions``."""
+    for _ in range(MAX_FOLLOW_UPS):
+        missing = num_questions - len(questions)
+        if missing <= 0:
+            break
+        logger.info(
+            "Got %d of %d questions; requesting the missing %d",
+            len(questions),
+            num_questions,
+            missing,
+        )
+        try:
+            batch = await arequest_question_batch(
+                subject, difficulty, missing, [q['text'] for q in questions]
+            )
+        except Exception as e:
+            logger.warning("Follow-up request failed: %s", e)
+            break
+        questions = merge_questions(questions, batch, num_questions)
+    return questions
+
+
+def request_quiz_questions(subject, difficulty, num_questions=10):
+    """
+    Ask OpenAI for a fresh set of questions, bypassing the cache.
+
+    Questions missing from a short or malformed response are requested in
+    follow-up calls, so the result may still be short but is never empty.
+
+    Raises:
+        QuizGenerationError: If the response holds no usable questions
+        Exception: Any API error on the first call is propagated to the caller
+    """
+    questions = merge_questions(
+        [],
+        request_question_batch(subject, difficulty, num_questions),
+        num_questions,
+    )
+    if not questions:
+        raise QuizGenerationError("The model returned no usable questions")
+    return request_missing_questions(
+        subject, difficulty, num_questions, questions
+    )
+
+
+async def arequest_quiz_questions(subject, difficulty, num_questions=10):
+    """
+    Async variant of ``request_quiz_questions`` using the pooled AsyncOpenAI
+    client.
+    
+    At most ``settings.OPENAI_MAX_CONCURRENCY`` calls are in flight per event
+    loop; further callers wait for a free slot.
+    
+    Raises:
+        QuizGenerationError: If the response holds no usable questions
+        Exception: Any API error on the first call is propagated to the caller
+    """
+    batch = await arequest_question_batch(subject, difficulty, num_questions)
+    questions = merge_questions([], batch, num_questions)
+    if not questions:
+        raise QuizGenerationError("The model returned no usable questions")
+    return await arequest_missing_questions(
+        subject, difficulty, num_questions, questions
+    )
+
+
+def build_packed_messages(subjects, difficulty, num_questions):
+    """
+    Build the chat messages asking for a quiz on each of several subjects.
+
+    Returns:
+        list: Messages in the chat completions format
+    """
+    system_prompt = f"""
+        You are an expert quiz creator. Create {num_questions} quiz questions about each of the subjects you are given.
+        The questions should be {DIFFICULTY_DESCRIPTIONS.get(difficulty, 'moderate difficulty')}.
+
+        Return the response in this exact JSON format, with one entry per subject in the order given:
+        {{
+            "quizzes": [
+                {{
+                    "subject": "Subject exactly as given",
+                    "questions": [
+                        {{
+                            "text": "Question text here",
+                            "answer": "Correct answer here"
+                        }},
+                        ...
+                    ]
+                }},
+                ...
+            ]
+        }}
+
+        Be concise and clear in both questions and answers.
+        """
+    user_prompt = (
+        f"Generate {num_questions} {difficulty} questions about each of these "
+        "subjects:\n"
+        + "\n".join(f"- {subject}" for subject in subjects)
+    )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def request_packed_questions(subjects, difficulty, num_questions):
+    """
+    Ask for the questions of several quizzes in one chat completion call.
+
+    Packing saves the per-call overhead (system prompt tokens, round trips,
+    rate-limit tokens) when many quizzes are prepared at once. The result is
+    not topped up or cached; see ``batch_generation.generate_pack``.
+
+    Returns:
+        list: One question list per subject, in order; possibly short or empty
+
+    Raises:
+        UpstreamUnavailable: If the guard refused the call (see
+            openai_guard.py)
+        Exception: Any API error left after retries is propagated to the caller
+    """
+    client = get_client()
+    model = get_model()
+
+    logger.debug(
+        "Requesting %d %s questions on %d subjects from %s",
+        num_questions,
+        difficulty,
+        len(subjects),
+        model,
+    )
+    try:
+        with span('openai_request'):
+            response = get_guard().call(
+                client.chat.completions.create,
+                model=model,
+                messages=build_packed_messages(
+                    subjects, difficulty, num_questions
+                ),
+                response_format={"type": "json_object"},
+            )
+    except UpstreamUnavailable:
+        inc('openai_requests_total', model=model, outcome='rejected')
+        raise
+    except Exception:
+        inc('openai_requests_total', model=model, outcome='error')
+        raise
+    inc('openai_requests_total', model=model, outcome='ok')
+    record_token_usage(getattr(response, 'usage', None), model)
+
+    content = response.choices[0].message.content
+    logger.debug("Raw response: %.200s", content)
+    with span('parse'):
+        return extract_question_sets(content, subjects)
+
+
+def generation_key(subject, difficulty, num_questions=10):
+    """
+    Content address of a generation request (see
+    ``question_cache.make_cache_key``).
+    """
+    return make_cache_key(
+        subject, difficulty, num_questions, get_model(), PROMPT_VERSION
+    )
+
+
+def fetch_quiz_questions(subject, difficulty, num_questions=10):
+    """
+    Return questions from the cache, or request and cache a fresh set.
+    
+    Concurrent identical calls are coalesced into one request, in-process and,
+    when the question cache is shared between processes (``cache.shared``),
+    across worker processes on the host. Only complete sets are cached.
+    
+    Raises:
+        Exception: Any API or parsing error is propagated to the caller
+    """
+    cache = get_question_cache()
+    key = generation_key(subject, difficulty, num_questions)
+    questions = cache.get(key)
+    if questions is not None:
+        logger.debug(
+            "Question cache hit for subject: %s, difficulty: %s",
+            subject,
+            difficulty,
+        )
+        return questions
+
+    def request_and_cache():
+        logger.info(
+            "Generating quiz for subject: %s, difficulty: %s",
+            subject,
+            difficulty,
+        )
+        questions = request_quiz_questions(subject, difficulty, num_questions)
+        if len(questions) == num_questions:
+            cache.set(key, questions)
+        return questions
+
+    # Identical concurrent requests wait for a single OpenAI call
+    questions = get_single_flight().do(
+        key,
+        request_and_cache,
+        recheck=lambda: cache.get(key),
+        cross_process=cache.shared,
+    )
+    return [dict(question) for question in questions]
+
+
+def reuse_saved_questions(subject, difficulty, num_questions):
+    """
+    Questions of the newest saved quiz with the same subject and difficulty.
+
+    Served instead of an error while OpenAI is unavailable. Subjects are
+    matched case-insensitively without an index, which is acceptable on
+    this failure path only.
+
+    Returns:
+        list: Question dictionaries, or None when there is no such quiz
+    """
+    from .models import Question, Quiz
+
+    quiz_id = (
+        Quiz.objects.filter(
+            subject__iexact=subject.strip(),
+            difficulty=difficulty,
+            question_count__gte=num_questions,
+        )
+        .order_by('-created_at')
+        .values_list('id', flat=True)
+        .first()
+    )
+    if quiz_id is None:
+        return None
+    rows = (
+        Question.objects.filter(quiz_id=quiz_id)
+        .order_by('id')
+        .values_list('text', 'answer')[:num_questions]
+    )
+    return [{"text": text, "answer": answer} for text, answer in rows]
+
+
+def fallback_or_raise(error, subject, difficulty, num_questions):
+    """
+    Handle a failed generation.
+
+    When the upstream guard refused the call, a saved quiz on the same
+    subject is reused if there is one.
+
+    Raises:
+        QuizGenerationError: When there is nothing to fall back to
+    """
+    if isinstance(error, UpstreamUnavailable):
+        questions = reuse_saved_questions(subject, difficulty, num_questions)
+        if questions:
+            logger.warning(
+                "OpenAI unavailable (%s); reusing a saved quiz on %r",
+                error,
+                subject,
+            )
+            return questions
+        raise QuizGenerationError(
+            str(error), retry_after=error.retry_after
+        ) from error
+    raise QuizGenerationError(str(error)) from error
+
+
+def generate_quiz_questions(subject, difficulty, num_questions=10):
+    """
+    Generate quiz questions using OpenAI API based on the subject and difficulty.
+    
+    Results are served from the question cache when an identical request
+    (same normalized subject, difficulty, count, model and prompt version)
+    has already been answered.
+    
+    Args:
+        subject (str): The subject of the quiz
+        difficulty (str): The difficulty level (easy, medium, hard)
+        num_questions (int): Number of questions to generate (default: 10)
         
-        print("Sending request to OpenAI API...")
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Generate {num_questions} {difficulty} questions about {subject}"}
-            ],
-            response_format={"type": "json_object"}
+    Returns:
+        list: A list of dictionaries with question text and answer
+        
+    Raises:
+        QuizGenerationError: If no questions could be generated
+    """
+    try:
+        return fetch_quiz_questions(subject, difficulty, num_questions)
+    except QuizGenerationError:
+        logger.error(
+            "Model returned no usable questions for subject: %s", subject
         )
+        raise
+    except Exception as e:
+        logger.error("Error in generate_quiz_questions: %s", e)
+        return fallback_or_raise(e, subject, difficulty, num_questions)
+
+async def agenerate_quiz_questions(subject, difficulty, num_questions=10):
+    """
+    Async variant of ``generate_quiz_questions`` for ASGI views.
+    
+    Shares the question cache with the synchronous path; cache backends may do
+    blocking I/O, so they are consulted from a worker thread. Identical
+    concurrent requests are coalesced like in ``fetch_quiz_questions``.
+    
+    Returns:
+        list: A list of dictionaries with question text and answer
         
-        print("Received response from OpenAI API")
-        content = response.choices[0].message.content
-        print(f"Raw response: {content[:200]}...")  # Print first 200 chars of response
+    Raises:
+        QuizGenerationError: If no questions could be generated
+    """
+    cache = get_question_cache()
+    key = generation_key(subject, difficulty, num_questions)
+    questions = await sync_to_async(cache.get, thread_sensitive=False)(key)
+    if questions is not None:
+        logger.debug(
+            "Question cache hit for subject: %s, difficulty: %s",
+            subject,
+            difficulty,
+        )
+        return questions
+
+    async def request_and_cache():
+        logger.info(
+            "Generating quiz for subject: %s, difficulty: %s",
+            subject,
+            difficulty,
+        )
+        questions = await arequest_quiz_questions(
+            subject, difficulty, num_questions
+        )
+        if len(questions) == num_questions:
+            await sync_to_async(cache.set, thread_sensitive=False)(
+                key, questions
+            )
+        return questions
+
+    try:
+        questions = await get_single_flight().ado(
+            key, request_and_cache, recheck=lambda: cache.get(key),
+            cross_process=cache.shared,
+        )
+    except QuizGenerationError:
+        logger.error(
+            "Model returned no usable questions for subject: %s", subject
+        )
+        raise
+    except Exception as e:
+        logger.error("Error in agenerate_quiz_questions: %s", e)
+        return await sync_to_async(fallback_or_raise)(
+            e, subject, difficulty, num_questions
+        )
+    return [dict(question) for question in questions]
+
+def stream_quiz_questions(subject, difficulty, num_questions=10):
+    """
+    Generate quiz questions, yielding each one as soon as it has been parsed.
+    
+    Uses the OpenAI streaming API so the first question is available long
+    before the full response has been produced. Cached question sets are
+    replayed immediately. If the stream ends early or breaks off after some
+    questions, the missing ones are requested in follow-up calls. A complete
+    set is written back to the cache.
+    
+    Yields:
+        dict: Question dictionaries with text and answer
         
-        try:
-            questions_data = json.loads(content)
-            print(f"Parsed JSON successfully. Keys found: {list(questions_data.keys())}")
-            
-            if 'questions' in questions_data:
-                questions = questions_data['questions']
-                print(f"Successfully extracted {len(questions)} questions")
-                return questions
-            else:
-                print("No 'questions' key found in response. Available keys:", list(questions_data.keys()))
-                # Try to adapt the response if it's in a different format
-                if isinstance(questions_data, list):
-                    return questions_data
-                else:
-                    raise ValueError("Response format not recognized")
-                    
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse JSON response: {e}")
-            print(f"Raw content: {content}")
-            raise
-            
+    Raises:
+        QuizGenerationError: If the stream failed before yielding any question
+    """
+    cache = get_question_cache()
+    key = generation_key(subject, difficulty, num_questions)
+    cached = cache.get(key)
+    if cached is not None:
+        logger.debug(
+            "Question cache hit for subject: %s, difficulty: %s",
+            subject,
+            difficulty,
+        )
+        yield from cached
+        return
+
+    questions = []
+    model = get_model()
+    try:
+        logger.info(
+            "Streaming quiz for subject: %s, difficulty: %s",
+            subject,
+            difficulty,
+        )
+        stream = get_guard().stream(
+            get_client().chat.completions.create,
+            model=model,
+            messages=build_messages(subject, difficulty, num_questions),
+            response_format={"type": "json_object"},
+            stream=True,
+            # Usage arrives in a final chunk with no choices
+            stream_options={"include_usage": True}
+        )
+        parser = QuestionStreamParser()
+        for chunk in stream:
+            if not chunk.choices:
+                record_token_usage(getattr(chunk, 'usage', None), model)
+                continue
+            for item in parser.feed(chunk.choices[0].delta.content):
+                if len(questions) >= num_questions:
+                    continue
+                merged = merge_questions(questions, [item])
+                if len(merged) == len(questions):
+                    continue  # Invalid or repeated
+                questions = merged
+                yield questions[-1]
     except Exception as e:
-        print(f"Error in generate_quiz_questions: {str(e)}")
-        # Return a default set of questions in case of error
-        return [
-            {"text": f"Sample question about {subject} (Error occurred: {str(e)})", "answer": "Sample answer"}
-        ] * num_questions
+        logger.error("Error in stream_quiz_questions: %s", e)
+        inc('openai_requests_total', model=model, outcome='error')
+        if not questions:
+            yield from fallback_or_raise(e, subject, difficulty, num_questions)
+            return
+    else:
+        inc('openai_requests_total', model=model, outcome='ok')
+
+    received = len(questions)
+    questions = request_missing_questions(
+        subject, difficulty, num_questions, questions
+    )
+    yield from questions[received:]
+
+    if len(questions) == num_questions:
+        cache.set(key, questions)
+
 
 def grade_quiz(user_answers, correct_answers):
     """
     Grade a quiz by comparing user answers with correct answers.
     
+    Answers are matched by the configured grading engine (see grading.py):
+    normalized exact match, numeric tolerance, then fuzzy similarity.
+    
     Args:
         user_answers (list): List of user's answers
         correct_answers (list): List of correct answers
         
     Returns:
-        int: Score out of total questions
+        GradeResult: ``score``, ``total`` and per-question ``results``
     """
-    score = 0
-    total_questions = min(len(user_answers), len(correct_answers))
+    with span('grade'):
+        return get_grading_engine().grade(user_answers, correct_answers)
+
+
+def grade_quizzes(submissions):
+    """
+    Grade many submissions at once, e.g. when re-grading history.
     
-    # First pass: exact matches
-    for i in range(total_questions):
-        if user_answers[i].lower() == correct_answers[i].lower():
-            score += 1
-            
-    return score 
\ No newline at end of file
+    Args:
+        submissions (iterable): (user_answers, correct_answers) tuples
+        
+    Returns:
+        list: A ``GradeResult`` per submission, in order
+    """
+    with span('grade'):
+        return get_grading_engine().grade_many(submissions)
@@ -0,0 +1,23 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+def format_event(event, data):
+    """Encode one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets views that stream Server-Sent Events pass content negotiation.
+
+    Streaming views return a ``StreamingHttpResponse`` directly; this renderer
+    only runs for error responses, which are sent as a single ``error`` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_event('error', data).encode(self.charset)
@@ -1,6 +1,28 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Quiz, Question, UserQuizHistory
+from .models import GenerationJob, Quiz, Question, UserQuizHistory
+
+class SparseFieldsetMixin:
+    """
+    Lets clients request a subset of fields with ``?fields=id,subject``.
+    
+    Unknown names are ignored. Only the top-level serializer of a response
+    is trimmed; nested serializers keep their own fields.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        requested = (
+            request.query_params.get('fields') if request is not None else None
+        )
+        if not requested:
+            return
+        wanted = {
+            name.strip() for name in requested.split(',') if name.strip()
+        }
+        for name in set(self.fields) - wanted:
+            self.fields.pop(name)
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -13,33 +35,81 @@ class QuestionSerializer(serializers.ModelSerializer):
         model = Question
         fields = ['id', 'text', 'answer']
 
-class QuizSerializer(serializers.ModelSerializer):
+class QuizListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """Quiz without its questions, for listings."""
+    
+    class Meta:
+        model = Quiz
+        fields = [
+            'id',
+            'subject',
+            'difficulty',
+            'created_at',
+            'question_count',
+        ]
+
+class QuizSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     questions = QuestionSerializer(many=True, read_only=True)
     
     class Meta:
         model = Quiz
-        fields = ['id', 'subject', 'difficulty', 'created_at', 'questions']
+        fields = [
+            'id',
+            'subject',
+            'difficulty',
+            'created_at',
+            'question_count',
+            'questions',
+        ]
+
+
+class UserQuizHistoryListSerializer(
+    SparseFieldsetMixin, serializers.ModelSerializer
+):
+    """History row with a slim quiz and no user, for listings."""
+    quiz = QuizListSerializer(read_only=True)
+    
+    class Meta:
+        model = UserQuizHistory
+        fields = [
+            'id',
+            'quiz',
+            'score',
+            'completed_at',
+            'score_percentage',
+            'has_certificate',
+        ]
+        read_only_fields = fields
 
-class UserQuizHistorySerializer(serializers.ModelSerializer):
+
+class UserQuizHistorySerializer(
+    SparseFieldsetMixin, serializers.ModelSerializer
+):
     quiz = QuizSerializer(read_only=True)
     user = UserSerializer(read_only=True)
-    score_percentage = serializers.SerializerMethodField()
-    has_certificate = serializers.SerializerMethodField()
     
     class Meta:
         model = UserQuizHistory
         fields = ['id', 'user', 'quiz', 'score', 'completed_at', 'score_percentage', 'has_certificate']
-    
-    def get_score_percentage(self, obj):
-        total_questions = obj.quiz.questions.count()
-        if total_questions > 0:
-            return round((obj.score / total_questions) * 100)
-        return 0
-    
-    def get_has_certificate(self, obj):
-        return self.get_score_percentage(obj) >= 80
+        read_only_fields = ['score_percentage', 'has_certificate']
+
 
 class QuizCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Quiz
-        fields = ['subject', 'difficulty'] 
\ No newline at end of file
+        fields = ['subject', 'difficulty'] 
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GenerationJob
+        fields = [
+            'id',
+            'subject',
+            'difficulty',
+            'status',
+            'attempts',
+            'error',
+            'quiz',
+            'created_at',
+            'updated_at',
+        ]
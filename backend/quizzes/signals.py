@@ -0,0 +1,40 @@
+"""
+Keep cached answer keys and token lookups in step with the rows they come from.
+"""
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .answer_keys import invalidate_answer_key
+from .authentication import invalidate_tokens
+from .models import Question, Quiz
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    invalidate_answer_key(instance.quiz_id)
+
+
+@receiver([post_save, post_delete], sender=Quiz)
+def quiz_changed(sender, instance, **kwargs):
+    # Also on creation: SQLite may hand out the id of a deleted or rolled back
+    # quiz again
+    invalidate_answer_key(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    # Password changes and deactivation must not be outlived by a cached user;
+    # last_login updates on session login change nothing that matters here
+    if created or update_fields == frozenset(['last_login']):
+        return
+    invalidate_tokens(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
@@ -0,0 +1,260 @@
+"""
+Single-flight coalescing of identical concurrent calls.
+
+When many users request the same quiz at the same moment, only one OpenAI
+call should be made. Within a process, the first caller for a key becomes
+the leader and everyone else waits for its result. Across gunicorn workers
+on the same host, leaders serialize on a lock file per key; a leader that had
+to wait re-checks the shared question cache before calling out, so it picks
+up the result the other process just stored. That only works when the
+question cache is itself shared between processes (see
+``question_cache.QuestionCache.shared``); otherwise callers pass
+``cross_process=False`` and each process makes its own call.
+
+Lock files are removed by the leader once it is done, so the lock directory
+does not grow with every subject ever requested.
+
+Waits are bounded by ``timeout`` (``SINGLE_FLIGHT_TIMEOUT``): a caller whose
+leader or lock is held longer than that stops waiting and makes its own call,
+so one stuck upstream request cannot hold every identical request with it.
+``ado`` coalesces coroutines on the same event loop the same way.
+"""
+import asyncio
+import contextlib
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock
+    fcntl = None
+
+LOCK_POLL_INTERVAL = 0.05
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and share its outcome."""
+
+    def __init__(self, lock_dir, timeout=120):
+        self.lock_dir = lock_dir
+        self.timeout = timeout
+        self._calls = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'calls': 0, 'executed': 0, 'coalesced_local': 0,
+            'coalesced_remote': 0, 'timed_out': 0,
+        }
+
+    def _incr(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    @contextlib.contextmanager
+    def _process_lock(self, key):
+        """
+        Yield True while holding the key's lock file, False after a timeout.
+        """
+        if fcntl is None:
+            yield True
+            return
+        os.makedirs(self.lock_dir, exist_ok=True)
+        path = os.path.join(
+            self.lock_dir,
+            hashlib.sha1(key.encode('utf-8')).hexdigest() + '.lock',
+        )
+        handle = self._acquire(path, time.monotonic() + self.timeout)
+        if handle is None:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            # Unlink before unlocking, so a waiter holding the old file retries
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+            fcntl.flock(handle, fcntl.LOCK_UN)
+            handle.close()
+
+    def _acquire(self, path, deadline):
+        """Lock ``path``, polling until ``deadline``; None if that passed."""
+        handle = open(path, 'a')
+        while True:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    handle.close()
+                    return None
+                time.sleep(LOCK_POLL_INTERVAL)
+                continue
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                current = None
+            if current is not None and os.path.samestat(
+                current, os.fstat(handle.fileno())
+            ):
+                return handle
+            # The previous holder removed the file while we waited; lock the
+            # new one
+            handle.close()
+            handle = open(path, 'a')
+
+    def do(self, key, fn, recheck=None, cross_process=False):
+        """
+        Call ``fn()`` unless an identical call for ``key`` is already running.
+
+        Args:
+            key (str): Identifies identical calls
+            fn (callable): Produces the result
+            recheck (callable): Looks for a result stored by another process;
+                returns None when there is none. Used with ``cross_process``.
+            cross_process (bool): Also coalesce with other processes on this
+                host
+
+        Returns:
+            The result of ``fn`` (or of the call this one was coalesced with)
+        """
+        with self._lock:
+            self._stats['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                self._incr('timed_out')
+                return fn()
+            self._incr('coalesced_local')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if cross_process:
+                lock = self._process_lock(key)
+            else:
+                lock = contextlib.nullcontext(True)
+            with lock as locked:
+                if not locked:
+                    self._incr('timed_out')
+                result = recheck() if (cross_process and recheck) else None
+                if result is not None:
+                    self._incr('coalesced_remote')
+                else:
+                    self._incr('executed')
+                    result = fn()
+            call.result = result
+            return result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key, fn, recheck=None, cross_process=False):
+        """
+        Async variant of ``do`` for coroutine functions.
+
+        Coroutines are coalesced with others on the same event loop (threads
+        calling ``do`` are not); lock files and ``recheck`` are handled in a
+        worker thread.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._stats['calls'] += 1
+            future = self._futures.get((loop, key))
+            leader = future is None
+            if leader:
+                future = self._futures[loop, key] = loop.create_future()
+
+        if not leader:
+            await asyncio.wait([future], timeout=self.timeout)
+            if not future.done():
+                self._incr('timed_out')
+                return await fn()
+            if future.cancelled():  # The leader was cancelled
+                return await fn()
+            self._incr('coalesced_local')
+            return future.result()
+
+        locks = contextlib.ExitStack()
+        try:
+            locked = True
+            if cross_process:
+                locked = await asyncio.to_thread(
+                    locks.enter_context, self._process_lock(key)
+                )
+            if not locked:
+                self._incr('timed_out')
+            result = None
+            if cross_process and recheck:
+                result = await asyncio.to_thread(recheck)
+            if result is not None:
+                self._incr('coalesced_remote')
+            else:
+                self._incr('executed')
+                result = await fn()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Retrieved, even when nobody was waiting
+            raise
+        finally:
+            with self._lock:
+                del self._futures[loop, key]
+            if not future.done():
+                future.cancel()
+            # Also on cancellation; the release itself must not be cancelled
+            await asyncio.shield(asyncio.to_thread(locks.close))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['coalesced'] = (
+            stats['coalesced_local'] + stats['coalesced_remote']
+        )
+        return stats
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """Return the process-wide single-flight group."""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                lock_dir = getattr(
+                    settings, 'SINGLE_FLIGHT_LOCK_DIR', None
+                ) or os.path.join(tempfile.gettempdir(), 'quizz-single-flight')
+                _single_flight = SingleFlight(
+                    lock_dir, getattr(settings, 'SINGLE_FLIGHT_TIMEOUT', 120)
+                )
+    return _single_flight
+
+
+def reset_single_flight():
+    """Drop the process-wide group and its counters."""
+    global _single_flight
+    with _single_flight_lock:
+        _single_flight = None
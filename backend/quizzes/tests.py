@@ -1,12 +1,135 @@
 from django.test import TestCase
 from django.conf import settings
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
+import asyncio
+import importlib
+import importlib.util
 import json
-from .quiz_service import test_openai_connection, generate_quiz_questions, grade_quiz
+import os
+import shutil
+import tempfile
+import unittest
+import httpx
+import openai
+from django.test import override_settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from io import StringIO
+from django.test import AsyncClient
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from django.core.cache import cache
+from .answer_keys import (
+    get_answer_key,
+    get_answer_key_cache,
+    reset_answer_key_cache,
+)
+from .api_benchmark import read_body
+from .batch_generation import (
+    BatchItem,
+    ManifestError,
+    make_packs,
+    parse_manifest,
+)
+from .authentication import (
+    DEFAULT_CONFIG as TOKEN_CACHE_CONFIG,
+    TokenUserCache,
+    get_token_cache,
+    reset_token_cache,
+)
+from .hashing_pool import HashingBusy, HashingPool
+from .metrics import record_token_usage, registry, reset_metrics, span
+from .profiling import (
+    ProfilingMiddleware,
+    list_profiles,
+    load_profile,
+    make_token,
+)
+from .openai_client import get_client, reset_clients
+from .openai_guard import (
+    CircuitOpen,
+    RateLimited,
+    SharedState,
+    UpstreamGuard,
+    get_guard_config,
+    reset_guard,
+)
+from .management.commands.openai_stub_server import StubHandler, StubServer
+from .management.commands.run_generation_worker import Command as WorkerCommand
+from .grading import GradingEngine, normalize_answer
+from .llm_json import (
+    QuestionStreamParser,
+    extract_question_sets,
+    extract_questions,
+    remove_trailing_commas,
+)
+from .single_flight import SingleFlight, get_single_flight, reset_single_flight
+from .quiz_service import fetch_quiz_questions
+import threading
+from datetime import timedelta
+import time
+from .models import (
+    GenerationJob,
+    PoolQuestion,
+    Question,
+    Quiz,
+    UserQuizHistory,
+)
+from .views import GENERATION_FAILED
+from .jobs import (
+    JOB_FAILED,
+    JOB_TIMED_OUT,
+    claim_next_job,
+    enqueue_generation,
+    requeue_stale_jobs,
+    run_job,
+)
+from .question_pool import refill_bucket, take_questions
+from .quiz_service import (
+    QuizGenerationError,
+    test_openai_connection,
+    generate_quiz_questions,
+    grade_quiz,
+)
+from .question_cache import (
+    MemoryBackend,
+    SQLiteBackend,
+    get_question_cache,
+    make_cache_key,
+    reset_question_cache,
+)
+
+_guard_state = override_settings(OPENAI_RESILIENCE=dict(
+    settings.OPENAI_RESILIENCE,
+    STATE_FILE=os.path.join(tempfile.mkdtemp(), 'guard.json'),
+))
+
+
+def setUpModule():
+    """Keep the guard's breaker state away from any running server's."""
+    _guard_state.enable()
+    reset_guard()
+
+
+def tearDownModule():
+    _guard_state.disable()
+    reset_guard()
+    shutil.rmtree(
+        os.path.dirname(
+            _guard_state.options['OPENAI_RESILIENCE']['STATE_FILE']
+        )
+    )
+
 
 class QuizServiceTests(TestCase):
     def setUp(self):
         """Set up test data and mocks"""
+        reset_question_cache()
+        reset_clients()
         self.sample_questions = {
             "questions": [
                 {
@@ -82,19 +205,16 @@ class QuizServiceTests(TestCase):
         mock_openai.return_value = mock_client
         mock_client.chat.completions.create.side_effect = Exception("API Error")
 
-        # Generate questions
-        questions = generate_quiz_questions("Geography", "easy", 2)
-        
-        # Should return default questions
-        self.assertEqual(len(questions), 2)
-        self.assertTrue("Error occurred" in questions[0]["text"])
+        # No placeholder questions are made up
+        with self.assertRaises(QuizGenerationError):
+            generate_quiz_questions("Geography", "easy", 2)
 
     def test_grade_quiz_exact_matches(self):
         """Test quiz grading with exact matches"""
         user_answers = ["Paris", "4"]
         correct_answers = ["Paris", "4"]
         
-        score = grade_quiz(user_answers, correct_answers)
+        score = grade_quiz(user_answers, correct_answers).score
         
         self.assertEqual(score, 2)
 
@@ -103,7 +223,7 @@ class QuizServiceTests(TestCase):
         user_answers = ["paris", "4"]
         correct_answers = ["Paris", "4"]
         
-        score = grade_quiz(user_answers, correct_answers)
+        score = grade_quiz(user_answers, correct_answers).score
         
         self.assertEqual(score, 2)
 
@@ -112,7 +232,7 @@ class QuizServiceTests(TestCase):
         user_answers = ["Paris", "5"]
         correct_answers = ["Paris", "4"]
         
-        score = grade_quiz(user_answers, correct_answers)
+        score = grade_quiz(user_answers, correct_answers).score
         
         self.assertEqual(score, 1)
 
@@ -121,6 +241,2397 @@ class QuizServiceTests(TestCase):
         user_answers = ["Paris"]
         correct_answers = ["Paris", "4"]
         
-        score = grade_quiz(user_answers, correct_answers)
+        score = grade_quiz(user_answers, correct_answers).score
         
         self.assertEqual(score, 1)
+
+
+class QuestionCacheTests(TestCase):
+    def setUp(self):
+        reset_question_cache()
+        reset_clients()
+        self.mock_openai_response = MagicMock()
+        self.mock_openai_response.choices = [
+            MagicMock(message=MagicMock(content=json.dumps({
+                "questions": [{"text": "What is 2 + 2?", "answer": "4"}]
+            })))
+        ]
+
+    def test_django_backend_is_shared_only_across_processes(self):
+        """
+        Local-memory Django caches must not enable cross-process coalescing
+        """
+        with override_settings(QUIZ_QUESTION_CACHE={'BACKEND': 'django'}):
+            reset_question_cache()
+            self.assertFalse(get_question_cache().shared)
+            with tempfile.TemporaryDirectory() as directory, override_settings(
+                CACHES=file_caches(directory)
+            ):
+                reset_question_cache()
+                self.assertTrue(get_question_cache().shared)
+        reset_question_cache()
+
+    def test_cache_key_normalizes_subject(self):
+        """Subjects differing only in case and whitespace share a key"""
+        key = make_cache_key(
+            "  Python  Basics", "Easy", 10, "gpt-3.5-turbo", 1
+        )
+        self.assertEqual(
+            key,
+            make_cache_key("python basics", "easy", 10, "gpt-3.5-turbo", 1),
+        )
+        self.assertNotEqual(
+            key, make_cache_key("python basics", "easy", 5, "gpt-3.5-turbo", 1)
+        )
+        self.assertNotEqual(
+            key,
+            make_cache_key("python basics", "easy", 10, "gpt-3.5-turbo", 2),
+        )
+
+    @patch('openai.OpenAI')
+    def test_repeat_request_served_from_cache(self, mock_openai):
+        """A second identical request does not call OpenAI"""
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+        mock_client.chat.completions.create.return_value = self.mock_openai_response
+
+        first = generate_quiz_questions("Math", "easy", 1)
+        second = generate_quiz_questions(" math ", "easy", 1)
+
+        self.assertEqual(first, second)
+        mock_client.chat.completions.create.assert_called_once()
+        stats = get_question_cache().stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    @patch('openai.OpenAI')
+    def test_errors_are_not_cached(self, mock_openai):
+        """Errors must not poison the cache"""
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+        mock_client.chat.completions.create.side_effect = Exception("API Error")
+        with self.assertRaises(QuizGenerationError):
+            generate_quiz_questions("Math", "easy", 1)
+
+        mock_client.chat.completions.create.side_effect = None
+        mock_client.chat.completions.create.return_value = self.mock_openai_response
+        questions = generate_quiz_questions("Math", "easy", 1)
+
+        self.assertEqual(questions[0]["answer"], "4")
+        self.assertEqual(mock_client.chat.completions.create.call_count, 2)
+
+    @override_settings(QUIZ_QUESTION_CACHE={'BACKEND': 'none'})
+    @patch('openai.OpenAI')
+    def test_disabled_cache(self, mock_openai):
+        """The 'none' backend always calls OpenAI"""
+        reset_question_cache()
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+        mock_client.chat.completions.create.return_value = self.mock_openai_response
+
+        generate_quiz_questions("Math", "easy", 1)
+        generate_quiz_questions("Math", "easy", 1)
+
+        self.assertEqual(mock_client.chat.completions.create.call_count, 2)
+
+    def test_memory_backend_lru_and_ttl(self):
+        """
+        The in-process backend evicts least recently used and expired entries
+        """
+        backend = MemoryBackend(max_entries=2)
+        backend.set("a", "1", 60)
+        backend.set("b", "2", 60)
+        backend.get("a")
+        self.assertEqual(backend.set("c", "3", 60), 1)
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(backend.get("a"), "1")
+
+        backend.set("d", "4", -1)
+        self.assertIsNone(backend.get("d"))
+
+    def test_sqlite_backend_round_trip(self):
+        """The on-disk backend persists values and bounds its size"""
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = SQLiteBackend(
+                os.path.join(tmp, "cache.sqlite3"), max_entries=2
+            )
+            backend.set("a", [{"text": "q", "answer": "a"}], 60)
+            backend.set("b", [], 60)
+            backend.set("c", [], 60)
+            self.assertEqual(len(backend), 2)
+            self.assertIsNone(backend.get("a"))
+            self.assertEqual(backend.get("c"), [])
+            backend.set("d", [], -1)
+            self.assertIsNone(backend.get("d"))
+
+    def test_sqlite_backend_refreshes_access_times_coarsely(self):
+        """Hits within ACCESS_GRANULARITY of the last access do not write"""
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = SQLiteBackend(
+                os.path.join(tmp, "cache.sqlite3"), max_entries=2
+            )
+            with patch(
+                'quizzes.question_cache.time.time', return_value=1000.0
+            ):
+                backend.set("a", [], 3600)
+            statements = []
+            backend._connection().set_trace_callback(statements.append)
+            with patch(
+                'quizzes.question_cache.time.time', return_value=1059.0
+            ):
+                self.assertEqual(backend.get("a"), [])
+            self.assertFalse([s for s in statements if 'UPDATE' in s])
+            with patch(
+                'quizzes.question_cache.time.time', return_value=1060.0
+            ):
+                self.assertEqual(backend.get("a"), [])
+            self.assertTrue([s for s in statements if 'UPDATE' in s])
+
+
+@override_settings(QUESTION_POOL={'SUBJECTS': ['Python']})
+class QuestionPoolTests(TestCase):
+    def setUp(self):
+        reset_question_cache()
+        self.user = User.objects.create_user(
+            username="student", password="pass12345"
+        )
+        PoolQuestion.objects.bulk_create(
+            [
+                PoolQuestion(
+                    subject="python",
+                    difficulty="easy",
+                    text=f"Question {i}",
+                    answer=f"Answer {i}",
+                )
+                for i in range(15)
+            ]
+        )
+
+    def test_take_questions_does_not_repeat_for_user(self):
+        """A user never receives the same pooled question twice"""
+        first = take_questions("Python", "easy", self.user, 10)
+        self.assertEqual(len(first), 10)
+        self.assertIsNone(take_questions("Python", "easy", self.user, 10))
+
+        other = User.objects.create_user(
+            username="other", password="pass12345"
+        )
+        self.assertEqual(len(take_questions("python", "easy", other, 10)), 10)
+
+    def test_unpooled_subjects_skip_the_pool_query(self):
+        with override_settings(QUESTION_POOL={}), self.assertNumQueries(0):
+            self.assertIsNone(take_questions("Python", "easy", self.user, 10))
+        with override_settings(QUESTION_POOL={'TOP_SUBJECTS': 5}):
+            self.assertEqual(
+                len(take_questions("Python", "easy", self.user, 10)), 10
+            )
+
+    @patch('openai.OpenAI')
+    def test_generate_view_serves_from_pool(self, mock_openai):
+        """GenerateQuizView uses pooled questions without calling OpenAI"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.post(
+            '/api/generate/', {'subject': 'Python', 'difficulty': 'easy'}
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['questions']), 10)
+        mock_openai.assert_not_called()
+
+    @override_settings(
+        QUESTION_POOL={
+            'LOW_WATERMARK': 20,
+            'HIGH_WATERMARK': 18,
+            'BATCH_SIZE': 2,
+        }
+    )
+    @patch('quizzes.question_pool.request_quiz_questions')
+    def test_refill_bucket_skips_duplicates(self, mock_request):
+        """Refills stop at the high watermark and ignore known questions"""
+        mock_request.side_effect = [
+            [
+                {"text": "question 0", "answer": "a"},
+                {"text": "New 1", "answer": "b"},
+            ],
+            [
+                {"text": "New 2", "answer": "c"},
+                {"text": "New 3", "answer": "d"},
+            ],
+        ]
+
+        added = refill_bucket("Python", "easy")
+
+        self.assertEqual(added, 3)
+        self.assertEqual(
+            PoolQuestion.objects.filter(subject="python").count(), 18
+        )
+
+    @override_settings(
+        QUESTION_POOL={
+            'SUBJECTS': ['Python'],
+            'DIFFICULTIES': ['easy'],
+            'MAX_SERVES': 1,
+        }
+    )
+    @patch('quizzes.question_pool.request_quiz_questions')
+    def test_refill_command_retires_exhausted_questions(self, mock_request):
+        """The refill command deletes over-served questions before refilling"""
+        mock_request.return_value = []
+        take_questions("Python", "easy", self.user, 10)
+
+        out = StringIO()
+        call_command('refill_question_pool', '--once', stdout=out)
+
+        self.assertIn('Retired 10', out.getvalue())
+        self.assertEqual(PoolQuestion.objects.count(), 5)
+        mock_request.assert_called_once()
+
+
+class AsyncGenerationTests(TestCase):
+    def setUp(self):
+        reset_question_cache()
+        reset_clients()
+        self.user = User.objects.create_user(
+            username="async", password="pass12345"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.completion = MagicMock()
+        self.completion.choices = [
+            MagicMock(
+                message=MagicMock(
+                    content=json.dumps(
+                        {
+                            "questions": [
+                                {
+                                    "text": f"Question {i}",
+                                    "answer": f"Answer {i}",
+                                }
+                                for i in range(10)
+                            ]
+                        }
+                    )
+                )
+            )
+        ]
+
+    @patch('openai.OpenAI')
+    def test_sync_client_is_shared(self, mock_openai):
+        """The synchronous client is built once per process"""
+        self.assertIs(get_client(), get_client())
+        mock_openai.assert_called_once()
+
+    @patch('openai.AsyncOpenAI')
+    def test_async_generate_view(self, mock_async_openai):
+        """The async endpoint generates and saves a quiz through AsyncOpenAI"""
+        mock_client = MagicMock()
+        mock_client.chat.completions.create = AsyncMock(
+            return_value=self.completion
+        )
+        mock_async_openai.return_value = mock_client
+
+        response = AsyncClient().post(
+            '/api/generate/async/',
+            {'subject': 'Async', 'difficulty': 'easy'},
+            content_type='application/json',
+            headers={'Authorization': f'Token {self.token.key}'},
+        )
+        response = async_to_sync_response(response)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['questions']), 10)
+        self.assertEqual(
+            Quiz.objects.get(subject='Async').questions.count(), 10
+        )
+        mock_client.chat.completions.create.assert_awaited_once()
+
+    def test_async_generate_view_requires_token(self):
+        """Requests without a token are rejected"""
+        response = async_to_sync_response(
+            AsyncClient().post(
+                '/api/generate/async/',
+                {'subject': 'Async'},
+                content_type='application/json',
+            )
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+def async_to_sync_response(coroutine):
+    """Run an AsyncClient request from a synchronous test."""
+    from asgiref.sync import async_to_sync
+
+    async def run():
+        return await coroutine
+    return async_to_sync(run)()
+
+
+class StreamingGenerationTests(TestCase):
+    document = json.dumps({"questions": [
+        {"text": "What is {braces} and \"quotes\"?", "answer": "Strings [1]"},
+        {"text": "Second?", "answer": "Yes"},
+    ]})
+
+    def test_parser_emits_objects_at_any_chunk_boundary(self):
+        """Objects are emitted once complete regardless of how text is split"""
+        for size in (1, 3, 7, len(self.document)):
+            parser = QuestionStreamParser()
+            items = []
+            for start in range(0, len(self.document), size):
+                items.extend(parser.feed(self.document[start:start + size]))
+            self.assertEqual(items, json.loads(self.document)["questions"])
+
+    def test_parser_emits_first_object_before_document_ends(self):
+        """The first question is available before the array is closed"""
+        parser = QuestionStreamParser()
+        cut = self.document.index("Second") - 10
+        self.assertEqual(len(parser.feed(self.document[:cut])), 1)
+
+    @patch('openai.OpenAI')
+    def test_stream_view_emits_questions(self, mock_openai):
+        """The SSE endpoint saves and emits each streamed question"""
+        reset_question_cache()
+        reset_clients()
+        chunks = [
+            MagicMock(
+                choices=[
+                    MagicMock(
+                        delta=MagicMock(content=self.document[i:i + 5])
+                    )
+                ]
+            )
+            for i in range(0, len(self.document), 5)
+        ]
+        mock_client = MagicMock()
+        mock_client.chat.completions.create.return_value = iter(chunks)
+        mock_openai.return_value = mock_client
+
+        user = User.objects.create_user(
+            username="streamer", password="pass12345"
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(
+            '/api/generate/stream/',
+            {'subject': 'Streams', 'difficulty': 'easy'},
+            format='json',
+            HTTP_ACCEPT='text/event-stream',
+        )
+        body = read_body(response).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = [block.split('\n')[0] for block in body.strip().split('\n\n')]
+        self.assertEqual(
+            events, ['event: quiz'] + ['event: question'] * 2 + ['event: done']
+        )
+        self.assertEqual(
+            Quiz.objects.get(subject='Streams').questions.count(), 2
+        )
+
+
+class GenerationJobTests(TestCase):
+    def setUp(self):
+        reset_question_cache()
+        self.user = User.objects.create_user(
+            username="queued", password="pass12345"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_async_generate_returns_job(self):
+        """
+        Async requests are queued and identical in-flight requests share a job
+        """
+        first = self.client.post(
+            '/api/generate/?async=1',
+            {'subject': 'Queues', 'difficulty': 'easy'},
+        )
+        second = self.client.post(
+            '/api/generate/',
+            {'subject': ' queues', 'difficulty': 'easy', 'async': 'true'},
+        )
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(first.data['status'], 'pending')
+        self.assertEqual(first.data['id'], second.data['id'])
+        self.assertEqual(GenerationJob.objects.count(), 1)
+
+        response = self.client.get(f"/api/generate/jobs/{first.data['id']}/")
+        self.assertEqual(response.data['status'], 'pending')
+
+    def test_jobs_are_private_to_their_owner(self):
+        """Another user neither joins nor sees a job"""
+        job = self.client.post(
+            '/api/generate/?async=1',
+            {'subject': 'Queues', 'difficulty': 'easy'},
+        ).data
+        other = APIClient()
+        other.force_authenticate(
+            User.objects.create_user(username="other", password="pass12345")
+        )
+
+        self.assertEqual(
+            other.get(f"/api/generate/jobs/{job['id']}/").status_code, 404
+        )
+        own = other.post(
+            '/api/generate/?async=1',
+            {'subject': 'Queues', 'difficulty': 'easy'},
+        ).data
+        self.assertNotEqual(own['id'], job['id'])
+        self.assertEqual(
+            other.get(f"/api/generate/jobs/{own['id']}/").status_code, 200
+        )
+
+    @patch('quizzes.jobs.fetch_quiz_questions')
+    def test_worker_completes_job(self, mock_fetch):
+        """A claimed job creates its quiz and is marked done"""
+        mock_fetch.return_value = [{"text": "Q", "answer": "A"}] * 3
+        job, created = enqueue_generation("Queues", "easy", self.user)
+        self.assertTrue(created)
+
+        job = run_job(claim_next_job())
+
+        self.assertEqual(job.status, GenerationJob.STATUS_DONE)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.quiz.questions.count(), 3)
+        self.assertIsNone(claim_next_job())
+
+    @override_settings(GENERATION_JOBS={'MAX_ATTEMPTS': 2, 'RETRY_BACKOFF': 0})
+    @patch('quizzes.jobs.fetch_quiz_questions')
+    def test_worker_retries_then_fails(self, mock_fetch):
+        """Failed attempts are retried until max_attempts is reached"""
+        mock_fetch.side_effect = Exception(
+            "API Error: sk-secret at db-internal:5432"
+        )
+        enqueue_generation("Queues", "easy", self.user)
+
+        job = run_job(claim_next_job())
+        self.assertEqual(job.status, GenerationJob.STATUS_PENDING)
+        job = run_job(claim_next_job())
+        self.assertEqual(job.status, GenerationJob.STATUS_FAILED)
+        self.assertEqual(job.error, JOB_FAILED)
+
+        # A failed job no longer blocks a new identical request
+        _, created = enqueue_generation("Queues", "easy", self.user)
+        self.assertTrue(created)
+
+    @override_settings(GENERATION_JOBS={'MAX_ATTEMPTS': 2})
+    def test_stale_jobs_are_requeued_until_out_of_attempts(self):
+        """A job whose worker died counts the attempt and eventually fails"""
+        job, _ = enqueue_generation("Queues", "easy", self.user)
+        self.assertEqual(claim_next_job().id, job.id)
+        self.assertEqual(requeue_stale_jobs(), (0, 0))
+
+        GenerationJob.objects.update(
+            started_at=job.created_at - timedelta(hours=1)
+        )
+        self.assertEqual(requeue_stale_jobs(), (1, 0))
+        self.assertEqual(claim_next_job().id, job.id)
+
+        GenerationJob.objects.update(
+            started_at=job.created_at - timedelta(hours=1)
+        )
+        self.assertEqual(requeue_stale_jobs(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(
+            (job.status, job.attempts, job.error),
+            (GenerationJob.STATUS_FAILED, 2, JOB_TIMED_OUT),
+        )
+        self.assertIsNone(claim_next_job())
+
+
+class GenerationWorkerTests(TestCase):
+    @override_settings(GENERATION_JOBS={'STALE_AFTER': 600})
+    def test_stale_jobs_are_checked_at_most_every_half_stale_after(self):
+        """Idle worker threads do not write to the job table on every poll"""
+        module = 'quizzes.management.commands.run_generation_worker'
+        command = WorkerCommand(stdout=StringIO())
+        command.prepare_recovery()
+        with patch(
+            f'{module}.requeue_stale_jobs', return_value=(0, 0)
+        ) as requeue, patch(f'{module}.time.monotonic') as monotonic:
+            for now in (1000, 1001, 1299, 1300):
+                monotonic.return_value = now
+                command.recover_stale_jobs()
+        self.assertEqual(requeue.call_count, 2)
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        reset_question_cache()
+        reset_single_flight()
+
+    @patch('quizzes.quiz_service.request_quiz_questions')
+    def test_concurrent_identical_calls_are_coalesced(self, mock_request):
+        """Only one OpenAI call is made for concurrent identical requests"""
+        started = threading.Event()
+
+        def slow_request(*args):
+            started.set()
+            time.sleep(0.2)
+            return [{"text": "Q", "answer": "A"}]
+        mock_request.side_effect = slow_request
+
+        results = []
+        def worker():
+            results.append(fetch_quiz_questions("Crowds", "easy", 1))
+
+        leader = threading.Thread(target=worker)
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in followers:
+            thread.start()
+        for thread in [leader] + followers:
+            thread.join()
+
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(
+            all(result == [{"text": "Q", "answer": "A"}] for result in results)
+        )
+        stats = get_single_flight().stats()
+        self.assertEqual(stats['executed'], 1)
+        self.assertEqual(
+            stats['coalesced_local'] + get_question_cache().stats()['hits'], 4
+        )
+
+    def test_errors_are_shared_with_waiters(self):
+        """
+        Waiters see the leader's exception and the key is released afterwards
+        """
+        flight = SingleFlight(tempfile.gettempdir())
+        with self.assertRaises(ValueError):
+            flight.do("key", lambda: (_ for _ in ()).throw(ValueError("boom")))
+        self.assertEqual(flight.do("key", lambda: "ok"), "ok")
+
+    def test_cross_process_recheck(self):
+        """
+        A result stored by another process is reused instead of calling out
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            flight = SingleFlight(tmp)
+            fn = MagicMock(return_value="fresh")
+
+            result = flight.do(
+                "key", fn, recheck=lambda: "stored", cross_process=True
+            )
+
+            self.assertEqual(result, "stored")
+            fn.assert_not_called()
+            self.assertEqual(flight.stats()['coalesced_remote'], 1)
+
+    def test_process_lock_is_exclusive_and_cleaned_up(self):
+        """
+        Leaders in different processes never overlap, and leave no lock files
+        behind
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            # Separate groups open their own lock files, like separate
+            # processes
+            flights = [SingleFlight(tmp) for _ in range(4)]
+            running, overlaps = [], []
+
+            def fn():
+                running.append(1)
+                overlaps.append(len(running))
+                time.sleep(0.01)
+                running.pop()
+                return "fresh"
+
+            threads = [
+                threading.Thread(
+                    target=lambda f=flight: [
+                        f.do("key", fn, cross_process=True) for _ in range(5)
+                    ]
+                )
+                for flight in flights
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(len(overlaps), 20)
+            self.assertEqual(max(overlaps), 1)
+            self.assertEqual(os.listdir(tmp), [])
+
+
+    def test_waits_are_bounded(self):
+        """A stuck leader or lock holder only delays others by ``timeout``"""
+        with tempfile.TemporaryDirectory() as tmp:
+            flight = SingleFlight(tmp, timeout=0.1)
+            release = threading.Event()
+            leader = threading.Thread(
+                target=flight.do, args=("key", release.wait)
+            )
+            leader.start()
+            time.sleep(0.05)
+            self.assertEqual(flight.do("key", lambda: "own"), "own")
+
+            other = SingleFlight(tmp, timeout=0.1)
+            holder = threading.Thread(
+                target=other.do, args=("shared", release.wait),
+                kwargs={'cross_process': True},
+            )
+            holder.start()
+            time.sleep(0.05)
+            self.assertEqual(
+                flight.do("shared", lambda: "own", cross_process=True), "own"
+            )
+            release.set()
+            leader.join()
+            holder.join()
+            self.assertEqual(flight.stats()['timed_out'], 2)
+
+    async def test_concurrent_async_calls_are_coalesced(self):
+        flight = SingleFlight(tempfile.gettempdir())
+        calls = []
+
+        async def request():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "shared"
+
+        results = await asyncio.gather(
+            *(flight.ado("key", request) for _ in range(5))
+        )
+        self.assertEqual(results, ["shared"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats()['coalesced_local'], 4)
+
+        async def stuck():
+            await asyncio.sleep(1)
+
+        flight.timeout = 0.05
+        leader = asyncio.ensure_future(flight.ado("stuck", stuck))
+        await asyncio.sleep(0)
+        self.assertEqual(await flight.ado("stuck", request), "shared")
+        leader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.assertEqual(flight.stats()['timed_out'], 1)
+
+
+class QuizPersistenceTests(TestCase):
+    def test_create_with_questions_uses_bulk_insert(self):
+        """
+        Quiz and questions are written with a constant number of statements
+        """
+        questions = [{"text": f"Q{i}", "answer": f"A{i}"} for i in range(50)]
+        # SAVEPOINT, quiz INSERT, questions INSERT, RELEASE
+        with self.assertNumQueries(4):
+            quiz = Quiz.objects.create_with_questions(
+                "Bulk", "easy", questions
+            )
+        self.assertEqual(quiz.questions.count(), 50)
+
+    def test_create_with_questions_is_atomic(self):
+        """A bad question rolls back the whole quiz"""
+        with self.assertRaises(KeyError):
+            Quiz.objects.create_with_questions(
+                "Broken", "easy", [{"text": "Q", "answer": "A"}, {"text": "Q"}]
+            )
+        self.assertFalse(Quiz.objects.filter(subject="Broken").exists())
+
+
+class HistoryListingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="historian", password="pass12345"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.quiz = Quiz.objects.create_with_questions(
+            "History",
+            "easy",
+            [{"text": f"Q{i}", "answer": f"A{i}"} for i in range(5)],
+        )
+
+    def add_history(self, count, score):
+        for _ in range(count):
+            history = UserQuizHistory(user=self.user, quiz=self.quiz)
+            history.set_score(score, self.quiz.question_count)
+            history.save()
+
+    def test_submit_stores_percentage_and_certificate(self):
+        """Submitting stores the derived percentage and certificate flag"""
+        response = self.client.post(
+            f'/api/submit/{self.quiz.id}/',
+            {'answers': ['A0', 'A1', 'A2', 'A3', 'x']},
+            format='json',
+        )
+        history = UserQuizHistory.objects.get(pk=response.data['history_id'])
+        self.assertEqual(history.score_percentage, 80)
+        self.assertTrue(history.has_certificate)
+
+    def test_history_list_query_count_is_constant(self):
+        """Listing history costs the same number of queries for 1 or 20 rows"""
+        # One aggregate for the ETag, one for the page
+        self.add_history(1, 5)
+        with self.assertNumQueries(2):
+            self.client.get('/api/history/')
+        self.add_history(19, 2)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/history/')
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_certificates_only_include_passing_scores(self):
+        """The certificates listing filters on the stored flag"""
+        self.add_history(2, 4)
+        self.add_history(3, 3)
+        response = self.client.get('/api/certificates/')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertTrue(
+            all(
+                row['score_percentage'] == 80
+                for row in response.data['results']
+            )
+        )
+
+    def test_sql_certificate_filter_matches_python_filter(self):
+        """
+        The stored flag selects exactly what the old per-row Python filter did,
+        at every boundary
+        """
+        from .management.commands.benchmark_certificates import (
+            python_side,
+            sql_side,
+        )
+
+        # 31/39 is 79.49%, 35/44 is 79.55% (rounds to 80 but does not pass),
+        # 4/5 is exactly 80%
+        for total in (0, 1, 3, 5, 7, 39, 44):
+            quiz = Quiz.objects.create_with_questions(
+                f"Boundary {total}",
+                "easy",
+                [{"text": f"Q{i}", "answer": f"A{i}"} for i in range(total)],
+            )
+            for score in range(total + 1):
+                history = UserQuizHistory(user=self.user, quiz=quiz)
+                history.set_score(score, quiz.question_count)
+                history.save()
+
+        certificates = sql_side(self.user)
+        self.assertEqual(sorted(certificates), sorted(python_side(self.user)))
+        passed = set(
+            UserQuizHistory.objects.filter(id__in=certificates).values_list(
+                'quiz__subject', 'score'
+            )
+        )
+        self.assertIn(("Boundary 5", 4), passed)
+        self.assertIn(("Boundary 39", 32), passed)
+        self.assertNotIn(("Boundary 39", 31), passed)
+        self.assertNotIn(("Boundary 44", 35), passed)
+        self.assertFalse(any(subject == "Boundary 0" for subject, _ in passed))
+
+    def test_migration_sets_flags_from_exact_scores(self):
+        """0005 backfills flags with the same rule as ``set_score``"""
+        from django.apps import apps
+        populate = importlib.import_module(
+            'quizzes.migrations.0005_populate_denormalized_scores'
+        ).populate
+        quiz = Quiz.objects.create_with_questions(
+            "Rounded", "easy",
+            [{"text": f"Q{i}", "answer": f"A{i}"} for i in range(44)]
+        )
+        empty = Quiz.objects.create_with_questions("Empty", "easy", [])
+        rows = [
+            UserQuizHistory.objects.create(
+                user=self.user, quiz=quiz, score=score
+            )
+            for score in (35, 36)
+        ]
+        rows.append(
+            UserQuizHistory.objects.create(user=self.user, quiz=empty, score=0)
+        )
+
+        populate(apps, None)
+
+        flags = UserQuizHistory.objects.in_bulk([row.id for row in rows])
+        self.assertEqual(
+            [(flags[row.id].score_percentage, flags[row.id].has_certificate)
+             for row in rows],
+            [(80, False), (82, True), (0, False)],
+        )
+
+    def test_history_list_is_paginated_and_slim(self):
+        """Listings are cursor-paginated and omit questions and the user"""
+        self.add_history(25, 5)
+        response = self.client.get('/api/history/')
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertIsNotNone(response.data['next'])
+        row = response.data['results'][0]
+        self.assertNotIn('user', row)
+        self.assertNotIn('questions', row['quiz'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+
+    def test_history_detail_is_full(self):
+        """The detail endpoint embeds the full quiz"""
+        self.add_history(1, 5)
+        history = UserQuizHistory.objects.get()
+        response = self.client.get(f'/api/history/{history.id}/')
+        self.assertEqual(len(response.data['quiz']['questions']), 5)
+        self.assertEqual(response.data['user']['username'], 'historian')
+
+    def test_sparse_fieldsets(self):
+        """?fields= limits the top-level fields returned"""
+        response = self.client.get('/api/quizzes/?fields=id,subject')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'subject'})
+        response = self.client.get(
+            f'/api/quizzes/{self.quiz.id}/?fields=questions'
+        )
+        self.assertEqual(set(response.data), {'questions'})
+
+
+class ApiBenchmarkTests(TestCase):
+    def test_query_counts_do_not_exceed_baseline(self):
+        """
+        Every endpoint stays within the query counts recorded in the baseline
+        """
+        from .api_benchmark import compare, run_benchmark, seed
+        from .management.commands.benchmark_api import DEFAULT_BASELINE
+
+        with open(DEFAULT_BASELINE) as handle:
+            baseline = json.load(handle)
+        results = run_benchmark(
+            seed(users=5, quizzes=5, history=50), iterations=1
+        )
+
+        self.assertEqual(compare(results, baseline, check_latency=False), [])
+        statuses = {
+            name: results[name]['status']
+            for name in ('generate-batch', 'logout', 'metrics')
+        }
+        self.assertEqual(
+            statuses,
+            {'generate-batch': [202], 'logout': [204], 'metrics': [200]},
+        )
+
+
+class GradingEngineTests(TestCase):
+    def setUp(self):
+        self.engine = GradingEngine()
+
+    def test_normalization(self):
+        """Case, accents, punctuation, articles and spacing are ignored"""
+        self.assertEqual(
+            normalize_answer("  The  Café, Paris! "), "cafe paris"
+        )
+        self.assertEqual(normalize_answer("1,000"), "1000")
+        self.assertEqual(normalize_answer("-3.5"), "-3.5")
+
+    def test_grade_normalized_and_fuzzy_answers(self):
+        """Near-miss spellings are accepted, different answers are not"""
+        result = self.engine.grade(
+            ["paris.", "The Paris", "Pariss", "London", "George Washington"],
+            ["Paris", "Paris", "Paris", "Paris", "Washington, George"],
+        )
+        self.assertEqual(
+            [r.correct for r in result.results],
+            [True, True, True, False, True],
+        )
+        self.assertEqual(
+            [r.method for r in result.results][:3], ["exact", "exact", "fuzzy"]
+        )
+        self.assertEqual(result.score, 4)
+        self.assertEqual(result.total, 5)
+
+    def test_numeric_tolerance(self):
+        """Numbers match within tolerance and are never fuzzily matched"""
+        result = self.engine.grade(
+            ["3.14159", "1,000", "11", "10"], ["3.1416", "1000", "10", "100"]
+        )
+        self.assertEqual(
+            [r.correct for r in result.results], [True, True, False, False]
+        )
+        self.assertTrue(
+            all(r.method in ("numeric", "exact") for r in result.results)
+        )
+
+    def test_wrong_numbers_and_near_names_are_rejected(self):
+        """
+        Years, ordinals and regnal numbers must match; similar names are not
+        enough
+        """
+        results = self.engine.grade_batch(
+            [
+                ("1940", "1945"),
+                ("1950", "1945"),
+                ("1945", "1945"),
+                ("Austria", "Australia"),
+                ("World War 1", "World War 2"),
+                ("Henry VII", "Henry VIII"),
+                ("World War I", "World War 1"),
+                ("Henry the VIII", "Henry VIII"),
+            ]
+        )
+        self.assertEqual(
+            [r.correct for r in results],
+            [False, False, True, False, False, False, True, True],
+        )
+
+    def test_fuzzy_comparisons_are_vectorized(self):
+        """requirements.txt ships rapidfuzz and NumPy: one cpdist call"""
+        from . import grading
+        self.assertTrue(grading._cpdist_available)
+        with patch.object(grading._process, 'cpdist',
+                          wraps=grading._process.cpdist) as cpdist:
+            results = self.engine.grade_batch(
+                [("Pariss", "Paris"), ("Lodnon", "London")]
+            )
+        cpdist.assert_called_once()
+        self.assertEqual([r.method for r in results], ["fuzzy", "fuzzy"])
+
+    def test_words_spelled_like_roman_numerals_are_words(self):
+        """Only capitals and longer numerals count, never words like "mix" """
+        results = self.engine.grade_batch([
+            ("I think Paris", "Paris"), ("Paris, I think", "Paris"),
+            ("mix", "mixture"), ("mixx", "mix"), ("c", "cc"),
+            ("vitamine c", "Vitamin C"), ("Elizabeth I", "Elizabeth II"),
+            ("Luis xiv", "Louis XIV"), ("Louis xiv", "Louis XV"),
+        ])
+        # Words are left to the similarity check instead of being rejected
+        self.assertEqual([r.method for r in results[:5]], ["fuzzy"] * 5)
+        # A numeral written in capitals on one side is one on both
+        self.assertEqual([(r.correct, r.method) for r in results[5:]], [
+            (True, "fuzzy"), (False, "numeric"),
+            (True, "fuzzy"), (False, "numeric"),
+        ])
+
+    def test_letter_choices_are_not_articles(self):
+        """An answer key of "A" is still compared, case-insensitively"""
+        self.assertEqual(normalize_answer("A"), "a")
+        results = self.engine.grade_batch([("a", "A"), ("B", "A"), ("", "A")])
+        self.assertEqual([(r.correct, r.method) for r in results],
+                         [(True, "exact"), (False, "fuzzy"), (False, "empty")])
+
+    def test_missing_answers(self):
+        """Unanswered questions count against the total"""
+        result = self.engine.grade(["Paris"], ["Paris", "4"])
+        self.assertEqual((result.score, result.total), (1, 2))
+        self.assertEqual(result.results[1].method, "missing")
+
+    def test_submit_returns_per_question_results(self):
+        """SubmitQuizView reports a result per question"""
+        user = User.objects.create_user(
+            username="grader", password="pass12345"
+        )
+        quiz = Quiz.objects.create_with_questions(
+            "Capitals",
+            "easy",
+            [
+                {"text": "France?", "answer": "Paris"},
+                {"text": "2+2?", "answer": "4"},
+            ],
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(
+            f'/api/submit/{quiz.id}/',
+            {'answers': ['the paris', '5']},
+            format='json',
+        )
+        self.assertEqual(response.data['score'], 1)
+        self.assertEqual(
+            [r['correct'] for r in response.data['results']], [True, False]
+        )
+
+
+
+class RegradeCommandTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="regrader", password="pass12345"
+        )
+        self.quiz = Quiz.objects.create_with_questions(
+            "Capitals",
+            "easy",
+            [
+                {"text": "France?", "answer": "Paris"},
+                {"text": "Italy?", "answer": "Rome"},
+            ],
+        )
+
+    def add_attempt(self, answers, score):
+        history = UserQuizHistory(
+            user=self.user, quiz=self.quiz, answers=answers
+        )
+        history.set_score(score, 2)
+        history.save()
+        return history
+
+    def test_submit_stores_answers(self):
+        """Submitted answers are kept on the attempt"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            f'/api/submit/{self.quiz.id}/',
+            {'answers': ['Paris', 4]},
+            format='json',
+        )
+        history = UserQuizHistory.objects.get(pk=response.data['history_id'])
+        self.assertEqual(history.answers, ['Paris', '4'])
+
+    def test_regrade_updates_changed_scores(self):
+        """
+        Stale scores are rewritten and attempts without answers are left alone
+        """
+        stale = self.add_attempt(['paris', 'the rome'], 0)
+        current = self.add_attempt(['Paris', 'Milan'], 1)
+        legacy = self.add_attempt([], 0)
+        out = StringIO()
+        call_command('regrade', '--chunk-size', '1', stdout=out)
+
+        stale.refresh_from_db()
+        self.assertEqual(
+            (stale.score, stale.score_percentage, stale.has_certificate),
+            (2, 100, True),
+        )
+        current.refresh_from_db()
+        self.assertEqual(current.score, 1)
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.score, 0)
+        self.assertIn('Re-graded 2 attempts, 1 changed', out.getvalue())
+
+    def test_regrade_resumes_from_checkpoint(self):
+        """A checkpoint skips attempts that were already re-graded"""
+        first = self.add_attempt(['Paris', 'Rome'], 0)
+        second = self.add_attempt(['Paris', 'Rome'], 0)
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'regrade.json')
+            with open(checkpoint, 'w') as handle:
+                json.dump({'last_id': first.id}, handle)
+            call_command(
+                'regrade', '--checkpoint', checkpoint, stdout=StringIO()
+            )
+            self.assertFalse(os.path.exists(checkpoint))
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.score, second.score), (0, 2))
+
+    def test_regrade_with_process_pool(self):
+        """Grading in worker processes gives the same scores"""
+        attempts = [self.add_attempt(['Paris', 'Rome'], 0) for _ in range(5)]
+        call_command(
+            'regrade', '--chunk-size', '2', '--workers', '2', stdout=StringIO()
+        )
+        self.assertEqual(
+            {
+                score
+                for score in UserQuizHistory.objects.filter(
+                    id__in=[a.id for a in attempts]
+                ).values_list('score', flat=True)
+            },
+            {2},
+        )
+
+
+def file_caches(directory):
+    """A CACHES setting whose default alias is shared between processes."""
+    return {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directory,
+        }
+    }
+
+
+class AnswerKeyCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_answer_key_cache()
+        self.user = User.objects.create_user(
+            username="submitter", password="pass12345"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.quiz = Quiz.objects.create_with_questions(
+            "Order",
+            "easy",
+            [{"text": f"Q{i}", "answer": f"A{i}"} for i in range(5)],
+        )
+
+    def test_answer_key_is_in_question_order(self):
+        """
+        The key follows question ids regardless of the database's row order
+        """
+        self.assertEqual(
+            get_answer_key(self.quiz.id), [f"A{i}" for i in range(5)]
+        )
+        self.assertIsNone(get_answer_key(self.quiz.id + 1000))
+
+    def test_warm_submit_only_writes(self):
+        """With the key cached, submitting is a single INSERT"""
+        answers = {'answers': [f"A{i}" for i in range(5)]}
+        self.client.post(
+            f'/api/submit/{self.quiz.id}/', answers, format='json'
+        )
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                f'/api/submit/{self.quiz.id}/', answers, format='json'
+            )
+        self.assertEqual(response.data['score'], 5)
+
+    def test_shared_cache_serves_other_workers(self):
+        """
+        A worker with an empty local cache reads the key from a cross-process
+        cache
+        """
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            CACHES=file_caches(directory)
+        ):
+            reset_answer_key_cache()
+            get_answer_key(self.quiz.id)
+            reset_answer_key_cache()
+            with self.assertNumQueries(0):
+                self.assertEqual(len(get_answer_key(self.quiz.id)), 5)
+        reset_answer_key_cache()
+
+    def test_local_memory_cache_is_not_shared(self):
+        """
+        Without CACHES the default alias is per process and only the local tier
+        is used
+        """
+        self.assertIsNone(get_answer_key_cache().shared)
+
+    def test_question_changes_invalidate_the_key(self):
+        """Editing or deleting a question drops the cached key"""
+        get_answer_key(self.quiz.id)
+        question = self.quiz.questions.order_by('id').first()
+        question.answer = "Changed"
+        question.save()
+        self.assertEqual(get_answer_key(self.quiz.id)[0], "Changed")
+        question.delete()
+        self.assertEqual(len(get_answer_key(self.quiz.id)), 4)
+
+    def test_missing_quiz_returns_404(self):
+        response = self.client.post(
+            '/api/submit/999999/', {'answers': []}, format='json'
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class SQLiteMaintenanceTests(TestCase):
+    def test_maintenance_pass(self):
+        """A single pass refreshes statistics on the SQLite test database"""
+        out = StringIO()
+        call_command('sqlite_maintenance', '--once', stdout=out)
+        self.assertIn('Analyzed', out.getvalue())
+        self.assertIn('SQLite maintenance done', out.getvalue())
+
+
+class TokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_token_cache()
+        self.user = User.objects.create_user(
+            username="cached", email="cached@example.com", password="pass12345"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_warm_cache_skips_auth_query(self):
+        """
+        Only the listing itself hits the database once the token is cached
+        """
+        self.client.get('/api/quizzes/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/quizzes/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout_revokes_cached_token(self):
+        """A logged out token is rejected even though it was cached"""
+        self.client.get('/api/quizzes/')
+        self.assertEqual(self.client.post('/api/logout/').status_code, 204)
+        self.assertIn(self.client.get('/api/quizzes/').status_code, (401, 403))
+
+    def test_password_change_invalidates_cache(self):
+        """Saving the user drops its cached tokens"""
+        self.client.get('/api/quizzes/')
+        self.assertIsNotNone(get_token_cache().get(self.token.key))
+        self.user.set_password("changed12345")
+        self.user.save()
+        self.assertIsNone(get_token_cache().get(self.token.key))
+
+    def test_cached_entry_has_no_password_hash(self):
+        """
+        Only the id and active flag are cached; other fields load on access
+        """
+        self.client.get('/api/quizzes/')
+        user = get_token_cache().get(self.token.key)
+        self.assertEqual(user.id, self.user.id)
+        self.assertIn('password', user.get_deferred_fields())
+        self.assertFalse(any(
+            isinstance(entry, User) or self.user.password in str(entry)
+            for entry in get_token_cache().local._data.values()
+        ))
+        self.assertEqual(user.username, "cached")
+
+    def test_revocation_reaches_other_workers(self):
+        """
+        Workers share entries only through a cross-process cache; with the
+        per-process default a stale entry lives at most LOCAL_TIMEOUT
+        """
+        config = dict(TOKEN_CACHE_CONFIG, LOCAL_TIMEOUT=60, TIMEOUT=3600)
+        first, second = TokenUserCache(config), TokenUserCache(config)
+        self.assertIsNone(first.shared)
+        first.set(self.token.key, self.user)
+        second.set(self.token.key, self.user)
+        first.invalidate([self.token.key])
+        self.assertIsNone(first.get(self.token.key))
+        self.assertIsNotNone(second.get(self.token.key))
+        with patch(
+            'quizzes.question_cache.time.time', return_value=time.time() + 61
+        ):
+            self.assertIsNone(second.get(self.token.key))
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            CACHES=file_caches(directory)
+        ):
+            first, second = TokenUserCache(config), TokenUserCache(config)
+            self.assertIsNotNone(first.shared)
+            first.set(self.token.key, self.user)
+            self.assertEqual(
+                second.get(self.token.key).id, self.user.id
+            )  # Served by the shared tier
+            third = TokenUserCache(config)
+            first.invalidate([self.token.key])
+            self.assertIsNone(third.get(self.token.key))
+            with patch(
+                'quizzes.question_cache.time.time',
+                return_value=time.time() + 61,
+            ):
+                self.assertIsNone(second.get(self.token.key))
+
+    def test_email_login_is_case_insensitive(self):
+        """Emails are stored lower-cased and matched regardless of case"""
+        client = APIClient()
+        response = client.post(
+            '/api/register/',
+            {'email': ' Mixed@Example.com', 'password': 'pass12345'},
+            format='json',
+        )
+        self.assertEqual(response.data['user']['email'], 'mixed@example.com')
+        duplicate = client.post(
+            '/api/register/',
+            {'email': 'MIXED@example.com', 'password': 'pass12345'},
+            format='json',
+        )
+        self.assertEqual(duplicate.status_code, 400)
+        response = client.post(
+            '/api/token-auth/',
+            {'email': 'MIXED@example.COM', 'password': 'pass12345'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        wrong = client.post(
+            '/api/token-auth/',
+            {'email': 'mixed@example.com', 'password': 'nope'},
+            format='json',
+        )
+        self.assertEqual(wrong.status_code, 401)
+
+    def test_email_lookup_uses_index(self):
+        """The lookup is served by the LOWER(email) expression index"""
+        from .views import users_by_email
+        self.assertIn(
+            'auth_user_email_lower_idx',
+            users_by_email('cached@example.com').explain(),
+        )
+
+
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_token_cache()
+        self.client = APIClient()
+
+    def login(self):
+        return self.client.post(
+            '/api/token-auth/',
+            {'email': 'hash@example.com', 'password': 'pass12345'},
+            format='json',
+        )
+
+    def test_unknown_hasher_is_a_configuration_error(self):
+        spec = importlib.util.find_spec('quizz_project.settings')
+        with patch.dict(os.environ, PASSWORD_HASHER='md5'):
+            with self.assertRaisesMessage(
+                ImproperlyConfigured, 'pbkdf2, argon2'
+            ):
+                spec.loader.exec_module(importlib.util.module_from_spec(spec))
+
+    def test_pool_rejects_when_full(self):
+        """
+        Requests beyond the workers and queue get HashingBusy instead of
+        waiting
+        """
+        pool = HashingPool(
+            workers=1, max_queue=0, queue_timeout=0.01, retry_after=2
+        )
+        release = threading.Event()
+        worker = threading.Thread(target=pool.run, args=(release.wait,))
+        worker.start()
+        time.sleep(0.05)
+        with self.assertRaises(HashingBusy) as raised:
+            pool.run(lambda: None)
+        release.set()
+        worker.join()
+        self.assertEqual(raised.exception.retry_after, 2)
+        self.assertEqual(pool.stats()['rejected'], 1)
+
+    def test_busy_pool_returns_503(self):
+        """Login storms beyond the pool's capacity are shed with Retry-After"""
+        User.objects.create_user(
+            username="hash", email="hash@example.com", password="pass12345"
+        )
+        with patch('quizzes.views.run_hashing', side_effect=HashingBusy(1)):
+            response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_login_rehashes_outdated_password(self):
+        """
+        A hash made with an older cost is upgraded on the next successful login
+        """
+        with override_settings(
+            PASSWORD_HASHING=dict(
+                settings.PASSWORD_HASHING, PBKDF2_ITERATIONS=1000
+            )
+        ):
+            user = User.objects.create_user(
+                username="hash", email="hash@example.com", password="pass12345"
+            )
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1000$'))
+        with override_settings(
+            PASSWORD_HASHING=dict(
+                settings.PASSWORD_HASHING, PBKDF2_ITERATIONS=2000
+            )
+        ):
+            self.assertEqual(self.login().status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$2000$'))
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="etag", password="pass12345"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.quiz = Quiz.objects.create_with_questions(
+            "Caching",
+            "easy",
+            [{"text": f"Q{i}", "answer": f"A{i}"} for i in range(3)],
+        )
+
+    def add_attempt(self, score):
+        history = UserQuizHistory(user=self.user, quiz=self.quiz)
+        history.set_score(score, 3)
+        history.save()
+        return history
+
+    def test_quiz_detail_revalidates_without_loading_questions(self):
+        """A matching If-None-Match costs one query and returns 304"""
+        response = self.client.get(f'/api/quizzes/{self.quiz.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertFalse(response['ETag'].startswith('W/'))
+        with self.assertNumQueries(1):
+            cached = self.client.get(
+                f'/api/quizzes/{self.quiz.id}/',
+                HTTP_IF_NONE_MATCH=response['ETag'],
+            )
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+    def test_incomplete_quiz_is_not_cached(self):
+        """A quiz still being streamed must be revalidated"""
+        quiz = Quiz.objects.create(subject="Streaming", difficulty="easy")
+        response = self.client.get(f'/api/quizzes/{quiz.id}/')
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_history_etag_tracks_attempts(self):
+        """The weak list ETag holds until an attempt is added or re-graded"""
+        history = self.add_attempt(1)
+        listing = self.client.get('/api/history/')
+        etag = listing['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        self.assertIn('Authorization, Cookie', listing['Vary'])
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                '/api/history/', HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+
+        history.set_score(3, 3)
+        history.save()
+        regraded = self.client.get('/api/history/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(regraded.status_code, 200)
+        self.add_attempt(2)
+        self.assertEqual(
+            self.client.get(
+                '/api/history/', HTTP_IF_NONE_MATCH=regraded['ETag']
+            ).status_code,
+            200,
+        )
+
+    def test_list_etags_differ_per_listing(self):
+        """History and certificates listings never share validators"""
+        self.add_attempt(3)
+        history = self.client.get('/api/history/')
+        certificates = self.client.get('/api/certificates/')
+        self.assertNotEqual(history['ETag'], certificates['ETag'])
+        self.assertEqual(
+            self.client.get(
+                '/api/certificates/', HTTP_IF_NONE_MATCH=history['ETag']
+            ).status_code,
+            200,
+        )
+
+
+try:
+    import PIL
+except ImportError:  # pragma: no cover - Pillow is in requirements.txt
+    PIL = None
+
+
+@unittest.skipUnless(PIL, "Pillow is not installed")
+class CertificateRenderingTests(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            CERTIFICATES={'CACHE_DIR': self.cache_dir}
+        )
+        self.settings_override.enable()
+        self.user = User.objects.create_user(
+            username="graduate", password="pass12345"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        quiz = Quiz.objects.create_with_questions(
+            "Rendering",
+            "easy",
+            [{"text": f"Q{i}", "answer": f"A{i}"} for i in range(5)],
+        )
+        self.history = UserQuizHistory(user=self.user, quiz=quiz)
+        self.history.set_score(5, 5)
+        self.history.save()
+        self.url = f'/api/certificates/download/{self.history.id}/'
+
+    def tearDown(self):
+        self.settings_override.disable()
+        import shutil
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_pdf_is_rendered_once_and_served_from_cache(self):
+        """Repeat downloads stream the cached file without rendering again"""
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(
+            b''.join(response.streaming_content).startswith(b'%PDF')
+        )
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        with patch('quizzes.certificates.render_image') as render:
+            again = self.client.get(self.url)
+            b''.join(again.streaming_content)
+        render.assert_not_called()
+        self.assertEqual(again['ETag'], response['ETag'])
+        self.assertEqual(
+            self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=response['ETag']
+            ).status_code,
+            304,
+        )
+
+    def test_png_and_json_types(self):
+        png = self.client.get(self.url, {'type': 'png'})
+        self.assertTrue(b''.join(png.streaming_content).startswith(b'\x89PNG'))
+        data = json.loads(self.client.get(self.url, {'type': 'json'}).content)
+        self.assertEqual(data['certificate_id'], f'CERT-{self.history.id:06d}')
+        self.assertEqual(
+            self.client.get(self.url, {'type': 'gif'}).status_code, 400
+        )
+
+    def test_regrade_renders_a_new_file(self):
+        """
+        The cache key covers the printed fields, so a changed score is
+        re-rendered
+        """
+        etag = self.client.get(self.url)['ETag']
+        self.history.set_score(4, 5)
+        self.history.save()
+        self.assertNotEqual(self.client.get(self.url)['ETag'], etag)
+        # The earlier render can never be served again
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_cache_is_capped(self):
+        """Beyond MAX_FILES the least recently rendered files are removed"""
+        with override_settings(
+            CERTIFICATES={'CACHE_DIR': self.cache_dir, 'MAX_FILES': 1}
+        ):
+            self.client.get(self.url, {'type': 'pdf'})
+            self.client.get(self.url, {'type': 'png'})
+        [name] = os.listdir(self.cache_dir)
+        self.assertTrue(name.endswith('.png'))
+
+    def test_prerender_fills_the_cache(self):
+        out = StringIO()
+        call_command(
+            'prerender_certificates',
+            '--user',
+            'graduate',
+            '--format',
+            'png',
+            '--workers',
+            '1',
+            stdout=out,
+        )
+        self.assertIn('1 files rendered', out.getvalue())
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        with patch('quizzes.certificates.render_image') as render:
+            self.client.get(self.url, {'type': 'png'})
+        render.assert_not_called()
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        reset_metrics()
+        self.addCleanup(reset_metrics)
+        self.user = User.objects.create_user(
+            username="observer", password="pass12345"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_spans_and_token_usage(self):
+        with span('parse'):
+            pass
+        record_token_usage(
+            MagicMock(prompt_tokens=120, completion_tokens=80), 'gpt-test'
+        )
+        self.assertEqual(
+            registry.histogram_count(
+                'quiz_stage_duration_seconds', stage='parse'
+            ),
+            1,
+        )
+        self.assertEqual(
+            registry.counter_value(
+                'openai_tokens_total', model='gpt-test', kind='prompt'
+            ),
+            120,
+        )
+        self.assertEqual(
+            registry.counter_value(
+                'openai_tokens_total', model='gpt-test', kind='completion'
+            ),
+            80,
+        )
+
+    def test_middleware_records_route_latency_and_queries(self):
+        Quiz.objects.create_with_questions(
+            "Metrics", "easy", [{"text": "Q", "answer": "A"}]
+        )
+        self.client.get('/api/quizzes/')
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn(
+            'quiz_stage_duration_seconds_count{stage="db_insert"} 1', body
+        )
+        self.assertIn(
+            'http_requests_total{method="GET",route="api/quizzes/$",'
+            'status="200"} 1',
+            body,
+        )
+        self.assertIn(
+            'http_request_duration_seconds_bucket{method="GET",'
+            'route="api/quizzes/$",le="+Inf"} 1',
+            body,
+        )
+        self.assertGreater(
+            registry.counter_value(
+                'http_request_db_queries_total', route='api/quizzes/$'
+            ),
+            0,
+        )
+
+    async def test_queries_are_counted_under_asgi(self):
+        """ORM calls run in sync_to_async threads, not on the event loop"""
+        token = await sync_to_async(Token.objects.create)(user=self.user)
+        response = await AsyncClient().get(
+            '/api/quizzes/', headers={'Authorization': f'Token {token.key}'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            registry.counter_value(
+                'http_requests_total',
+                method='GET',
+                route='api/quizzes/$',
+                status=200,
+            ),
+            1,
+        )
+        self.assertGreater(
+            registry.counter_value(
+                'http_request_db_queries_total', route='api/quizzes/$'
+            ),
+            0,
+        )
+
+    def test_token_protects_endpoint(self):
+        with override_settings(QUIZ_METRICS={'TOKEN': 'scrape-secret'}):
+            reset_metrics()
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            response = self.client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret'
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def test_without_token_only_loopback_may_read(self):
+        self.assertEqual(
+            self.client.get('/metrics', REMOTE_ADDR='::1').status_code, 200
+        )
+        self.assertEqual(
+            self.client.get('/metrics', REMOTE_ADDR='172.18.0.3').status_code,
+            403,
+        )
+
+    def test_disabled_records_nothing(self):
+        with override_settings(QUIZ_METRICS={'ENABLED': False}):
+            reset_metrics()
+            self.assertIs(span('parse'), span('grade'))
+            grade_quiz(["a"], ["a"])
+            self.client.get('/api/quizzes/')
+            self.assertEqual(self.client.get('/metrics').content, b'\n')
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.user = User.objects.create_user(
+            username="profiled", password="pass12345"
+        )
+        Quiz.objects.create_with_questions(
+            "Profiling", "easy", [{"text": "Q", "answer": "A"}]
+        )
+
+    def profiling(self, **config):
+        override = override_settings(
+            QUIZ_PROFILING=dict(
+                {'ENABLED': True, 'DIR': self.directory}, **config
+            )
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client
+
+    def test_signed_header_captures_stacks_and_queries(self):
+        client = self.profiling()
+        self.assertNotIn('X-Profile-Id', client.get('/api/quizzes/'))
+        self.assertNotIn(
+            'X-Profile-Id',
+            client.get('/api/quizzes/', HTTP_X_DEBUG_PROFILE='forged'),
+        )
+
+        response = client.get(
+            '/api/quizzes/', HTTP_X_DEBUG_PROFILE=make_token()
+        )
+        record = load_profile(self.directory, response['X-Profile-Id'])
+        self.assertEqual(
+            (record['path'], record['status'], record['trigger']),
+            ('/api/quizzes/', 200, 'header'),
+        )
+        self.assertEqual(record['query_count'], len(record['queries']))
+        self.assertIn('quizzes_quiz', record['queries'][0]['sql'])
+        self.assertIn('cumulative', record['report'])
+
+    async def test_async_requests_are_profiled_without_leaving_asgi(self):
+        """
+        The middleware stays async, and ORM queries on sync threads are
+        recorded
+        """
+        self.profiling()
+        token = await sync_to_async(Token.objects.create)(user=self.user)
+        handler = ProfilingMiddleware(AsyncMock())
+        self.assertTrue(iscoroutinefunction(handler))
+
+        response = await AsyncClient().get('/api/quizzes/', headers={
+            'Authorization': f'Token {token.key}',
+            'X-Debug-Profile': make_token(),
+        })
+        record = load_profile(self.directory, response['X-Profile-Id'])
+        self.assertEqual(
+            (record['path'], record['status']), ('/api/quizzes/', 200)
+        )
+        self.assertGreater(record['query_count'], 0)
+        self.assertIn(
+            'quizzes_quiz', ' '.join(q['sql'] for q in record['queries'])
+        )
+
+    def test_sampled_profiles_are_bounded(self):
+        client = self.profiling(SAMPLE_RATE=1.0, MAX_PROFILES=2)
+        ids = [client.get('/api/quizzes/')['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(list_profiles(self.directory), sorted(ids)[1:])
+
+    def test_profiles_command(self):
+        client = self.profiling()
+        profile_id = client.get(
+            '/api/history/', HTTP_X_DEBUG_PROFILE=make_token()
+        )['X-Profile-Id']
+        out = StringIO()
+        call_command('profiles', 'list', stdout=out)
+        self.assertIn(profile_id, out.getvalue())
+        out = StringIO()
+        call_command('profiles', 'show', 'latest', stdout=out)
+        self.assertIn('quizzes_userquizhistory', out.getvalue())
+        output = os.path.join(self.directory, 'dump.prof')
+        call_command(
+            'profiles',
+            'dump',
+            profile_id,
+            '--output',
+            output,
+            stdout=StringIO(),
+        )
+        import pstats
+        self.assertTrue(pstats.Stats(output).total_calls)
+
+    def test_disabled_by_default(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertNotIn(
+            'X-Profile-Id',
+            client.get('/api/quizzes/', HTTP_X_DEBUG_PROFILE=make_token()),
+        )
+
+
+def completion(content):
+    return MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+
+
+class TolerantParsingTests(TestCase):
+    def setUp(self):
+        reset_question_cache()
+        reset_clients()
+        self.user = User.objects.create_user(
+            username="parser", password="pass12345"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_repairs_fences_and_trailing_commas(self):
+        content = (
+            '```json\n{"questions": [{"text": "Q1, [x]", "answer": "A",}, '
+            '{"text": "Q2", "answer": "B"},],}\n```'
+        )
+        questions, salvaged = extract_questions(content)
+        self.assertFalse(salvaged)
+        self.assertEqual([q['text'] for q in questions], ["Q1, [x]", "Q2"])
+        self.assertEqual(remove_trailing_commas('{"a": ",}"}'), '{"a": ",}"}')
+
+    def test_salvages_truncated_output_and_validates_items(self):
+        content = (
+            '{"questions": [{"text": " Q1 ", "answer": "A"}, {"text": "q1", '
+            '"answer": "dup"}, {"text": "", "answer": "empty"}, {"text": 5, '
+            '"answer": "number"}, {"text": "Q2", "answer": "B"}, {"text": '
+            '"Q3", "ans'
+        )
+        questions, salvaged = extract_questions(content)
+        self.assertTrue(salvaged)
+        self.assertEqual(
+            questions,
+            [{"text": "Q1", "answer": "A"}, {"text": "Q2", "answer": "B"}],
+        )
+
+    @patch('openai.OpenAI')
+    def test_only_missing_questions_are_requested_again(self, mock_openai):
+        """
+        A truncated response is topped up with a follow-up for the missing
+        count
+        """
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+        mock_client.chat.completions.create.side_effect = [
+            completion(
+                '{"questions": [{"text": "Q1", "answer": "A1"}, {"text": '
+                '"Q2", "answer": "A2"}, {"te'
+            ),
+            completion(
+                '{"questions": [{"text": "Q2", "answer": "A2"}, {"text": '
+                '"Q3", "answer": "A3"}]}'
+            ),
+        ]
+
+        questions = generate_quiz_questions("Topping", "easy", 3)
+
+        self.assertEqual([q['text'] for q in questions], ["Q1", "Q2", "Q3"])
+        follow_up = mock_client.chat.completions.create.call_args_list[
+            1
+        ].kwargs['messages'][1]['content']
+        self.assertTrue(
+            follow_up.startswith("Generate 1 easy questions about Topping")
+        )
+        self.assertIn("- Q1\n- Q2", follow_up)
+
+    @patch('openai.OpenAI')
+    def test_unusable_output_saves_no_quiz(self, mock_openai):
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+        mock_client.chat.completions.create.return_value = completion(
+            'Sorry, I cannot help with that.'
+        )
+
+        response = self.client.post(
+            '/api/generate/', {'subject': 'Nothing', 'difficulty': 'easy'}
+        )
+
+        self.assertEqual(response.status_code, 502)
+        self.assertFalse(Quiz.objects.filter(subject='Nothing').exists())
+
+    @patch('openai.OpenAI')
+    def test_failed_stream_removes_empty_quiz(self, mock_openai):
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+        mock_client.chat.completions.create.side_effect = Exception("API Error")
+
+        response = self.client.post(
+            '/api/generate/stream/',
+            {'subject': 'Broken', 'difficulty': 'easy'},
+            format='json',
+            HTTP_ACCEPT='text/event-stream',
+        )
+        body = read_body(response).decode()
+
+        self.assertIn('event: error', body)
+        self.assertFalse(Quiz.objects.filter(subject='Broken').exists())
+
+    def test_stream_failure_is_generic_and_removes_partial_quiz(self):
+        """
+        An unexpected error mid-stream leaks no details and leaves no
+        half-saved quiz
+        """
+        def questions(*args, **kwargs):
+            yield {'text': 'First?', 'answer': 'Yes'}
+            raise RuntimeError('connection to db-internal:5432 lost')
+
+        with patch('quizzes.views.stream_quiz_questions', questions):
+            response = self.client.post(
+                '/api/generate/stream/',
+                {'subject': 'Partial', 'difficulty': 'easy'},
+                format='json',
+                HTTP_ACCEPT='text/event-stream',
+            )
+            body = read_body(response).decode()
+
+        self.assertIn('event: question', body)
+        self.assertIn(json.dumps(GENERATION_FAILED), body)
+        self.assertNotIn('db-internal', body)
+        self.assertFalse(Quiz.objects.filter(subject='Partial').exists())
+        self.assertFalse(Question.objects.filter(text='First?').exists())
+
+    async def test_stream_is_sent_event_by_event_under_asgi(self):
+        """
+        Under ASGI the body is an async iterator, so events are not buffered
+        """
+        user = await sync_to_async(User.objects.create_user)(
+            username="asgi-streamer", password="pass12345"
+        )
+        token = await sync_to_async(Token.objects.create)(user=user)
+        questions = [{'text': f'Q{i}?', 'answer': f'A{i}'} for i in range(3)]
+        with patch(
+            'quizzes.views.stream_quiz_questions', return_value=iter(questions)
+        ):
+            response = await AsyncClient().post(
+                '/api/generate/stream/',
+                {'subject': 'Async', 'difficulty': 'easy'},
+                content_type='application/json',
+                headers={
+                    'Accept': 'text/event-stream',
+                    'Authorization': f'Token {token.key}',
+                },
+            )
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 5)  # quiz, three questions, done
+        quiz = await Quiz.objects.aget(subject='Async')
+        self.assertEqual(quiz.question_count, 3)
+
+
+class StubOpenAIMixin:
+    """
+    Route OpenAI calls to the stub server; tests set ``self.config``
+    (OPENAI_RESILIENCE) first.
+    """
+
+    def start_stub(self, **faults):
+        """
+        Run the fault-injecting stub server on a free port and route the
+        clients to it.
+        """
+        requests = []
+
+        class Handler(StubHandler):
+            delay = 0.0
+
+            def do_POST(self):
+                requests.append(self.path)
+                super().do_POST()
+
+        for name, value in faults.items():
+            setattr(Handler, name, value)
+        server = StubServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        override = override_settings(
+            OPENAI_API_KEY='test',
+            OPENAI_BASE_URL=f'http://127.0.0.1:{server.server_address[1]}/v1',
+            OPENAI_TIMEOUT=0.5,
+            OPENAI_RESILIENCE=self.config,
+            QUIZ_QUESTION_CACHE={'BACKEND': 'none'},
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        for reset in (reset_clients, reset_guard, reset_question_cache):
+            reset()
+            self.addCleanup(reset)
+        return requests
+
+
+class UpstreamGuardTests(StubOpenAIMixin, TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.config = dict(
+            get_guard_config(),
+            STATE_FILE=os.path.join(self.directory, 'guard.json'),
+            RETRY_BASE_DELAY=0,
+            RETRY_MAX_DELAY=0,
+            BREAKER_THRESHOLD=3,
+            BREAKER_RESET_TIMEOUT=60,
+        )
+
+    def guard(self, **config):
+        config = dict(self.config, **config)
+        return UpstreamGuard(config, SharedState(config['STATE_FILE']))
+
+    def test_token_bucket_is_shared_through_state_file(self):
+        first, second = self.guard(RATE_LIMIT=1, BURST=1), self.guard(
+            RATE_LIMIT=1, BURST=1
+        )
+        self.assertEqual(first.admit(True, now=100.0), 0)
+        self.assertAlmostEqual(second.admit(True, now=100.5), 0.5)
+        self.assertEqual(second.admit(True, now=101.0), 0)
+        slow = self.guard(RATE_LIMIT=0.01, BURST=1, RATE_LIMIT_MAX_WAIT=1,
+                          STATE_FILE=os.path.join(self.directory, 'slow.json'))
+        slow.call(lambda: None)
+        with self.assertRaises(RateLimited):
+            slow.call(lambda: None)
+
+    def test_unchanged_state_is_not_rewritten(self):
+        """A healthy call only reads the state file"""
+        guard = self.guard()
+        guard.call(lambda: None)
+        os.utime(self.config['STATE_FILE'], (0, 0))
+        self.assertEqual(guard.call(lambda: 'ok'), 'ok')
+        self.assertEqual(os.stat(self.config['STATE_FILE']).st_mtime, 0)
+        guard.record_failure()
+        self.assertNotEqual(os.stat(self.config['STATE_FILE']).st_mtime, 0)
+
+    def test_retry_budget_limits_retries(self):
+        guard = self.guard(
+            RETRY_BUDGET_MAX=1, RETRY_BUDGET_RATIO=0, BREAKER_THRESHOLD=100
+        )
+        calls = []
+
+        def failing():
+            calls.append(1)
+            raise openai.APIConnectionError(
+                request=httpx.Request('POST', 'http://stub')
+            )
+
+        with self.assertRaises(openai.APIConnectionError):
+            guard.call(failing)
+        self.assertEqual(len(calls), 2)  # One retry, then the budget is spent
+        with self.assertRaises(openai.APIConnectionError):
+            guard.call(failing)
+        self.assertEqual(len(calls), 3)
+
+    def test_half_open_probe_closes_circuit(self):
+        guard = self.guard()
+        for _ in range(3):
+            guard.record_failure(now=100.0)
+        with self.assertRaises(CircuitOpen):
+            guard.admit(True, now=120.0)
+        self.assertEqual(guard.admit(True, now=161.0), 0)  # The probe
+        with self.assertRaises(CircuitOpen):
+            guard.admit(True, now=161.5)  # Held off while the probe runs
+        guard.record_success()
+        self.assertEqual(guard.admit(True, now=162.0), 0)
+
+    def test_probe_with_non_retryable_error_releases_probe(self):
+        """
+        A 400/401 says nothing about upstream health; the next call probes at
+        once
+        """
+        guard = self.guard()
+        for _ in range(3):
+            guard.record_failure(now=time.time() - 61)
+        response = httpx.Response(
+            400, request=httpx.Request('POST', 'http://stub')
+        )
+
+        def bad_request():
+            raise openai.BadRequestError(
+                'bad request', response=response, body=None
+            )
+
+        with self.assertRaises(openai.BadRequestError):
+            guard.call(bad_request)
+        self.assertEqual(guard.call(lambda: 'probed'), 'probed')
+        with guard.state.update() as state:
+            self.assertEqual(
+                (state['open_until'], state['probe_until']), (0, 0)
+            )
+
+    def test_errors_while_reading_a_stream_count_as_failures(self):
+        guard = self.guard()
+
+        def broken_stream():
+            yield 'chunk'
+            raise openai.APIConnectionError(
+                request=httpx.Request('POST', 'http://stub')
+            )
+
+        for _ in range(3):
+            with self.assertRaises(openai.APIConnectionError):
+                list(guard.stream(broken_stream))
+        with self.assertRaises(CircuitOpen):
+            list(guard.stream(broken_stream))
+
+    def test_abandoned_stream_releases_probe(self):
+        guard = self.guard()
+        for _ in range(3):
+            guard.record_failure(now=time.time() - 61)
+        chunks = guard.stream(lambda: iter(['first', 'second']))
+        self.assertEqual(next(chunks), 'first')
+        with guard.state.update() as state:
+            self.assertGreater(state['probe_until'], 0)  # Not settled yet
+        chunks.close()
+        self.assertEqual(
+            list(guard.stream(lambda: iter(['probed']))), ['probed']
+        )
+        with guard.state.update() as state:
+            self.assertEqual(
+                (state['open_until'], state['probe_until']), (0, 0)
+            )
+
+    async def test_async_state_updates_run_off_the_event_loop(self):
+        guard = self.guard()
+        loop_thread = threading.get_ident()
+        threads = []
+        update = guard.state.update
+
+        def tracking_update():
+            threads.append(threading.get_ident())
+            return update()
+
+        async def upstream():
+            return 'ok'
+
+        with patch.object(guard.state, 'update', tracking_update):
+            self.assertEqual(await guard.acall(upstream), 'ok')
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+
+    def test_failing_upstream_opens_circuit_and_falls_back(self):
+        """
+        Against the stub returning 500s: retries, then fail fast to a saved
+        quiz
+        """
+        requests = self.start_stub(error_rate=1.0)
+        with self.assertRaises(QuizGenerationError):
+            generate_quiz_questions("Faults", "easy", 2)
+        self.assertEqual(
+            len(requests), 3
+        )  # First attempt and MAX_RETRIES retries
+
+        # BREAKER_THRESHOLD failures opened the circuit: no further upstream
+        # calls
+        with self.assertRaises(QuizGenerationError) as raised:
+            generate_quiz_questions("Faults", "easy", 2)
+        self.assertIsNotNone(raised.exception.retry_after)
+
+        Quiz.objects.create_with_questions(
+            "Faults", "easy", [{"text": "Saved?", "answer": "Yes"}] * 2
+        )
+        self.assertEqual(
+            generate_quiz_questions("faults", "easy", 2)[0]["text"], "Saved?"
+        )
+        self.assertEqual(len(requests), 3)
+
+        user = User.objects.create_user(
+            username="impatient", password="pass12345"
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(
+            '/api/generate/', {'subject': 'Elsewhere', 'difficulty': 'easy'}
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    def test_timeouts_and_truncation_against_stub(self):
+        requests = self.start_stub(hang_rate=1.0, hang=2.0)
+        with self.assertRaises(QuizGenerationError):
+            generate_quiz_questions("Slow", "easy", 2)
+        self.assertEqual(len(requests), 3)
+
+        self.config['STATE_FILE'] = os.path.join(
+            self.directory, 'healthy.json'
+        )
+        requests = self.start_stub(truncate_rate=1.0)
+        questions = generate_quiz_questions("Cut", "easy", 4)
+        # Each truncated reply still yields complete questions; the rest are
+        # requested again
+        self.assertTrue(questions)
+        self.assertGreater(len(requests), 1)
+
+
+class BatchGenerationTests(StubOpenAIMixin, TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.config = dict(
+            get_guard_config(),
+            STATE_FILE=os.path.join(self.directory, 'guard.json'),
+            MAX_RETRIES=0,
+            BREAKER_THRESHOLD=100,
+        )
+        self.manifest = os.path.join(self.directory, 'course.csv')
+        with open(self.manifest, 'w') as handle:
+            handle.write(
+                'subject,difficulty,num_questions\n'
+                'Algebra,easy,2\nGeometry,easy,2\n'
+                'Calculus,easy,2\nalgebra,easy,2\nStatistics,hard,3\n'
+            )
+
+    def manifest_content(self):
+        with open(self.manifest) as handle:
+            return handle.read()
+
+    def test_parse_manifest(self):
+        """
+        CSV and JSON manifests expand 'all', drop repeats and report bad rows
+        by number
+        """
+        items = parse_manifest(
+            'Subject,Difficulty\nHistory,all\nhistory,easy\nArt,\n'
+        )
+        self.assertEqual(
+            items,
+            [
+                BatchItem('History', 'easy', 10),
+                BatchItem('History', 'medium', 10),
+                BatchItem('History', 'hard', 10),
+                BatchItem('Art', 'medium', 10),
+            ],
+        )
+        items = parse_manifest(
+            b'{"quizzes": ["Art", {"subject": "Music", "num_questions": 3}]}'
+        )
+        self.assertEqual(
+            items,
+            [BatchItem('Art', 'medium', 10), BatchItem('Music', 'medium', 3)],
+        )
+
+        with self.assertRaises(ManifestError) as raised:
+            parse_manifest(
+                '[{"subject": ""}, {"subject": "Art", "difficulty": '
+                '"extreme"}, {"subject": "Art", "num_questions": 500}]'
+            )
+        self.assertEqual(
+            [error.split(':')[0] for error in raised.exception.errors],
+            ['Row 1', 'Row 2', 'Row 3'],
+        )
+        with self.assertRaises(ManifestError):
+            parse_manifest('topic\nArt\n')
+        with self.assertRaises(ManifestError):
+            parse_manifest('subject,difficulty\nArt,all\n', max_items=2)
+
+        packs = make_packs(parse_manifest(self.manifest_content()), 2)
+        self.assertEqual(
+            [[item.subject for item in pack] for pack in packs],
+            [['Algebra', 'Geometry'], ['Calculus'], ['Statistics']],
+        )
+
+    def test_extract_question_sets(self):
+        """
+        Sets are matched by subject name, then by position; a broken document
+        yields empty sets
+        """
+        content = json.dumps(
+            {
+                'quizzes': [
+                    {
+                        'subject': 'geometry',
+                        'questions': [
+                            {'text': 'Angles in a triangle?', 'answer': '180'}
+                        ],
+                    },
+                    {
+                        'subject': 'Algebra I',
+                        'questions': [{'text': 'x + 1 = 2?', 'answer': '1'}],
+                    },
+                ]
+            }
+        )
+        sets = extract_question_sets(
+            content, ['Algebra', 'Geometry', 'Calculus']
+        )
+        self.assertEqual([len(questions) for questions in sets], [0, 1, 0])
+        self.assertEqual(sets[1][0]['answer'], '180')
+        # 'Algebra I' sits at position 1, which Geometry claimed by name
+        sets = extract_question_sets(content, ['Algebra', 'Calculus'])
+        self.assertEqual(sets[1][0]['text'], 'x + 1 = 2?')
+        self.assertEqual(
+            extract_question_sets(content[:40], ['Geometry']), [[]]
+        )
+
+    def test_generate_quizzes_packs_subjects(self):
+        """
+        Subjects sharing a difficulty and size go in one request; quizzes are
+        saved in bulk
+        """
+        requests = self.start_stub()
+        out = StringIO()
+        call_command(
+            'generate_quizzes', self.manifest, '--concurrency', '2', stdout=out
+        )
+
+        self.assertEqual(
+            len(requests), 2
+        )  # Algebra, Geometry and Calculus packed; Statistics alone
+        quizzes = Quiz.objects.order_by('subject')
+        self.assertEqual(
+            [
+                (quiz.subject, quiz.difficulty, quiz.question_count)
+                for quiz in quizzes
+            ],
+            [
+                ('Algebra', 'easy', 2),
+                ('Calculus', 'easy', 2),
+                ('Geometry', 'easy', 2),
+                ('Statistics', 'hard', 3),
+            ],
+        )
+        self.assertEqual(
+            get_answer_key(quizzes[0].id), ['Stub answer 1', 'Stub answer 2']
+        )
+        self.assertEqual(
+            quizzes[0].questions.first().text, 'Stub question 1 about Algebra?'
+        )
+        self.assertIn('All 4 quizzes generated', out.getvalue())
+        self.assertFalse(os.path.exists(f'{self.manifest}.state.json'))
+
+    def test_generate_quizzes_resumes_and_retries_failures(self):
+        """
+        Failed quizzes stay in the state file and a rerun generates only those
+        """
+        self.start_stub(error_rate=1.0)
+        with self.assertRaises(CommandError):
+            call_command(
+                'generate_quizzes',
+                self.manifest,
+                stdout=StringIO(),
+                stderr=StringIO(),
+            )
+        with open(f'{self.manifest}.state.json') as handle:
+            state = json.load(handle)
+        self.assertEqual((len(state['done']), len(state['failed'])), (0, 4))
+        self.assertFalse(Quiz.objects.exists())
+
+        # Pretend an earlier run already generated Statistics
+        saved = Quiz.objects.create_with_questions(
+            'Statistics', 'hard', [{'text': 'Mean?', 'answer': 'Average'}]
+        )
+        state['done'][BatchItem('Statistics', 'hard', 3).key] = saved.id
+        with open(f'{self.manifest}.state.json', 'w') as handle:
+            json.dump(state, handle)
+
+        requests = self.start_stub()
+        out = StringIO()
+        call_command('generate_quizzes', self.manifest, stdout=out)
+        self.assertIn(
+            '4 quizzes in manifest, 1 already generated', out.getvalue()
+        )
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(Quiz.objects.count(), 4)
+        self.assertFalse(os.path.exists(f'{self.manifest}.state.json'))
+
+    def test_batch_endpoint_queues_jobs(self):
+        """
+        Staff can queue a manifest; repeating it reuses the jobs in flight
+        """
+        client = APIClient()
+        client.force_authenticate(
+            User.objects.create_user(username="student", password="pass12345")
+        )
+        self.assertEqual(
+            client.post(
+                '/api/generate/batch/', ['Art'], format='json'
+            ).status_code,
+            403,
+        )
+
+        client.force_authenticate(
+            User.objects.create_user(
+                username="teacher", password="pass12345", is_staff=True
+            )
+        )
+        response = client.post(
+            '/api/generate/batch/',
+            {'quizzes': [{'subject': 'Art', 'difficulty': 'all'}]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(
+            (response.data['queued'], response.data['in_flight']), (3, 0)
+        )
+        self.assertEqual(GenerationJob.objects.count(), 3)
+        job = response.data['jobs'][0]
+        self.assertTrue(
+            job['status_url'].endswith(f"/api/generate/jobs/{job['id']}/")
+        )
+
+        upload = SimpleUploadedFile(
+            'course.csv', b'subject,difficulty\nArt,hard\nMusic,hard\n'
+        )
+        response = client.post(
+            '/api/generate/batch/', {'manifest': upload}, format='multipart'
+        )
+        self.assertEqual(
+            (response.data['queued'], response.data['in_flight']), (1, 1)
+        )
+        self.assertEqual(GenerationJob.objects.count(), 4)
+
+        response = client.post(
+            '/api/generate/batch/',
+            [{'subject': 'Art', 'num_questions': 0}],
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data['errors']), 1)
@@ -9,9 +9,44 @@ router.register(r'history', views.QuizHistoryViewSet, basename='history')
 urlpatterns = [
     path('', include(router.urls)),
     path('generate/', views.GenerateQuizView.as_view(), name='generate-quiz'),
-    path('submit/<int:quiz_id>/', views.SubmitQuizView.as_view(), name='submit-quiz'),
+    path(
+        'generate/batch/',
+        views.GenerateQuizBatchView.as_view(),
+        name='generate-quiz-batch',
+    ),
+    path(
+        'generate/jobs/<int:job_id>/',
+        views.GenerationJobView.as_view(),
+        name='generation-job',
+    ),
+    path(
+        'generate/stream/',
+        views.GenerateQuizStreamView.as_view(),
+        name='generate-quiz-stream',
+    ),
+    path(
+        'generate/async/',
+        views.AsyncGenerateQuizView.as_view(),
+        name='generate-quiz-async',
+    ),
+    path(
+        'submit/<int:quiz_id>/',
+        views.SubmitQuizView.as_view(),
+        name='submit-quiz',
+    ),
     path('register/', views.RegisterView.as_view(), name='register'),
-    path('token-auth/', views.CustomAuthToken.as_view(), name='api_token_auth'),
-    path('certificates/', views.QuizHistoryViewSet.as_view({'get': 'list'}), name='certificates-list'),
-    path('certificates/download/<int:history_id>/', views.DownloadCertificateView.as_view(), name='download-certificate'),
-] 
\ No newline at end of file
+    path(
+        'token-auth/', views.CustomAuthToken.as_view(), name='api_token_auth'
+    ),
+    path('logout/', views.LogoutView.as_view(), name='logout'),
+    path(
+        'certificates/',
+        views.QuizHistoryViewSet.as_view({'get': 'list'}),
+        name='certificates-list',
+    ),
+    path(
+        'certificates/download/<int:history_id>/',
+        views.DownloadCertificateView.as_view(),
+        name='download-certificate',
+    ),
+]
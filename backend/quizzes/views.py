@@ -5,87 +5,451 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.contrib.auth.models import User
 from rest_framework.authtoken.models import Token
-from django.contrib.auth import authenticate
-from .models import Quiz, Question, UserQuizHistory
+from django.contrib.auth.hashers import make_password, verify_password
+from .models import GenerationJob, Quiz, Question, UserQuizHistory
 from .serializers import (
+    GenerationJobSerializer,
+    QuizListSerializer,
     QuizSerializer, 
     QuestionSerializer, 
+    UserQuizHistoryListSerializer,
     UserQuizHistorySerializer,
     QuizCreateSerializer,
     UserSerializer
 )
-from .quiz_service import generate_quiz_questions, grade_quiz
+from .quiz_service import (
+    QuizGenerationError,
+    agenerate_quiz_questions,
+    generate_quiz_questions,
+    grade_quiz,
+    stream_quiz_questions,
+)
+from .renderers import EventStreamRenderer, format_event
+from .pagination import HistoryCursorPagination, QuizCursorPagination
+from .question_pool import take_questions
+from .jobs import enqueue_generation, enqueue_generations, get_job_config
+from .batch_generation import ManifestError, manifest_items, parse_manifest
+from .answer_keys import get_answer_key
+from .metrics import span
 import json
-from django.http import HttpResponse
+import logging
+import math
+import os
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import patch_cache_control
+from django.utils.http import quote_etag
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from .authentication import CachedTokenAuthentication
+from .certificates import (
+    FORMATS,
+    cache_name,
+    certificate_context,
+    get_certificate_config,
+    render_to_cache,
+    template_version,
+)
+from .hashing_pool import HashingBusy, run_hashing
+from .http_caching import (
+    history_etag,
+    not_modified,
+    quiz_etag,
+    set_list_cache_headers,
+    set_quiz_cache_headers,
+)
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
 from datetime import datetime
 from django.db import models
+from django.db.models import Prefetch, prefetch_related_objects
+from django.db.models.functions import Lower
+
+logger = logging.getLogger(__name__)
 
 class QuizViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint that allows quizzes to be viewed.
+    
+    Listings are cursor-paginated and omit questions; the detail endpoint
+    returns the full quiz.
     """
     queryset = Quiz.objects.all().order_by('-created_at')
     serializer_class = QuizSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = QuizCursorPagination
+    
+    def get_queryset(self):
+        # Detail prefetches questions itself, after the conditional GET check
+        return self.queryset
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return QuizListSerializer
+        return QuizSerializer
+    
+    def retrieve(self, request, *args, **kwargs):
+        # Validate against the quiz row before loading or serializing its
+        # questions
+        quiz = self.get_object()
+        etag = quiz_etag(quiz)
+        response = not_modified(
+            request, etag, quiz.created_at if quiz.question_count else None
+        )
+        if response is None:
+            prefetch_related_objects(
+                [quiz],
+                Prefetch(
+                    'questions', queryset=Question.objects.order_by('id')
+                ),
+            )
+            with span('serialize'):
+                response = Response(self.get_serializer(quiz).data)
+        return set_quiz_cache_headers(response, quiz, etag)
 
 class QuizHistoryViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint that allows quiz history to be viewed.
+    
+    Listings are cursor-paginated with a slim quiz summary per row; the detail
+    endpoint embeds the full quiz and user.
     """
     serializer_class = UserQuizHistorySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = HistoryCursorPagination
     
     def get_queryset(self):
         queryset = UserQuizHistory.objects.filter(user=self.request.user).order_by('-completed_at')
         
+        if self.action != 'list':
+            return queryset.select_related('quiz', 'user').prefetch_related(
+                Prefetch(
+                    'quiz__questions', queryset=Question.objects.order_by('id')
+                )
+            )
+        
+        # Stored answers are only needed for re-grading
+        queryset = queryset.select_related('quiz').defer('answers')
+        
         # If accessed through certificates endpoint, only return entries with certificates
-        if self.action == 'list' and 'certificates' in self.request.path:
-            # Get all quiz histories
-            histories = queryset.select_related('quiz').prefetch_related('quiz__questions')
-            
-            # Filter for certificates (score >= 80%)
-            certificate_histories = []
-            for history in histories:
-                total_questions = history.quiz.questions.count()
-                if total_questions > 0:
-                    score_percentage = (history.score / total_questions) * 100
-                    if score_percentage >= 80:
-                        certificate_histories.append(history.id)
-            
-            return queryset.filter(id__in=certificate_histories)
+        if 'certificates' in self.request.path:
+            return queryset.filter(has_certificate=True)
         
         return queryset
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return UserQuizHistoryListSerializer
+        return UserQuizHistorySerializer
+    
+    def list(self, request, *args, **kwargs):
+        # Answer revalidations from one aggregate query, without fetching or
+        # serializing the page
+        etag = history_etag(request, self.filter_queryset(self.get_queryset()))
+        response = not_modified(request, etag)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        return set_list_cache_headers(response, etag)
+
+# Details are logged by quiz_service; clients only learn that generation failed
+GENERATION_FAILED = {'error': 'Quiz generation failed, please try again'}
+
+
+def generation_failed_response(exc, response_class=Response):
+    """
+    502, or 503 with Retry-After when OpenAI was not called because it is
+    unavailable.
+    """
+    if exc.retry_after is None:
+        return response_class(
+            GENERATION_FAILED, status=status.HTTP_502_BAD_GATEWAY
+        )
+    response = response_class(
+        {'error': 'Quiz generation is temporarily unavailable, please retry'},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+    response['Retry-After'] = str(math.ceil(exc.retry_after))
+    return response
 
 class GenerateQuizView(APIView):
     """
     API endpoint to generate a new quiz.
+    
+    With ``async=true`` (query string or body) the generation is queued and
+    the response is 202 with a job to poll at ``/api/generate/jobs/<id>/``.
     """
     permission_classes = [permissions.IsAuthenticated]
     
     def post(self, request):
         serializer = QuizCreateSerializer(data=request.data)
-        if serializer.is_valid():
-            # Create the quiz
-            quiz = serializer.save()
-            
-            # Generate questions
-            questions_data = generate_quiz_questions(
-                quiz.subject, 
-                quiz.difficulty
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
             )
-            
-            # Save the questions
-            for question_data in questions_data:
-                Question.objects.create(
+        subject = serializer.validated_data['subject']
+        difficulty = serializer.validated_data.get('difficulty', 'medium')
+        
+        if self.wants_async(request):
+            job, _ = enqueue_generation(subject, difficulty, user=request.user)
+            data = GenerationJobSerializer(job).data
+            data['status_url'] = request.build_absolute_uri(
+                f'/api/generate/jobs/{job.id}/'
+            )
+            return Response(data, status=status.HTTP_202_ACCEPTED)
+        
+        # Serve from the pre-generated pool when possible, otherwise generate
+        questions_data = take_questions(subject, difficulty, request.user)
+        if questions_data is None:
+            try:
+                questions_data = generate_quiz_questions(subject, difficulty)
+            except QuizGenerationError as e:
+                return generation_failed_response(e)
+        
+        # Save the quiz and its questions in one transaction
+        quiz = Quiz.objects.create_with_questions(
+            subject, difficulty, questions_data
+        )
+        
+        # Return the full quiz with questions
+        with span('serialize'):
+            data = QuizSerializer(quiz).data
+        return Response(data, status=status.HTTP_201_CREATED)
+    
+    @staticmethod
+    def wants_async(request):
+        value = request.query_params.get(
+            'async', request.data.get('async', False)
+        )
+        return str(value).lower() in ('1', 'true', 'yes')
+
+class GenerationJobView(APIView):
+    """
+    API endpoint to poll the status of a queued quiz generation.
+    
+    Users only see their own jobs; any other id is a 404.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, job_id):
+        try:
+            job = GenerationJob.objects.get(pk=job_id, user=request.user)
+        except GenerationJob.DoesNotExist:
+            return Response(
+                {'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(GenerationJobSerializer(job).data)
+
+class GenerateQuizBatchView(APIView):
+    """
+    API endpoint to queue the generation of many quizzes from a manifest.
+    
+    Accepts a JSON body (a list of ``{subject, difficulty, num_questions}``
+    objects or ``{"quizzes": [...]}``) or a CSV/JSON file uploaded as
+    ``manifest`` (see batch_generation.py). Every quiz becomes a generation
+    job; the response is 202 with the jobs to poll. Staff only, since one
+    call can cost hundreds of OpenAI requests.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    
+    def post(self, request):
+        max_items = get_job_config()['MAX_BATCH_ITEMS']
+        upload = request.FILES.get('manifest')
+        try:
+            if upload is not None:
+                # Guessed from the content when the extension does not say
+                fmt = next(
+                    (
+                        ext
+                        for ext in ('csv', 'json')
+                        if upload.name.lower().endswith(f'.{ext}')
+                    ),
+                    None,
+                )
+                items = parse_manifest(upload.read(), fmt, max_items=max_items)
+            else:
+                items = manifest_items(request.data, max_items=max_items)
+        except ManifestError as e:
+            return Response(
+                {'errors': e.errors}, status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        jobs = enqueue_generations(items, user=request.user)
+        data = GenerationJobSerializer(
+            [job for job, _ in jobs], many=True
+        ).data
+        for job_data in data:
+            job_data['status_url'] = request.build_absolute_uri(
+                f"/api/generate/jobs/{job_data['id']}/"
+            )
+        queued = sum(created for _, created in jobs)
+        return Response(
+            {'queued': queued, 'in_flight': len(jobs) - queued, 'jobs': data},
+            status=status.HTTP_202_ACCEPTED
+        )
+
+class GenerateQuizStreamView(APIView):
+    """
+    API endpoint to generate a new quiz, streamed as Server-Sent Events.
+    
+    Emits a ``quiz`` event once the quiz exists, one ``question`` event per
+    question as soon as it has been parsed from the model output and saved,
+    then ``done``. Failures after the stream has started are reported as a
+    generic ``error`` event and the unfinished quiz is deleted, as it is when
+    the client disconnects.
+    
+    The body is an async generator, so under ASGI each event is sent as soon
+    as it is produced; the blocking OpenAI stream and ORM calls run in the
+    request's sync thread. (Django would buffer a sync iterator in full
+    under ASGI. WSGI servers such as runserver buffer this one instead.)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+    
+    def post(self, request):
+        serializer = QuizCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        quiz = serializer.save()
+        pooled = take_questions(quiz.subject, quiz.difficulty, request.user)
+        questions = (
+            pooled
+            if pooled is not None
+            else stream_quiz_questions(quiz.subject, quiz.difficulty)
+        )
+        
+        response = StreamingHttpResponse(
+            self.events(quiz, questions),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    async def events(self, quiz, questions):
+        yield format_event('quiz', {
+            'id': quiz.id,
+            'subject': quiz.subject,
+            'difficulty': quiz.difficulty,
+            'created_at': quiz.created_at,
+        })
+        questions = iter(questions)
+        # next() with a default: StopIteration cannot cross sync_to_async
+        next_question = sync_to_async(next)
+        create_question = sync_to_async(Question.objects.create)
+        count = 0
+        completed = False
+        try:
+            while (
+                question_data := await next_question(questions, None)
+            ) is not None:
+                question = await create_question(
                     quiz=quiz,
                     text=question_data['text'],
                     answer=question_data['answer']
                 )
-            
-            # Return the full quiz with questions
-            return Response(QuizSerializer(quiz).data, status=status.HTTP_201_CREATED)
+                count += 1
+                yield format_event(
+                    'question', QuestionSerializer(question).data
+                )
+            completed = True
+        except Exception as e:
+            # Details stay in the logs; clients only learn that generation
+            # failed
+            if not isinstance(e, QuizGenerationError):
+                logger.exception(
+                    "Streaming quiz %s failed after %d questions",
+                    quiz.pk,
+                    count,
+                )
+            yield format_event('error', GENERATION_FAILED)
+        finally:
+            if completed:
+                await sync_to_async(Quiz.objects.filter(pk=quiz.pk).update)(
+                    question_count=count
+                )
+            else:
+                # Failed or abandoned by the client: do not leave a partial
+                # quiz behind
+                await sync_to_async(Quiz.objects.filter(pk=quiz.pk).delete)()
+        if completed:
+            yield format_event('done', {'id': quiz.id, 'total': count})
+
+def serialize_quiz(quiz):
+    with span('serialize'):
+        return QuizSerializer(quiz).data
+
+class AsyncGenerateQuizView(View):
+    """
+    Async API endpoint to generate a new quiz.
+    
+    Under ASGI (quizz_project/asgi.py) the OpenAI round trip is awaited on the
+    event loop instead of pinning a worker for its full latency. Only token
+    authentication is supported.
+    """
+    
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+    
+    async def post(self, request):
+        try:
+            auth = await sync_to_async(
+                CachedTokenAuthentication().authenticate
+            )(request)
+        except AuthenticationFailed as e:
+            return JsonResponse(
+                {'detail': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED
+            )
+        if auth is None:
+            return JsonResponse(
+                {'detail': 'Authentication credentials were not provided.'},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+        user = auth[0]
+        
+        try:
+            data = json.loads(request.body or b'{}')
+        except json.JSONDecodeError:
+            return JsonResponse(
+                {'error': 'Invalid JSON body'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer = QuizCreateSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        subject = serializer.validated_data['subject']
+        difficulty = serializer.validated_data.get('difficulty', 'medium')
+        
+        questions_data = await sync_to_async(take_questions)(
+            subject, difficulty, user
+        )
+        if questions_data is None:
+            try:
+                questions_data = await agenerate_quiz_questions(
+                    subject, difficulty
+                )
+            except QuizGenerationError as e:
+                return generation_failed_response(e, JsonResponse)
+        
+        quiz = await sync_to_async(Quiz.objects.create_with_questions)(
+            subject, difficulty, questions_data
+        )
+        
+        data = await sync_to_async(serialize_quiz)(quiz)
+        return JsonResponse(data, status=status.HTTP_201_CREATED)
 
 class SubmitQuizView(APIView):
     """
@@ -95,38 +459,81 @@ class SubmitQuizView(APIView):
     
     def post(self, request, quiz_id):
         try:
-            # Get the quiz
-            quiz = Quiz.objects.get(pk=quiz_id)
+            # Answer key in question order; cached, so a warm submit only
+            # writes
+            correct_answers = get_answer_key(quiz_id)
+            if correct_answers is None:
+                return Response(
+                    {'error': 'Quiz not found'},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
             
             # Get user answers from request
             user_answers = request.data.get('answers', [])
             
-            # Get correct answers from the database
-            questions = Question.objects.filter(quiz=quiz)
-            correct_answers = [question.answer for question in questions]
-            
             # Grade the quiz
-            score = grade_quiz(user_answers, correct_answers)
+            grade = grade_quiz(user_answers, correct_answers)
             
             # Save the quiz result
-            history = UserQuizHistory.objects.create(
+            history = UserQuizHistory(
                 user=request.user,
-                quiz=quiz,
-                score=score
+                quiz_id=quiz_id,
+                answers=[
+                    '' if answer is None else str(answer)
+                    for answer in user_answers
+                ],
             )
+            history.set_score(grade.score, grade.total)
+            history.save()
             
             # Return the result
-            return Response({
-                'score': score,
-                'total': len(correct_answers),
-                'history_id': history.id
-            }, status=status.HTTP_200_OK)
+            return Response(
+                {
+                    'score': grade.score,
+                    'total': grade.total,
+                    'history_id': history.id,
+                    'results': [
+                        {
+                            'correct': result.correct,
+                            'similarity': result.similarity,
+                            'method': result.method,
+                        }
+                        for result in grade.results
+                    ],
+                },
+                status=status.HTTP_200_OK,
+            )
             
-        except Quiz.DoesNotExist:
-            return Response({'error': 'Quiz not found'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+def normalize_email(email):
+    """Emails are stored and matched lower-cased."""
+    return str(email).strip().lower() if email else email
+
+def users_by_email(email):
+    """Case-insensitive lookup served by the LOWER(email) index."""
+    return User.objects.annotate(email_lower=Lower('email')).filter(
+        email_lower=email
+    )
+
+def hashing_busy_response(exc):
+    """503 telling clients to back off while the hashing pool is saturated."""
+    return Response({'error': 'Too many logins right now, please retry'},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': str(exc.retry_after)})
+
+def rehash_password(user, password):
+    """
+    Upgrade a hash made with an older algorithm or cost; skipped when the pool
+    is busy.
+    """
+    try:
+        user.password = run_hashing(make_password, password)
+    except HashingBusy:
+        return
+    user.save(update_fields=['password'])
+
 class RegisterView(APIView):
     """
     API endpoint for user registration.
@@ -135,25 +542,27 @@ class RegisterView(APIView):
     
     def post(self, request):
         try:
-            email = request.data.get('email')
+            email = normalize_email(request.data.get('email'))
             password = request.data.get('password')
             
             if not email or not password:
                 return Response({'error': 'Missing required fields'}, status=status.HTTP_400_BAD_REQUEST)
             
             # Check if email already exists
-            if User.objects.filter(email=email).exists():
+            if users_by_email(email).exists():
                 return Response({'error': 'Email already in use'}, status=status.HTTP_400_BAD_REQUEST)
             
             # Create username from email (before the @ symbol)
             username = email.split('@')[0]
             
-            # Create new user
-            user = User.objects.create_user(
-                username=username,
+            # Create new user; the password is hashed on the bounded hashing
+            # pool
+            user = User(
+                username=User.normalize_username(username),
                 email=email,
-                password=password
+                password=run_hashing(make_password, password)
             )
+            user.save()
             
             # Create token for the user
             token = Token.objects.create(user=user)
@@ -167,6 +576,8 @@ class RegisterView(APIView):
                 }
             }, status=status.HTTP_201_CREATED)
             
+        except HashingBusy as e:
+            return hashing_busy_response(e)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -177,7 +588,7 @@ class CustomAuthToken(APIView):
     permission_classes = [permissions.AllowAny]
     
     def post(self, request):
-        email = request.data.get('email')
+        email = normalize_email(request.data.get('email'))
         password = request.data.get('password')
         
         if not email or not password:
@@ -186,12 +597,19 @@ class CustomAuthToken(APIView):
         
         try:
             # Find user by email
-            user = User.objects.get(email=email)
+            user = users_by_email(email).order_by('id').first()
+            if user is None:
+                raise User.DoesNotExist
             
-            # Authenticate user
-            user = authenticate(username=user.username, password=password)
+            # Check the password on the row already loaded instead of looking
+            # the user up again
+            is_correct, must_update = run_hashing(
+                verify_password, password, user.password
+            )
             
-            if user:
+            if user.is_active and is_correct:
+                if must_update:
+                    rehash_password(user, password)
                 # Get or create token
                 token, _ = Token.objects.get_or_create(user=user)
                 return Response({
@@ -208,10 +626,24 @@ class CustomAuthToken(APIView):
         except User.DoesNotExist:
             return Response({'error': 'No user found with this email'}, 
                           status=status.HTTP_404_NOT_FOUND)
+        except HashingBusy as e:
+            return hashing_busy_response(e)
         except Exception as e:
             return Response({'error': str(e)}, 
                           status=status.HTTP_400_BAD_REQUEST)
 
+class LogoutView(APIView):
+    """
+    API endpoint that revokes the caller's token.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request):
+        # Deleting the token also drops it from the token cache (see
+        # signals.py)
+        Token.objects.filter(user=request.user).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 class DownloadCertificateView(APIView):
     """
     API endpoint to download a certificate for a completed quiz.
@@ -220,44 +652,76 @@ class DownloadCertificateView(APIView):
     
     def get(self, request, history_id):
         try:
-            # Get the quiz history entry
-            history = UserQuizHistory.objects.get(
-                id=history_id,
-                user=request.user
-            )
-            
-            # Calculate score percentage
-            score_percentage = (history.score / history.quiz.questions.count()) * 100
+            # Get the quiz history entry The user's name is joined in: a cached
+            # request.user only has its id loaded
+            history = UserQuizHistory.objects.select_related(
+                'quiz', 'user'
+            ).get(id=history_id, user=request.user)
             
             # Only allow download if score is 80% or higher
-            if score_percentage < 80:
+            if not history.has_certificate:
                 return Response(
                     {'error': 'Certificate not available for scores below 80%'},
                     status=status.HTTP_403_FORBIDDEN
                 )
             
-            # Create certificate data
-            certificate_data = {
-                'user_name': request.user.username,
-                'quiz_subject': history.quiz.subject,
-                'score': score_percentage,
-                'date': history.completed_at.strftime('%Y-%m-%d'),
-                'certificate_id': f'CERT-{history.id:06d}'
-            }
-            
-            # Convert to JSON
-            certificate_json = json.dumps(certificate_data, indent=2)
+            fmt = request.query_params.get('type', 'pdf')
+            if fmt not in FORMATS and fmt != 'json':
+                return Response(
+                    {
+                        'error': f"Unknown certificate type '{fmt}', "
+                        'use pdf, png or json'
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
             
-            # Create response with certificate data
-            response = HttpResponse(
-                certificate_json,
-                content_type='application/json'
+            # Create certificate data
+            certificate_data = certificate_context(
+                history, history.user.username, history.quiz.subject
             )
+            subject = history.quiz.subject.lower().replace(' ', '_')
+            completed = history.completed_at.strftime('%Y%m%d')
+            filename = f'certificate_{subject}_{completed}.{fmt}'
             
-            # Set filename for download
-            filename = f'certificate_{history.quiz.subject.lower().replace(" ", "_")}_{history.completed_at.strftime("%Y%m%d")}.json'
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            if fmt == 'json':
+                response = HttpResponse(
+                    json.dumps(certificate_data, indent=2),
+                    content_type='application/json',
+                )
+                response['Content-Disposition'] = (
+                    f'attachment; filename="{filename}"'
+                )
+                return response
             
+            # The cache file name identifies the exact rendering, so it doubles
+            # as a strong ETag
+            config = get_certificate_config()
+            etag = quote_etag(
+                cache_name(certificate_data, fmt, template_version(config))
+            )
+            response = not_modified(request, etag)
+            if response is None:
+                path, _ = render_to_cache(certificate_data, fmt, config)
+                if config['ACCEL_REDIRECT_PREFIX']:
+                    # nginx sends the file itself
+                    response = HttpResponse(content_type=FORMATS[fmt][1])
+                    response['X-Accel-Redirect'] = config[
+                        'ACCEL_REDIRECT_PREFIX'
+                    ] + os.path.basename(path)
+                    response['Content-Disposition'] = (
+                        f'attachment; filename="{filename}"'
+                    )
+                else:
+                    # Served with the server's file wrapper (sendfile) where
+                    # available
+                    response = FileResponse(
+                        open(path, 'rb'),
+                        as_attachment=True,
+                        filename=filename,
+                        content_type=FORMATS[fmt][1],
+                    )
+            response['ETag'] = etag
+            patch_cache_control(response, private=True, no_cache=True)
             return response
             
         except UserQuizHistory.DoesNotExist:
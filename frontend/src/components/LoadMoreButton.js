@@ -0,0 +1,23 @@
+import React from 'react';
+import { Button } from 'react-bootstrap';
+
+// Shown under a paginated list while the API reports a `next` page.
+const LoadMoreButton = ({ hasMore, loading, onClick }) => {
+  if (!hasMore) return null;
+  return (
+    <div className="text-center mt-3">
+      <Button variant="outline-primary" onClick={onClick} disabled={loading}>
+        {loading ? (
+          <>
+            <span className="spinner-border spinner-border-sm me-2" role="status" aria-hidden="true"></span>
+            Loading...
+          </>
+        ) : (
+          'Load more'
+        )}
+      </Button>
+    </div>
+  );
+};
+
+export default LoadMoreButton;
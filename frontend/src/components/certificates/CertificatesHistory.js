@@ -1,33 +1,20 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState } from 'react';
 import { Container, Row, Col, Card, Button, Alert } from 'react-bootstrap';
 import { useNavigate } from 'react-router-dom';
 import { FaArrowLeft, FaAward, FaDownload, FaCalendarAlt, FaBook } from 'react-icons/fa';
 import { auth } from '../../firebase';
 import { fetchCertificates, downloadCertificate } from '../../services/api';
+import usePaginatedList from '../../services/usePaginatedList';
+import LoadMoreButton from '../LoadMoreButton';
 import './CertificatesHistory.css';
 
 const CertificatesHistory = () => {
-  const [certificates, setCertificates] = useState([]);
-  const [loading, setLoading] = useState(true);
-  const [error, setError] = useState('');
+  const {
+    items: certificates, hasMore, loading, loadingMore, loadMore, error, setError
+  } = usePaginatedList(fetchCertificates, 'Failed to load certificates');
   const [downloading, setDownloading] = useState(false);
   const navigate = useNavigate();
 
-  useEffect(() => {
-    const loadCertificates = async () => {
-      try {
-        const response = await fetchCertificates();
-        setCertificates(response.data);
-        setLoading(false);
-      } catch (error) {
-        setError('Failed to load certificates: ' + error.message);
-        setLoading(false);
-      }
-    };
-
-    loadCertificates();
-  }, []);
-
   const handleDownload = async (historyId) => {
     try {
       setDownloading(true);
@@ -35,8 +22,8 @@ const CertificatesHistory = () => {
       
       const response = await downloadCertificate(historyId);
       
-      // Create a blob from the response data
-      const blob = new Blob([response.data], { type: 'application/json' });
+      // Create a blob from the response data (a PDF by default)
+      const blob = new Blob([response.data], { type: response.headers['content-type'] || 'application/pdf' });
       
       // Create a URL for the blob
       const url = window.URL.createObjectURL(blob);
@@ -47,7 +34,7 @@ const CertificatesHistory = () => {
       
       // Get filename from the response headers
       const contentDisposition = response.headers['content-disposition'];
-      let filename = 'certificate.json';
+      let filename = 'certificate.pdf';
       if (contentDisposition) {
         const filenameMatch = contentDisposition.match(/filename="(.+)"/);
         if (filenameMatch) {
@@ -173,6 +160,8 @@ const CertificatesHistory = () => {
           ))}
         </Row>
       )}
+
+      <LoadMoreButton hasMore={hasMore} loading={loadingMore} onClick={loadMore} />
     </Container>
   );
 };
@@ -1,8 +1,10 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState } from 'react';
 import { Container, Row, Col, Card, Button } from 'react-bootstrap';
 import { useNavigate } from 'react-router-dom';
 import { auth } from '../../firebase';
-import { fetchQuizzes } from '../../services/api';
+import { fetchQuizzes, logoutUser } from '../../services/api';
+import usePaginatedList from '../../services/usePaginatedList';
+import LoadMoreButton from '../LoadMoreButton';
 import QuizGenerator from './QuizGenerator';
 import { 
   FaSignOutAlt, 
@@ -16,30 +18,17 @@ import {
 import './Dashboard.css';
 
 const Dashboard = () => {
-  const [quizzes, setQuizzes] = useState([]);
-  const [loading, setLoading] = useState(true);
-  const [error, setError] = useState('');
+  const {
+    items: quizzes, setItems: setQuizzes, hasMore, loading, loadingMore, loadMore, error, setError
+  } = usePaginatedList(fetchQuizzes, 'Failed to fetch quizzes');
   const [showGenerator, setShowGenerator] = useState(false);
   const navigate = useNavigate();
   
-  useEffect(() => {
-    const loadQuizzes = async () => {
-      try {
-        const response = await fetchQuizzes();
-        setQuizzes(response.data);
-        setLoading(false);
-      } catch (error) {
-        setError('Failed to fetch quizzes: ' + error.message);
-        setLoading(false);
-      }
-    };
-    
-    loadQuizzes();
-  }, []);
-  
   const handleLogout = async () => {
     try {
       await auth.signOut();
+      // Revoke the API token; the local copy is dropped even if this fails
+      await logoutUser().catch(() => {});
       localStorage.removeItem('token');
       navigate('/login');
     } catch (error) {
@@ -48,7 +37,7 @@ const Dashboard = () => {
   };
   
   const handleQuizCreated = (newQuiz) => {
-    setQuizzes([newQuiz, ...quizzes]);
+    setQuizzes((current) => [newQuiz, ...current]);
     setShowGenerator(false);
   };
 
@@ -182,6 +171,8 @@ const Dashboard = () => {
           ))}
         </Row>
       )}
+      
+      <LoadMoreButton hasMore={hasMore} loading={loadingMore} onClick={loadMore} />
     </Container>
   );
 };
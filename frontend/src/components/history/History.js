@@ -1,29 +1,16 @@
-import React, { useState, useEffect } from 'react';
+import React from 'react';
 import { Container, Card, ListGroup, Badge, Button } from 'react-bootstrap';
 import { useNavigate } from 'react-router-dom';
 import { fetchHistory } from '../../services/api';
+import usePaginatedList from '../../services/usePaginatedList';
+import LoadMoreButton from '../LoadMoreButton';
 
 const History = () => {
-  const [history, setHistory] = useState([]);
-  const [loading, setLoading] = useState(true);
-  const [error, setError] = useState('');
+  const {
+    items: history, hasMore, loading, loadingMore, loadMore, error
+  } = usePaginatedList(fetchHistory, 'Failed to fetch history');
   const navigate = useNavigate();
   
-  useEffect(() => {
-    const loadHistory = async () => {
-      try {
-        const response = await fetchHistory();
-        setHistory(response.data);
-        setLoading(false);
-      } catch (error) {
-        setError('Failed to fetch history: ' + error.message);
-        setLoading(false);
-      }
-    };
-    
-    loadHistory();
-  }, []);
-  
   const getScoreBadgeVariant = (score, total = 10) => {
     const percentage = (score / total) * 100;
     if (percentage >= 80) return 'success';
@@ -102,6 +89,8 @@ const History = () => {
               ))}
             </ListGroup>
           )}
+          
+          <LoadMoreButton hasMore={hasMore} loading={loadingMore} onClick={loadMore} />
         </Card.Body>
       </Card>
     </Container>
@@ -38,13 +38,80 @@ export const registerUser = (email, password) => {
   return axiosInstance.post('/register/', { email, password });
 };
 
+export const logoutUser = () => {
+  return axiosInstance.post('/logout/');
+};
+
 // Quiz API
 export const generateQuiz = (subject, difficulty) => {
   return axiosInstance.post('/generate/', { subject, difficulty });
 };
 
-export const fetchQuizzes = () => {
-  return axiosInstance.get('/quizzes/');
+// Streams a new quiz as Server-Sent Events. Handlers are called with the quiz
+// metadata, then once per question as it is generated, then on completion.
+// Returns a function that aborts the stream.
+export const streamQuiz = (subject, difficulty, { onQuiz, onQuestion, onDone, onError } = {}) => {
+  const controller = new AbortController();
+  const token = localStorage.getItem('token');
+
+  const dispatch = (rawEvent) => {
+    let event = 'message';
+    let data = '';
+    rawEvent.split('\n').forEach((line) => {
+      if (line.startsWith('event:')) {
+        event = line.slice(6).trim();
+      } else if (line.startsWith('data:')) {
+        data += line.slice(5).trim();
+      }
+    });
+    const payload = data ? JSON.parse(data) : null;
+    if (event === 'quiz' && onQuiz) onQuiz(payload);
+    if (event === 'question' && onQuestion) onQuestion(payload);
+    if (event === 'done' && onDone) onDone(payload);
+    if (event === 'error' && onError) onError(new Error(payload?.error || 'Quiz generation failed'));
+  };
+
+  const run = async () => {
+    const response = await fetch(`${API_URL}/generate/stream/`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Accept: 'text/event-stream',
+        ...(token ? { Authorization: `Token ${token}` } : {}),
+      },
+      body: JSON.stringify({ subject, difficulty }),
+      signal: controller.signal,
+    });
+    if (!response.ok) {
+      throw new Error(`Quiz generation failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        dispatch(buffer.slice(0, boundary));
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+      }
+    }
+  };
+
+  run().catch((error) => {
+    if (error.name !== 'AbortError' && onError) onError(error);
+  });
+  return () => controller.abort();
+};
+
+// List endpoints are cursor-paginated: responses look like
+// { next, previous, results }. Pass the `next` URL back to fetch more.
+export const fetchQuizzes = (cursorUrl) => {
+  return axiosInstance.get(cursorUrl || '/quizzes/');
 };
 
 export const fetchQuiz = (quizId) => {
@@ -55,12 +122,12 @@ export const submitQuiz = (quizId, answers) => {
   return axiosInstance.post(`/submit/${quizId}/`, { answers });
 };
 
-export const fetchHistory = () => {
-  return axiosInstance.get('/history/');
+export const fetchHistory = (cursorUrl) => {
+  return axiosInstance.get(cursorUrl || '/history/');
 };
 
-export const fetchCertificates = () => {
-  return axiosInstance.get('/certificates/');
+export const fetchCertificates = (cursorUrl) => {
+  return axiosInstance.get(cursorUrl || '/certificates/');
 };
 
 export const downloadCertificate = (historyId) => {
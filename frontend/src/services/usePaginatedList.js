@@ -0,0 +1,47 @@
+import { useState, useEffect, useCallback } from 'react';
+
+// Loads a cursor-paginated list endpoint (see api.js) one page at a time.
+// `fetchPage(cursorUrl)` fetches the first page when called without a cursor;
+// `loadMore` follows the `next` link and appends its results.
+const usePaginatedList = (fetchPage, errorMessage) => {
+  const [items, setItems] = useState([]);
+  const [next, setNext] = useState(null);
+  const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [error, setError] = useState('');
+
+  const load = useCallback(async (cursorUrl) => {
+    try {
+      const response = await fetchPage(cursorUrl);
+      const { results } = response.data;
+      setItems((current) => (cursorUrl ? [...current, ...results] : results));
+      setNext(response.data.next);
+    } catch (error) {
+      setError(`${errorMessage}: ${error.message}`);
+    }
+  }, [fetchPage, errorMessage]);
+
+  useEffect(() => {
+    load().finally(() => setLoading(false));
+  }, [load]);
+
+  const loadMore = async () => {
+    if (!next || loadingMore) return;
+    setLoadingMore(true);
+    await load(next);
+    setLoadingMore(false);
+  };
+
+  return {
+    items,
+    setItems,
+    hasMore: Boolean(next),
+    loading,
+    loadingMore,
+    loadMore,
+    error,
+    setError,
+  };
+};
+
+export default usePaginatedList;